@@ -0,0 +1,6 @@
+import os
+
+
+def pytest_configure():
+    # testes que importam models (core.ml.backtest_direcional) fazem django.setup()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
@@ -0,0 +1,153 @@
+"""
+Kernels vetorizados de indicadores técnicos (NumPy/pandas), compartilhados
+pelas rotinas de carga (A02), de recomendação (A03) e pelas features do
+modelo direcional.
+
+Todas as funções recebem Series alinhadas. Sem `por`, a série é tratada
+como um único ticker ordenado por data. Com `por` (Series com o ticker de
+cada linha), a entrada é um painel multi-ticker ordenado por ticker/data e
+o cálculo é feito em uma única passada agrupada, sem misturar tickers.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def _agrupado(resultado: pd.Series, index: pd.Index) -> pd.Series:
+    # groupby().rolling()/ewm() devolvem (grupo, índice original)
+    return resultado.droplevel(0).reindex(index)
+
+
+def defasar(series: pd.Series, periods: int = 1, *, por: Optional[pd.Series] = None) -> pd.Series:
+    """shift por ticker."""
+    if por is None:
+        return series.shift(periods)
+    return series.groupby(por, sort=False).shift(periods)
+
+
+def diferenca(series: pd.Series, *, por: Optional[pd.Series] = None) -> pd.Series:
+    """diff por ticker."""
+    if por is None:
+        return series.diff()
+    return series.groupby(por, sort=False).diff()
+
+
+def wilder_moving_average(
+    series: pd.Series,
+    period: int,
+    *,
+    semente: Optional[float] = None,
+    por: Optional[pd.Series] = None,
+) -> pd.Series:
+    """
+    Média de Welles Wilder (EWM com alpha=1/period, adjust=False).
+
+    `semente` é o valor da média no pregão imediatamente anterior ao primeiro
+    da série; permite continuar a recorrência a partir de um valor gravado.
+    """
+    alpha = 1 / period
+    if semente is not None:
+        serie = pd.concat([pd.Series([semente], dtype=float), series.astype(float)], ignore_index=True)
+        out = serie.ewm(alpha=alpha, adjust=False).mean().iloc[1:]
+        out.index = series.index
+        return out
+    if por is None:
+        return series.ewm(alpha=alpha, adjust=False).mean()
+    return _agrupado(series.groupby(por, sort=False).ewm(alpha=alpha, adjust=False).mean(), series.index)
+
+
+def calcular_rsi(series: pd.Series, period: int = 14, *, por: Optional[pd.Series] = None) -> pd.Series:
+    """RSI de Wilder. O primeiro pregão de cada ticker entra com ganho/perda zero."""
+    delta = diferenca(series, por=por)
+    ganho = delta.where(delta > 0, 0)
+    perda = -delta.where(delta < 0, 0)
+    media_ganho = wilder_moving_average(ganho, period, por=por)
+    media_perda = wilder_moving_average(perda, period, por=por)
+    rs = media_ganho / media_perda
+    return 100 - (100 / (1 + rs))
+
+
+def true_range(
+    maxima: pd.Series,
+    minima: pd.Series,
+    fechamento: pd.Series,
+    *,
+    por: Optional[pd.Series] = None,
+) -> pd.Series:
+    """max(máx - mín, |máx - fech. anterior|, |mín - fech. anterior|)."""
+    anterior = defasar(fechamento, 1, por=por)
+    tr1 = maxima - minima
+    tr2 = (maxima - anterior).abs()
+    tr3 = (minima - anterior).abs()
+    return pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+
+
+def calcular_atr(
+    maxima: pd.Series,
+    minima: pd.Series,
+    fechamento: pd.Series,
+    period: int = 14,
+    *,
+    semente: Optional[float] = None,
+    por: Optional[pd.Series] = None,
+) -> pd.Series:
+    """ATR: média de Wilder do true range."""
+    tr = true_range(maxima, minima, fechamento, por=por)
+    return wilder_moving_average(tr, period, semente=semente, por=por)
+
+
+def calcular_obv(
+    fechamento: pd.Series,
+    volume: pd.Series,
+    *,
+    inicial: float = 0,
+    por: Optional[pd.Series] = None,
+) -> pd.Series:
+    """
+    On-Balance Volume como soma acumulada de sign(Δfechamento) * volume.
+
+    O primeiro pregão de cada ticker vale `inicial`; fechamentos iguais ou
+    ausentes não mexem no acumulado.
+    """
+    passo = np.sign(diferenca(fechamento, por=por)).fillna(0) * volume
+    if por is None:
+        return passo.cumsum() + inicial
+    return passo.groupby(por, sort=False).cumsum() + inicial
+
+
+def _rolling(series: pd.Series, window: int, min_periods: Optional[int], por: Optional[pd.Series]):
+    if por is None:
+        return series.rolling(window, min_periods=min_periods)
+    return series.groupby(por, sort=False).rolling(window, min_periods=min_periods)
+
+
+def rolling_mean(series, window, *, min_periods=None, por=None) -> pd.Series:
+    out = _rolling(series, window, min_periods, por).mean()
+    return out if por is None else _agrupado(out, series.index)
+
+
+def rolling_std(series, window, *, min_periods=None, por=None) -> pd.Series:
+    out = _rolling(series, window, min_periods, por).std()
+    return out if por is None else _agrupado(out, series.index)
+
+
+def rolling_max(series, window, *, min_periods=None, por=None) -> pd.Series:
+    out = _rolling(series, window, min_periods, por).max()
+    return out if por is None else _agrupado(out, series.index)
+
+
+def rolling_min(series, window, *, min_periods=None, por=None) -> pd.Series:
+    out = _rolling(series, window, min_periods, por).min()
+    return out if por is None else _agrupado(out, series.index)
+
+
+def max_proximos(series: pd.Series, dias: int, *, por: Optional[pd.Series] = None) -> pd.Series:
+    """
+    Máximo de t-(dias-2) .. t+1, o `max_5dias` da tabela de cotações
+    (rolling sobre o fechamento adiantado um pregão).
+    """
+    return rolling_max(defasar(series, -1, por=por), dias, por=por)
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from core.ml.feature_store import VERSAO_FEATURES, atualizar_store, diretorio_store
+from core.models import Acao
+
+
+class Command(BaseCommand):
+    help = (
+        "Atualiza o feature store do modelo direcional (features + labels por ação), "
+        "acrescentando só as datas novas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tickers",
+            nargs="*",
+            default=None,
+            help="Tickers a atualizar (default: todo o universo).",
+        )
+        parser.add_argument(
+            "--reconstruir",
+            action="store_true",
+            help="Descarta o conteúdo gravado e recalcula desde o início do treino.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processos em paralelo (default: 1).",
+        )
+
+    def handle(self, *args, **options):
+        qs = Acao.objects.all()
+        if options["tickers"]:
+            qs = qs.filter(ticker__in=[t.strip().upper() for t in options["tickers"]])
+
+        self.stdout.write(f"Feature store {VERSAO_FEATURES} em {diretorio_store()}")
+        novas = atualizar_store(
+            qs.values_list("id", flat=True),
+            reconstruir=options["reconstruir"],
+            workers=options["workers"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(novas)} ações processadas, {sum(novas.values())} linhas novas."
+            )
+        )
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.scripts.A01CargaDiaria import backfill_cotacoes, get_dia_util
+
+
+class Command(BaseCommand):
+    help = "Detecta lacunas em cotacoes_cotacao e preenche o intervalo faltante de cada ação."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--inicio",
+            type=str,
+            default=None,
+            help="Data inicial (YYYY-MM-DD). Default: --dias antes de --fim.",
+        )
+        parser.add_argument(
+            "--fim",
+            type=str,
+            default=None,
+            help="Data final (YYYY-MM-DD). Default: último dia útil.",
+        )
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=30,
+            help="Tamanho da janela em dias corridos quando --inicio não é informado (default: 30)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Quantidade de tickers por download do yfinance (default: 50)",
+        )
+
+    def handle(self, *args, **options):
+        if options["fim"]:
+            data_fim = datetime.strptime(options["fim"], "%Y-%m-%d").date()
+        else:
+            data_fim = get_dia_util(0)
+
+        if options["inicio"]:
+            data_inicio = datetime.strptime(options["inicio"], "%Y-%m-%d").date()
+        else:
+            data_inicio = data_fim - timedelta(days=options["dias"])
+
+        total = backfill_cotacoes(
+            data_inicio,
+            data_fim,
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfill concluído ({total} cotações entre {data_inicio} e {data_fim})."
+            )
+        )
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from core.models import Acao
 from core.ml.backtest_direcional import (
+    carregar_series,
     executar_backtest_completo,
     persistir_trades,
     recalcular_estatisticas_estrategia,
+    varrer_parametros,
 )
+from core.ml.feature_store import atualizar_store
 from core.ml.modelo_direcional import carregar_modelo
+from core.ml.utils_direcionais import calcular_dias_equivalentes_selic, get_selic_anual_atual
 
 
 class Command(BaseCommand):
@@ -42,6 +46,43 @@ class Command(BaseCommand):
             default=0.05,
             help="Alvo percentual (ex.: 0.05 para +5%).",
         )
+        parser.add_argument(
+            "--sem-store",
+            action="store_true",
+            help="Recalcula as features a partir das cotações em vez de ler o feature store.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processos para simular as ações em paralelo (default: 1).",
+        )
+        parser.add_argument(
+            "--varredura",
+            action="store_true",
+            help=(
+                "Avalia a grade de parâmetros (--grade-*) sobre features e probabilidades "
+                "calculadas uma vez; não grava trades nem estatísticas."
+            ),
+        )
+        parser.add_argument("--grade-threshold-up", nargs="+", type=float, default=None,
+                            help="Valores de threshold_up na varredura (default: --threshold-up).")
+        parser.add_argument("--grade-threshold-down", nargs="+", type=float, default=None,
+                            help="Valores de threshold_down na varredura (default: --threshold-down).")
+        parser.add_argument("--grade-stop", nargs="+", type=float, default=None,
+                            help="Valores de stop_percent na varredura (default: --stop-percent).")
+        parser.add_argument("--grade-alvo", nargs="+", type=float, default=None,
+                            help="Valores de alvo_percentual na varredura (default: --alvo-percentual).")
+        parser.add_argument("--saida", type=str, default=None,
+                            help="Grava a tabela da varredura em CSV neste caminho.")
+        parser.add_argument(
+            "--recriar",
+            action="store_true",
+            help=(
+                "Apaga e recria trades e estatísticas da origem em vez de gravar "
+                "só as diferenças."
+            ),
+        )
 
     def handle(self, *args, **options):
         threshold_up = options["threshold_up"]
@@ -55,10 +96,20 @@ class Command(BaseCommand):
         self.stdout.write("Carregando universo de ações...")
         universo = Acao.objects.all()
 
+        usar_store = not options["sem_store"]
+        if usar_store:
+            self.stdout.write("Atualizando feature store...")
+            atualizar_store(universo.values_list("id", flat=True), workers=options["workers"])
+
+        if options["varredura"]:
+            self._varredura(artefato, universo, usar_store, options)
+            return
+
         self.stdout.write(
             f"Executando backtest completo (threshold_up={threshold_up}, "
             f"threshold_down={threshold_down}, stop={stop_percent}, alvo={alvo_percentual})..."
         )
+        falhas = {}
         trades = executar_backtest_completo(
             artefato,
             universo=universo,
@@ -66,14 +117,70 @@ class Command(BaseCommand):
             threshold_down=threshold_down,
             stop_percent=stop_percent,
             alvo_percentual=alvo_percentual,
+            usar_store=usar_store,
+            workers=options["workers"],
+            falhas=falhas,
         )
+        if falhas:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(falhas)} ações falharam no backtest; os trades gravados delas foram mantidos."
+                )
+            )
 
         self.stdout.write(f"{len(trades)} trades simulados. Persistindo no banco...")
-        persistir_trades(trades)
+        incremental = not options["recriar"]
+        contagem = persistir_trades(trades, incremental=incremental, preservar=falhas)
+        self.stdout.write(self._resumo("Trades", contagem))
 
         self.stdout.write("Recalculando estatísticas agregadas da estratégia...")
-        recalcular_estatisticas_estrategia()
+        contagem = recalcular_estatisticas_estrategia(incremental=incremental)
+        self.stdout.write(self._resumo("Estatísticas", contagem))
 
         self.stdout.write(
             self.style.SUCCESS("Backtest concluído e estatísticas atualizadas.")
         )
+
+    @staticmethod
+    def _resumo(rotulo, contagem):
+        return (
+            f"{rotulo}: {contagem['inseridos']} inseridos, "
+            f"{contagem['atualizados']} atualizados, {contagem['removidos']} removidos."
+        )
+
+    def _varredura(self, artefato, universo, usar_store, options):
+        grade = {
+            "thresholds_up": options["grade_threshold_up"] or [options["threshold_up"]],
+            "thresholds_down": options["grade_threshold_down"] or [options["threshold_down"]],
+            "stops": options["grade_stop"] or [options["stop_percent"]],
+            "alvos": options["grade_alvo"] or [options["alvo_percentual"]],
+        }
+        if any(stop >= 0 for stop in grade["stops"]):
+            raise CommandError("stop_percent deve ser negativo (ex.: -0.20 para -20%).")
+
+        dias = calcular_dias_equivalentes_selic(get_selic_anual_atual())
+        total = 1
+        for valores in grade.values():
+            total *= len(valores)
+
+        self.stdout.write("Calculando features e probabilidades (uma vez)...")
+        series = carregar_series(artefato, universo, usar_store, dias)
+        self.stdout.write(f"{len(series)} ações pontuadas. Avaliando {total} combinações...")
+
+        resultado = varrer_parametros(series, dias_equivalentes_selic=dias, **grade)
+        resultado.sort_values(["retorno_medio", "hit_rate"], ascending=False, inplace=True)
+
+        self.stdout.write(
+            resultado.to_string(
+                index=False,
+                formatters={
+                    "hit_rate": "{:.1f}".format,
+                    "retorno_medio": "{:.4f}".format,
+                    "drawdown_max": "{:.4f}".format,
+                },
+            )
+        )
+        if options["saida"]:
+            resultado.to_csv(options["saida"], index=False)
+            self.stdout.write(f"Tabela gravada em {options['saida']}")
+        self.stdout.write(self.style.SUCCESS("Varredura concluída."))
@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from core import indicators
+from core.ml.backtest_direcional import (
+    BINS_PROBABILIDADE,
+    _simular_trade_dia,
+    agregar_estatisticas,
+    backtest_serie,
+    carregar_features_acao,
+    preparar_series_acao,
+)
+from core.ml.labeling_direcional import gerar_labels_direcionais
+from core.ml.utils_direcionais import DATA_INICIO_TREINO
+from core.models import Acao, Cotacao, TradeHistorico
+
+
+CAMPOS_CONFERIDOS = [
+    "wma17", "wma34", "wma72", "wma144", "wma602",
+    "obv", "rsi_14", "atr", "media_volume_20d", "volume_m3", "max_5dias",
+]
+
+
+# -------------------
+# Implementações de referência (laços por ticker, como eram nas rotinas)
+# -------------------
+
+def _obv_referencia(fechamento, volume):
+    obv = [0]
+    for i in range(1, len(fechamento)):
+        if fechamento.iloc[i] > fechamento.iloc[i - 1]:
+            obv.append(obv[-1] + volume.iloc[i])
+        elif fechamento.iloc[i] < fechamento.iloc[i - 1]:
+            obv.append(obv[-1] - volume.iloc[i])
+        else:
+            obv.append(obv[-1])
+    return pd.Series(obv, index=fechamento.index, dtype=float)
+
+
+def _rsi_referencia(series, period=14):
+    delta = series.diff()
+    ganho = delta.where(delta > 0, 0)
+    perda = -delta.where(delta < 0, 0)
+    media_ganho = ganho.ewm(alpha=1 / period, adjust=False).mean()
+    media_perda = perda.ewm(alpha=1 / period, adjust=False).mean()
+    rs = media_ganho / media_perda
+    return 100 - (100 / (1 + rs))
+
+
+def _indicadores_referencia(painel):
+    partes = []
+    for _, df in painel.groupby("acao_id", sort=False):
+        out = pd.DataFrame(index=df.index)
+        fech = df["fechamento"]
+        for periodo in (17, 34, 72, 144, 602):
+            out[f"wma{periodo}"] = fech.ewm(alpha=1 / periodo, adjust=False).mean()
+        out["obv"] = _obv_referencia(fech, df["volume"])
+        anterior = fech.shift(1)
+        tr = pd.concat(
+            [df["maxima"] - df["minima"], (df["maxima"] - anterior).abs(), (df["minima"] - anterior).abs()],
+            axis=1,
+        ).max(axis=1)
+        out["atr"] = tr.ewm(alpha=1 / 14, adjust=False).mean()
+        out["rsi_14"] = _rsi_referencia(fech, 14)
+        out["media_volume_20d"] = df["volume"].rolling(window=20).mean()
+        out["volume_m3"] = df["volume"].shift(1).rolling(window=3).mean()
+        out["max_5dias"] = fech.shift(-1).rolling(window=5).max()
+        partes.append(out)
+    return pd.concat(partes)
+
+
+def _indicadores_vetorizados(painel):
+    por = painel["acao_id"]
+    fech = painel["fechamento"]
+    out = pd.DataFrame(index=painel.index)
+    for periodo in (17, 34, 72, 144, 602):
+        out[f"wma{periodo}"] = indicators.wilder_moving_average(fech, periodo, por=por)
+    out["obv"] = indicators.calcular_obv(fech, painel["volume"], por=por)
+    out["atr"] = indicators.calcular_atr(painel["maxima"], painel["minima"], fech, 14, por=por)
+    out["rsi_14"] = indicators.calcular_rsi(fech, 14, por=por)
+    out["media_volume_20d"] = indicators.rolling_mean(painel["volume"], 20, por=por)
+    out["volume_m3"] = indicators.rolling_mean(indicators.defasar(painel["volume"], por=por), 3, por=por)
+    out["max_5dias"] = indicators.max_proximos(fech, 5, por=por)
+    return out
+
+
+def _labels_referencia(df, janela_pregoes=10, alvo_percentual=0.05):
+    """Laço duplo original de gerar_labels_direcionais (sem data_inicio)."""
+    df = df.copy()
+    df["data"] = pd.to_datetime(df["data"])
+    df.sort_values("data", inplace=True)
+    df.reset_index(drop=True, inplace=True)
+
+    labels = []
+    n = len(df)
+    for i in df.index:
+        start = i + 1
+        end = min(i + 1 + janela_pregoes, n)
+        if start >= end:
+            continue
+        row = df.iloc[i]
+        p0 = float(row["fechamento"])
+        alvo_up = p0 * (1.0 + alvo_percentual)
+        alvo_down = p0 * (1.0 - alvo_percentual)
+        label = "NONE"
+        for j in range(start, end):
+            r = df.iloc[j]
+            up_hit = float(r.get("maxima", r["fechamento"])) >= alvo_up
+            down_hit = float(r.get("minima", r["fechamento"])) <= alvo_down
+            if up_hit and not down_hit:
+                label = "UP_FIRST"
+                break
+            if down_hit and not up_hit:
+                label = "DOWN_FIRST"
+                break
+        labels.append({"data": row["data"], "label_direcional": label})
+    return pd.DataFrame(labels, columns=["data", "label_direcional"])
+
+
+def _backtest_referencia(artefato, acao, df_feat, threshold_up, threshold_down,
+                         stop_percent, alvo_percentual, dias_equivalentes_selic):
+    """Laço original de executar_backtest_completo para uma ação (predict_proba por linha)."""
+    df_feat = df_feat.copy()
+    df_feat["data"] = pd.to_datetime(df_feat["data"])
+    df_feat.sort_values("data", inplace=True)
+    df_feat.reset_index(drop=True, inplace=True)
+    if any(c not in df_feat.columns for c in artefato.feature_names):
+        return []
+    feat_mat = df_feat[artefato.feature_names].astype(float).replace([np.inf, -np.inf], np.nan)
+    mask_valid = feat_mat.notna().all(axis=1)
+    if not mask_valid.any():
+        return []
+    df = df_feat.loc[mask_valid].reset_index(drop=True)
+    feat_mat = feat_mat.loc[mask_valid].reset_index(drop=True)
+
+    trades = []
+    for idx in range(len(df)):
+        row = df.iloc[idx]
+        data_ref = row["data"].date()
+        if data_ref < DATA_INICIO_TREINO:
+            continue
+        probas = artefato.model.predict_proba(feat_mat.iloc[idx].values.reshape(1, -1))[0]
+        prob_up = prob_down = 0.0
+        for cls, p in zip(artefato.classes_, probas):
+            if cls == "UP_FIRST":
+                prob_up = float(p)
+            elif cls == "DOWN_FIRST":
+                prob_down = float(p)
+        p0 = float(row["fechamento"])
+        janela_fut = df.iloc[idx + 1 : idx + 1 + 25].copy()
+        if janela_fut.empty:
+            continue
+        for lado, prob, threshold in (("COMPRA", prob_up, threshold_up), ("VENDA", prob_down, threshold_down)):
+            if prob >= threshold:
+                data_saida, preco_saida, ret, resultado = _simular_trade_dia(
+                    lado, p0, janela_fut,
+                    alvo_percentual=alvo_percentual,
+                    stop_percent=stop_percent,
+                    dias_equivalentes_selic=dias_equivalentes_selic,
+                )
+                trades.append((data_ref, data_saida, lado, prob, p0, preco_saida, ret, resultado))
+    return trades
+
+
+def _chave_trade(t):
+    return (t.data_entrada, t.data_saida, t.lado, t.prob_no_momento, t.preco_entrada,
+            t.preco_saida, t.retorno_percentual, t.resultado)
+
+
+def _estatisticas_referencia(trades, bins_probabilidade=BINS_PROBABILIDADE):
+    """Agregação linha a linha, como em recalcular_estatisticas_estrategia (só por ação)."""
+    grupos = {}
+    for acao_id, lado, prob, ret in trades:
+        prob = float(prob or 0.0)
+        for lo, hi in zip(bins_probabilidade[:-1], bins_probabilidade[1:]):
+            if lo <= prob < hi:
+                grupos.setdefault((acao_id, lado, lo, hi), []).append(float(ret or 0.0))
+                break
+
+    saida = {}
+    for chave, rets in grupos.items():
+        ganhos = [r for r in rets if r > 0]
+        perdas = [r for r in rets if r <= 0]
+        saida[chave] = {
+            "numero_trades": len(rets),
+            "hit_rate": 100.0 * len(ganhos) / len(rets),
+            "ganho_medio": float(np.mean(ganhos)) if ganhos else 0.0,
+            "perda_media": float(np.mean(perdas)) if perdas else 0.0,
+            "ganho_maximo": max(ganhos) if ganhos else 0.0,
+            "ganho_minimo": min(ganhos) if ganhos else 0.0,
+            "perda_maxima": min(perdas) if perdas else 0.0,
+            "perda_minima": max(perdas) if perdas else 0.0,
+        }
+    return saida
+
+
+def _cronometrar(fn, repeticoes):
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = fn()
+        tempos.append(time.perf_counter() - inicio)
+    return resultado, min(tempos)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o tempo de etapas do pipeline e confere a versão vetorizada contra "
+        "a implementação de referência e os valores gravados no banco."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--etapa",
+            type=str,
+            choices=["indicadores", "labels", "backtest", "estatisticas"],
+            default="indicadores",
+            help="Etapa a medir (default: indicadores).",
+        )
+        parser.add_argument(
+            "--tickers",
+            nargs="*",
+            default=None,
+            help="Tickers a usar (default: os --limite primeiros do universo).",
+        )
+        parser.add_argument(
+            "--limite",
+            type=int,
+            default=20,
+            help="Quantidade de ações quando --tickers não é informado (default: 20).",
+        )
+        parser.add_argument(
+            "--repeticoes",
+            type=int,
+            default=3,
+            help="Execuções por implementação; vale o menor tempo (default: 3).",
+        )
+        parser.add_argument(
+            "--origem",
+            type=str,
+            default="modelo_direcional_v1",
+            help="Origem dos trades na etapa estatisticas (default: modelo_direcional_v1).",
+        )
+
+    def _universo(self, options):
+        qs = Acao.objects.all().order_by("ticker")
+        if options["tickers"]:
+            qs = qs.filter(ticker__in=[t.strip().upper() for t in options["tickers"]])
+        else:
+            qs = qs[: options["limite"]]
+        ids = list(qs.values_list("id", flat=True))
+        if not ids:
+            raise CommandError("Nenhuma ação encontrada para o benchmark.")
+        return ids
+
+    def handle(self, *args, **options):
+        ids = self._universo(options)
+        if options["etapa"] == "estatisticas":
+            self._etapa_estatisticas(ids, options["repeticoes"], options["origem"])
+            return
+        getattr(self, f"_etapa_{options['etapa']}")(ids, options["repeticoes"])
+
+    def _etapa_indicadores(self, ids, repeticoes):
+        registros = (
+            Cotacao.objects.filter(acao_id__in=ids)
+            .order_by("acao_id", "data")
+            .values("acao_id", "data", "fechamento", "volume", "maxima", "minima", *CAMPOS_CONFERIDOS)
+        )
+        painel = pd.DataFrame.from_records(registros)
+        if painel.empty:
+            raise CommandError("Sem cotações para as ações selecionadas.")
+        for col in painel.columns:
+            if col not in ("acao_id", "data"):
+                painel[col] = pd.to_numeric(painel[col], errors="coerce").astype(float)
+
+        self.stdout.write(f"Painel: {len(ids)} ações, {len(painel)} linhas")
+
+        ref, t_ref = _cronometrar(lambda: _indicadores_referencia(painel), repeticoes)
+        vet, t_vet = _cronometrar(lambda: _indicadores_vetorizados(painel), repeticoes)
+        ref = ref.reindex(vet.index)
+
+        self.stdout.write(f"Referência (laço por ticker): {t_ref:.3f}s")
+        self.stdout.write(f"core.indicators (painel):     {t_vet:.3f}s  ({t_ref / max(t_vet, 1e-9):.1f}x)")
+
+        falhas = 0
+        self.stdout.write(f"\n{'Campo':<18} {'Δ máx. ref.':>12} {'≠ banco (>0.01)':>16}")
+        for campo in CAMPOS_CONFERIDOS:
+            a, b = vet[campo].to_numpy(), ref[campo].to_numpy()
+            ambos = ~(np.isnan(a) | np.isnan(b))
+            delta_ref = float(np.max(np.abs(a[ambos] - b[ambos]))) if ambos.any() else 0.0
+            paridade = np.array_equal(np.isnan(a), np.isnan(b)) and delta_ref <= 1e-9 * max(1.0, np.nanmax(np.abs(b)))
+
+            # valores gravados têm 2 casas (ATR 4); só compara onde há valor no banco
+            gravado = painel[campo].to_numpy()
+            casas = 4 if campo == "atr" else 2
+            tem = ~np.isnan(gravado) & ~np.isnan(a)
+            divergentes = int(np.sum(np.abs(np.round(a[tem], casas) - gravado[tem]) > 0.01 + 1e-9))
+
+            if not paridade:
+                falhas += 1
+            marca = "✅" if paridade else "❌"
+            self.stdout.write(f"{marca} {campo:<16} {delta_ref:>12.2e} {divergentes:>10}/{int(tem.sum())}")
+
+        if falhas:
+            self.stdout.write(self.style.ERROR(f"\n{falhas} campo(s) divergem da implementação de referência."))
+        else:
+            self.stdout.write(self.style.SUCCESS("\nKernels vetorizados conferem com a referência."))
+
+    def _etapa_labels(self, ids, repeticoes):
+        registros = (
+            Cotacao.objects.filter(acao_id__in=ids)
+            .order_by("acao_id", "data")
+            .values("acao_id", "data", "fechamento", "maxima", "minima")
+        )
+        painel = pd.DataFrame.from_records(registros)
+        if painel.empty:
+            raise CommandError("Sem cotações para as ações selecionadas.")
+        for col in ("fechamento", "maxima", "minima"):
+            painel[col] = pd.to_numeric(painel[col], errors="coerce").astype(float)
+        series = [df.drop(columns="acao_id") for _, df in painel.groupby("acao_id", sort=False)]
+
+        self.stdout.write(f"Painel: {len(series)} ações, {len(painel)} linhas")
+
+        ref, t_ref = _cronometrar(lambda: [_labels_referencia(df) for df in series], repeticoes)
+        vet, t_vet = _cronometrar(lambda: [gerar_labels_direcionais(df) for df in series], repeticoes)
+
+        self.stdout.write(f"Referência (laço duplo):   {t_ref:.3f}s")
+        self.stdout.write(f"gerar_labels_direcionais:  {t_vet:.3f}s  ({t_ref / max(t_vet, 1e-9):.1f}x)")
+
+        divergentes = 0
+        for a, b in zip(ref, vet):
+            a = a.reset_index(drop=True)
+            b = b.reset_index(drop=True)
+            if len(a) != len(b) or not (
+                a["data"].equals(b["data"]) and (a["label_direcional"] == b["label_direcional"]).all()
+            ):
+                divergentes += 1
+
+        contagem = pd.concat(vet)["label_direcional"].value_counts() if vet else pd.Series(dtype=int)
+        self.stdout.write("Distribuição: " + ", ".join(f"{k}={v}" for k, v in contagem.items()))
+        if divergentes:
+            self.stdout.write(self.style.ERROR(f"\n{divergentes} ação(ões) com labels diferentes da referência."))
+        else:
+            self.stdout.write(self.style.SUCCESS("\nLabels vetorizados conferem com a referência."))
+
+    def _etapa_backtest(self, ids, repeticoes):
+        from core.ml.modelo_direcional import carregar_modelo
+
+        artefato = carregar_modelo()
+        acoes = list(Acao.objects.filter(id__in=ids).order_by("ticker"))
+        features = [(acao, carregar_features_acao(acao)) for acao in acoes]
+        # parâmetros do comando backtest_modelo_direcional (todos os sinais); 10 dias
+        # corridos acabam antes de 10 pregões, então a saída por data SELIC é exercitada
+        params = dict(threshold_up=0.0, threshold_down=0.0, stop_percent=-0.20,
+                      alvo_percentual=0.05, dias_equivalentes_selic=10)
+
+        self.stdout.write(f"Painel: {len(acoes)} ações, {sum(len(df) for _, df in features)} linhas")
+
+        def referencia():
+            return [_backtest_referencia(artefato, acao, df, **params) for acao, df in features]
+
+        def vetorizado():
+            saida = []
+            for acao, df in features:
+                serie = preparar_series_acao(artefato, acao, df)
+                saida.append(backtest_serie(serie, **params) if serie is not None else [])
+            return saida
+
+        ref, t_ref = _cronometrar(referencia, 1)
+        vet, t_vet = _cronometrar(vetorizado, repeticoes)
+
+        self.stdout.write(f"Referência (linha a linha): {t_ref:.3f}s")
+        self.stdout.write(f"Vetorizado:                 {t_vet:.3f}s  ({t_ref / max(t_vet, 1e-9):.1f}x)")
+
+        divergentes = 0
+        for (acao, _), a, b in zip(features, ref, vet):
+            b = [_chave_trade(t) for t in b]
+            if len(a) != len(b) or any(
+                x[:3] != y[:3] or x[7] != y[7] or not np.allclose(x[3:7], y[3:7], rtol=1e-12, atol=0)
+                for x, y in zip(a, b)
+            ):
+                divergentes += 1
+                self.stdout.write(f"❌ {acao.ticker}: {len(a)} trades na referência, {len(b)} no vetorizado")
+
+        total = sum(len(t) for t in vet)
+        if divergentes:
+            self.stdout.write(self.style.ERROR(f"\n{divergentes} ação(ões) com trades diferentes da referência."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"\n{total} trades idênticos aos da referência."))
+
+    def _etapa_estatisticas(self, ids, repeticoes, origem):
+        colunas = ["acao_id", "lado", "prob_no_momento", "retorno_percentual"]
+        trades = list(
+            TradeHistorico.objects.filter(origem=origem, acao_id__in=ids).values_list(*colunas)
+        )
+        if not trades:
+            raise CommandError(f"Sem trades da origem {origem} para as ações selecionadas.")
+        df = pd.DataFrame.from_records(trades, columns=colunas)
+
+        self.stdout.write(f"Trades: {len(ids)} ações, {len(trades)} linhas")
+
+        ref, t_ref = _cronometrar(lambda: _estatisticas_referencia(trades), repeticoes)
+        vet, t_vet = _cronometrar(lambda: agregar_estatisticas(df), repeticoes)
+
+        self.stdout.write(f"Referência (laço por trade): {t_ref:.3f}s")
+        self.stdout.write(f"agregar_estatisticas:        {t_vet:.3f}s  ({t_ref / max(t_vet, 1e-9):.1f}x)")
+
+        por_acao = {k: v for k, v in vet.items() if k[0] is not None}
+        globais = len(vet) - len(por_acao)
+        divergentes = set(ref) ^ set(por_acao)
+        for chave in set(ref) & set(por_acao):
+            a, b = ref[chave], por_acao[chave]
+            if a["numero_trades"] != b["numero_trades"] or not np.allclose(
+                [a[c] for c in a if c != "numero_trades"],
+                [b[c] for c in a if c != "numero_trades"],
+                rtol=1e-9, atol=1e-12,
+            ):
+                divergentes.add(chave)
+
+        self.stdout.write(f"Grupos: {len(por_acao)} por ação, {globais} globais (acao NULL)")
+        if divergentes:
+            self.stdout.write(self.style.ERROR(f"\n{len(divergentes)} grupo(s) diferentes da referência."))
+        else:
+            self.stdout.write(self.style.SUCCESS("\nEstatísticas por ação conferem com a referência."))
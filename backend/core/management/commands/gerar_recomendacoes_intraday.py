@@ -1,6 +1,10 @@
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections
 
 from core.scripts.A03Recomendcoes_intraday import gerar_recomendacoes
+from core.services.recomendacoes import PontuadorIntraday
 
 
 class Command(BaseCommand):
@@ -13,9 +17,33 @@ class Command(BaseCommand):
             default=30,
             help="Quantidade máxima de recomendações a manter (default: 30)",
         )
+        parser.add_argument(
+            "--daemon",
+            action="store_true",
+            help="Fica em execução, consultando as cotações a cada --intervalo segundos.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=60.0,
+            help="Segundos entre ciclos no modo daemon (default: 60).",
+        )
+        parser.add_argument(
+            "--epsilon",
+            type=float,
+            default=0.001,
+            help=(
+                "Variação relativa mínima do preço para repontuar um ticker no modo "
+                "daemon (default: 0.001 = 0,1%%)."
+            ),
+        )
 
     def handle(self, *args, **options):
         top_n = options["top"]
+        if options["daemon"]:
+            self._daemon(top_n, options["intervalo"], options["epsilon"])
+            return
+
         resultado = gerar_recomendacoes(top_n=top_n)
         total = len(resultado or [])
         self.stdout.write(
@@ -23,3 +51,26 @@ class Command(BaseCommand):
                 f"Recomendações intraday atualizadas ({total} registros)."
             )
         )
+
+    def _daemon(self, top_n, intervalo, epsilon):
+        pontuador = PontuadorIntraday(top_n, epsilon=epsilon)
+        self.stdout.write(
+            f"Modo daemon: ciclo a cada {intervalo:g}s, epsilon {epsilon:g} (Ctrl+C para sair)."
+        )
+        try:
+            while True:
+                inicio = time.monotonic()
+                close_old_connections()
+                try:
+                    stats = pontuador.ciclo()
+                except Exception as exc:  # um ciclo com falha não derruba o daemon
+                    self.stderr.write(f"Falha no ciclo: {exc}")
+                else:
+                    decorrido = time.monotonic() - inicio
+                    self.stdout.write(
+                        f"[{time.strftime('%H:%M:%S')}] {stats['repontuados']} repontuados, "
+                        f"{stats['gravados']} gravados, top {len(stats['top'])} ({decorrido:.2f}s)"
+                    )
+                time.sleep(max(0.0, intervalo - (time.monotonic() - inicio)))
+        except KeyboardInterrupt:
+            self.stdout.write("Daemon encerrado.")
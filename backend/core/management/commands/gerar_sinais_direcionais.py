@@ -7,9 +7,14 @@ import numpy as np
 import pandas as pd
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.db.models import Max
 
-from core.models import Acao, RecomendacaoIA
-from core.ml.features_direcionais import criar_features_direcionais
+from core.models import Acao, Cotacao, RecomendacaoIA
+from core.ml.features_direcionais import (
+    criar_features_direcionais,
+    retornos_medios_janela_corridos,
+)
+from core.ml import feature_store
 from core.ml.modelo_direcional import carregar_modelo
 from core.ml.utils_direcionais import (
     calcular_dias_equivalentes_selic,
@@ -17,6 +22,88 @@ from core.ml.utils_direcionais import (
     get_preco_atual_base_b3,
     get_selic_anual_atual,
 )
+from core.services.estado_janela import carregar_estados, janela_df, salvar_retorno_medio
+
+
+# colunas de carregar_cotacoes_acao, reconstruídas a partir do snapshot
+COLUNAS_COTACAO = [
+    "data", "abertura", "fechamento", "minima", "maxima", "volume",
+    "wma17", "wma34", "wma72", "wma144", "wma602",
+    "rsi_14", "media_volume_20d", "atr",
+]
+
+
+def _historico_fechamentos(acao, ate, desde=None):
+    qs = Cotacao.objects.filter(acao=acao, data__lte=ate)
+    if desde is not None:
+        qs = qs.filter(data__gt=desde)
+    historico = pd.DataFrame.from_records(qs.order_by("data").values("data", "fechamento"))
+    if not historico.empty:
+        historico["data"] = pd.to_datetime(historico["data"])
+    return historico
+
+
+def _janelas_completas(acao, ate, dias):
+    """Quantidade de janelas de `dias` corridos já fechadas até o pregão `ate`."""
+    return Cotacao.objects.filter(acao=acao, data__lte=ate - timedelta(days=dias)).exclude(fechamento=0).count()
+
+
+def _estender_retorno_medio(acao, estado, dias):
+    """
+    Estende o retorno médio guardado (até estado.retorno_medio_ate) até estado.data.
+
+    As janelas que fecham nos pregões novos começam depois de
+    retorno_medio_ate - dias, e a saída delas cai nos pregões novos: basta ler
+    esse trecho e ponderar pela quantidade de janelas que já entravam na média.
+    """
+    ate_anterior = estado.retorno_medio_ate
+    recentes = _historico_fechamentos(acao, estado.data, desde=ate_anterior - timedelta(days=dias))
+    if recentes.empty:
+        return estado.retorno_medio_selic_ativo
+    fechadas = recentes["data"] <= recentes["data"].max() - pd.Timedelta(days=dias)
+    novas = int((fechadas & (recentes["fechamento"].astype(float) != 0)).sum())
+    if novas == 0:
+        return estado.retorno_medio_selic_ativo
+
+    media_nova = retornos_medios_janela_corridos(recentes, [dias])[dias]
+    anterior = estado.retorno_medio_selic_ativo
+    if anterior is None:
+        return media_nova
+    n_anterior = _janelas_completas(acao, ate_anterior, dias)
+    return (float(anterior) * n_anterior + media_nova * novas) / (n_anterior + novas)
+
+
+def _retorno_medio_snapshot(acao, estado, dias):
+    """
+    Retorno médio em janelas de `dias` corridos sobre o histórico inteiro.
+    Fica guardado no snapshot: a cada pregão novo é estendido só com as janelas
+    que fecharam desde o último cálculo; o histórico inteiro só é relido quando
+    `dias` (horizonte SELIC) muda.
+    """
+    if not dias:
+        return None
+    mesmo_horizonte = estado.dias_equivalentes_selic == dias and estado.retorno_medio_ate is not None
+    if mesmo_horizonte and estado.retorno_medio_ate >= estado.data:
+        valor = estado.retorno_medio_selic_ativo
+        return float(valor) if valor is not None else None
+
+    if mesmo_horizonte:
+        ret_medio = _estender_retorno_medio(acao, estado, dias)
+    else:
+        historico = _historico_fechamentos(acao, estado.data)
+        ret_medio = retornos_medios_janela_corridos(historico, [dias])[dias] if not historico.empty else None
+    ret_medio = float(ret_medio) if ret_medio is not None else None
+    salvar_retorno_medio(acao.id, estado.data, dias, ret_medio)
+    return ret_medio
+
+
+def _retorno_medio(acao, estado, df_store, dias, calculado):
+    """Retorno médio SELIC-equivalente: snapshot, depois histórico do store, senão o já calculado."""
+    if estado is not None:
+        return _retorno_medio_snapshot(acao, estado, dias)
+    if not df_store.empty:
+        return retornos_medios_janela_corridos(df_store, [dias])[dias] if dias else None
+    return calculado
 
 
 class Command(BaseCommand):
@@ -30,6 +117,11 @@ class Command(BaseCommand):
             default="daily",
             help="Modo de execução: daily (pós-fechamento) ou intraday.",
         )
+        parser.add_argument(
+            "--sem-store",
+            action="store_true",
+            help="Não usa o feature store (snapshot da janela ou histórico do banco).",
+        )
 
     def handle(self, *args, **options):
         modo = options["modo"]
@@ -47,21 +139,48 @@ class Command(BaseCommand):
 
         universo = Acao.objects.all()
 
+        usar_store = not options["sem_store"]
+        if usar_store:
+            self.stdout.write("Atualizando feature store...")
+            feature_store.atualizar_store(universo.values_list("id", flat=True))
+
+        # snapshot da janela móvel (mantido pelo A02): evita ler o histórico inteiro
+        ultima_data = Cotacao.objects.aggregate(ultima=Max("data"))["ultima"]
+        estados = carregar_estados(ultima_data) if ultima_data else {}
+        self.stdout.write(f"Snapshots de janela disponíveis: {len(estados)}")
+
         total = 0
         skipped_nan = 0
         with transaction.atomic():
             for acao in universo:
-                df_cot = carregar_cotacoes_acao(acao)
+                estado = estados.get(acao.id)
+                df_store = feature_store.ler_features(acao.id) if usar_store else pd.DataFrame()
+                if not df_store.empty:
+                    # cauda do store: aquecimento suficiente para todas as features
+                    df_cot = df_store[COLUNAS_COTACAO].tail(feature_store.LOOKBACK_FEATURES)
+                    dias_features = 0
+                elif estado is not None:
+                    df_cot = janela_df(estado)
+                    df_cot = df_cot[[c for c in COLUNAS_COTACAO if c in df_cot.columns]]
+                    dias_features = 0  # o buffer não cobre o histórico do retorno médio
+                else:
+                    df_cot = carregar_cotacoes_acao(acao)
+                    dias_features = dias_equiv or 0
                 if df_cot.empty:
                     continue
 
                 if modo == "daily":
                     # Usa última data de cotação (assumindo fechamento já atualizado)
                     ref_date = df_cot["data"].max().date()
-                    df_feat, ret_medio = criar_features_direcionais(
-                        df_cot,
-                        dias_equivalentes_selic=dias_equiv or 0,
-                    )
+                    if not df_store.empty:
+                        # features do fechamento já gravadas no store
+                        df_feat, ret_medio = df_store.tail(1).copy(), None
+                    else:
+                        df_feat, ret_medio = criar_features_direcionais(
+                            df_cot,
+                            dias_equivalentes_selic=dias_features,
+                        )
+                    ret_medio = _retorno_medio(acao, estado, df_store, dias_equiv, ret_medio)
                     df_feat["data"] = df_feat["data"].dt.date
                     linha_feat = df_feat[df_feat["data"] == ref_date].tail(1)
 
@@ -101,7 +220,8 @@ class Command(BaseCommand):
                             base_row["maxima"] = preco_info.maxima
                         if preco_info.minima is not None:
                             base_row["minima"] = preco_info.minima
-                        df_intraday = df_intraday.append(base_row, ignore_index=True)
+                        df_intraday = df_intraday.reset_index(drop=True)
+                        df_intraday.loc[len(df_intraday)] = base_row
 
                     # Recria datetime para features
                     df_intraday["data"] = pd.to_datetime(df_intraday["data"])
@@ -109,8 +229,9 @@ class Command(BaseCommand):
 
                     df_feat, ret_medio = criar_features_direcionais(
                         df_intraday,
-                        dias_equivalentes_selic=dias_equiv or 0,
+                        dias_equivalentes_selic=dias_features,
                     )
+                    ret_medio = _retorno_medio(acao, estado, df_store, dias_equiv, ret_medio)
                     df_feat["data"] = df_feat["data"].dt.date
                     linha_feat = df_feat[df_feat["data"] == data_sinal].tail(1)
 
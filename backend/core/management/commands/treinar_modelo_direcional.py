@@ -9,6 +9,7 @@ from core.ml.modelo_direcional import (
     avaliar_modelo,
     carregar_modelo,
     montar_dataset_direcional,
+    montar_dataset_do_store,
     salvar_modelo,
     split_temporal,
     treinar_modelo,
@@ -31,6 +32,17 @@ class Command(BaseCommand):
             default="2024-01-01",
             help="Data inicial do período de teste (YYYY-MM-DD).",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processos para calcular features/labels por ação (default: 1).",
+        )
+        parser.add_argument(
+            "--sem-store",
+            action="store_true",
+            help="Recalcula features/labels a partir das cotações em vez de ler o feature store.",
+        )
 
     def handle(self, *args, **options):
         data_treino_fim = datetime.strptime(options["data_treino_fim"], "%Y-%m-%d").date()
@@ -40,8 +52,10 @@ class Command(BaseCommand):
         universo = Acao.objects.all()
 
         self.stdout.write("Montando dataset direcional (features + labels)...")
-        df_full, retorno_medio_por_acao, dias_equivalentes_selic = montar_dataset_direcional(
-            universo=universo
+        montar = montar_dataset_direcional if options["sem_store"] else montar_dataset_do_store
+        df_full, retorno_medio_por_acao, dias_equivalentes_selic = montar(
+            universo=universo,
+            workers=options["workers"],
         )
 
         if df_full.empty:
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 from datetime import date, timedelta
-from typing import Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import numpy as np
 import pandas as pd
+from django.db import connections, transaction
+from django.utils import timezone
 
 from core.models import Acao, TradeHistorico, EstatisticaEstrategia
+from core.ml.feature_store import ler_features
 from core.ml.features_direcionais import criar_features_direcionais
-from core.ml.modelo_direcional import ArtefatoModeloDirecional, DATA_INICIO_TREINO
+from core.ml.modelo_direcional import ArtefatoModeloDirecional, DATA_INICIO_TREINO, carregar_modelo
+from core.services.bulk_upsert import sincronizar_por_chave
 from core.ml.utils_direcionais import (
     carregar_cotacoes_acao,
     calcular_dias_equivalentes_selic,
@@ -17,6 +25,9 @@ from core.ml.utils_direcionais import (
 )
 
 
+logger = logging.getLogger(__name__)
+
+
 @dataclass
 class TradeSimulado:
     acao: Acao
@@ -126,248 +137,664 @@ def _simular_trade_dia(
     return data_saida, preco_saida, retorno, resultado
 
 
-def executar_backtest_completo(
+HORIZONTE_PREGOES = 10  # saída por tempo no 10º pregão
+
+RESULTADOS = np.array(["ALVO", "STOP", "TEMPO"])
+
+
+@dataclass
+class SeriesBacktest:
+    """Arrays de uma ação prontos para a simulação (linhas com features válidas)."""
+    acao: Acao
+    datas: np.ndarray  # datetime64[D]
+    fechamento: np.ndarray
+    maxima: np.ndarray
+    minima: np.ndarray
+    prob_up: np.ndarray
+    prob_down: np.ndarray
+    entradas: np.ndarray  # índices elegíveis a entrada (>= início do treino, com pregão seguinte)
+
+
+def preparar_series_acao(
     artefato: ArtefatoModeloDirecional,
-    universo: Optional[Iterable[Acao]] = None,
-    threshold_up: float = 0.5,
-    threshold_down: float = 0.5,
-    stop_percent: float = -0.20,
-    alvo_percentual: float = 0.05,
-    dias_equivalentes_selic: Optional[int] = None,
-) -> List[TradeSimulado]:
+    acao: Acao,
+    df_feat: pd.DataFrame,
+) -> Optional[SeriesBacktest]:
     """
-    Executa backtest completo da estratégia, retornando lista de trades simulados.
+    Filtra as linhas com todas as features do modelo válidas e pontua a
+    matriz inteira com um único predict_proba. None se não houver o que simular.
     """
-    if universo is None:
-        universo = Acao.objects.all()
+    if df_feat is None or df_feat.empty:
+        return None
+
+    df_feat = df_feat.copy()
+    df_feat["data"] = pd.to_datetime(df_feat["data"])
+    df_feat.sort_values("data", inplace=True)
+    df_feat.reset_index(drop=True, inplace=True)
+
+    # se faltar qualquer coluna usada no treino, não conseguimos
+    # replicar o modelo corretamente para este ativo
+    if any(c not in df_feat.columns for c in artefato.feature_names):
+        return None
+
+    # Matriz de features limpa (sem NaN/inf) na mesma ordem do treino
+    feat_mat = (
+        df_feat[artefato.feature_names]
+        .astype(float)
+        .replace([np.inf, -np.inf], np.nan)
+    )
+    mask_valid = feat_mat.notna().all(axis=1).to_numpy()
+    if not mask_valid.any():
+        return None
+
+    # a janela futura é tomada entre as linhas válidas, como no laço original
+    df = df_feat.loc[mask_valid].reset_index(drop=True)
+    X = feat_mat.to_numpy()[mask_valid]
+
+    probas = artefato.model.predict_proba(X)
+    classes = list(artefato.classes_)
+    zeros = np.zeros(len(df))
+    prob_up = probas[:, classes.index("UP_FIRST")] if "UP_FIRST" in classes else zeros
+    prob_down = probas[:, classes.index("DOWN_FIRST")] if "DOWN_FIRST" in classes else zeros
+
+    fech = df["fechamento"].astype(float).to_numpy()
+    maxima = df["maxima"].astype(float).to_numpy() if "maxima" in df else fech
+    minima = df["minima"].astype(float).to_numpy() if "minima" in df else fech
+    datas = df["data"].to_numpy().astype("datetime64[D]")
+
+    n = len(df)
+    entradas = np.flatnonzero(datas >= np.datetime64(DATA_INICIO_TREINO))
+    entradas = entradas[entradas < n - 1]
+    if len(entradas) == 0:
+        return None
+
+    return SeriesBacktest(
+        acao=acao,
+        datas=datas,
+        fechamento=fech,
+        maxima=maxima,
+        minima=minima,
+        prob_up=prob_up.astype(float),
+        prob_down=prob_down.astype(float),
+        entradas=entradas,
+    )
+
+
+def simular_trades(
+    serie: SeriesBacktest,
+    lado: str,
+    entradas: np.ndarray,
+    alvo_percentual: float,
+    stop_percent: float,
+    dias_equivalentes_selic: Optional[int],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Versão vetorizada de _simular_trade_dia para várias entradas de uma vez.
 
-    if dias_equivalentes_selic is None:
-        selic = get_selic_anual_atual()
-        dias_equivalentes_selic = calcular_dias_equivalentes_selic(selic)
+    Monta a matriz (entradas × HORIZONTE_PREGOES) de máximas/mínimas/
+    fechamentos dos pregões seguintes e acha o primeiro pregão com saída:
+    alvo, depois stop (mesma ordem de teste do laço), depois tempo (10º
+    pregão ou data >= 1º pregão + dias SELIC). Sem saída na janela, sai no
+    fechamento do último pregão disponível (TEMPO).
 
-    trades: List[TradeSimulado] = []
+    Retorna (índice do pregão de saída, preço de saída, retorno, código do
+    resultado em RESULTADOS).
+    """
+    if stop_percent >= 0:
+        raise ValueError("stop_percent deve ser negativo (ex.: -0.20 para -20%).")
 
-    for acao in universo:
+    n = len(serie.datas)
+    p0 = serie.fechamento[entradas]
+    k = np.arange(HORIZONTE_PREGOES)
+    linhas = entradas[:, None] + 1 + k[None, :]
+    valido = linhas < n
+    linhas = np.minimum(linhas, n - 1)
+
+    high = serie.maxima[linhas]
+    low = serie.minima[linhas]
+
+    if lado == "COMPRA":
+        preco_alvo = p0 * (1.0 + alvo_percentual)
+        preco_stop = p0 * (1.0 + stop_percent)
+        with np.errstate(invalid="ignore"):
+            hit_alvo = high >= preco_alvo[:, None]
+            hit_stop = low <= preco_stop[:, None]
+    else:  # VENDA: alvo é queda, stop é alta (ex.: -20% vira 1.20)
+        preco_alvo = p0 * (1.0 - alvo_percentual)
+        preco_stop = p0 * (1.0 - stop_percent)
+        with np.errstate(invalid="ignore"):
+            hit_alvo = low <= preco_alvo[:, None]
+            hit_stop = high >= preco_stop[:, None]
+
+    tempo = np.broadcast_to(k[None, :] == HORIZONTE_PREGOES - 1, linhas.shape)
+    if dias_equivalentes_selic and dias_equivalentes_selic > 0:
+        limite = serie.datas[entradas + 1] + np.timedelta64(int(dias_equivalentes_selic), "D")
+        tempo = tempo | (serie.datas[linhas] >= limite[:, None])
+
+    evento = valido & (hit_alvo | hit_stop | tempo)
+    tem_evento = evento.any(axis=1)
+    # sem evento: último pregão da janela (a série acabou antes do 10º)
+    ultimo_valido = valido.sum(axis=1) - 1
+    col = np.where(tem_evento, evento.argmax(axis=1), ultimo_valido)
+
+    r = np.arange(len(entradas))
+    alvo_ok = tem_evento & hit_alvo[r, col]
+    stop_ok = tem_evento & ~alvo_ok & hit_stop[r, col]
+    saida = linhas[r, col]
+
+    preco_saida = np.where(alvo_ok, preco_alvo, np.where(stop_ok, preco_stop, serie.fechamento[saida]))
+    codigo = np.where(alvo_ok, 0, np.where(stop_ok, 1, 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if lado == "COMPRA":
+            retorno = preco_saida / p0 - 1.0
+        else:
+            # para venda, retorno é invertido
+            retorno = p0 / preco_saida - 1.0
+    return saida, preco_saida, retorno, codigo
+
+
+def backtest_serie(
+    serie: SeriesBacktest,
+    threshold_up: float,
+    threshold_down: float,
+    stop_percent: float,
+    alvo_percentual: float,
+    dias_equivalentes_selic: Optional[int],
+) -> List[TradeSimulado]:
+    """Trades de uma ação, na ordem do laço original (por data; COMPRA antes de VENDA)."""
+    partes = []
+    for ordem, (lado, prob, threshold) in enumerate(
+        (("COMPRA", serie.prob_up, threshold_up), ("VENDA", serie.prob_down, threshold_down))
+    ):
+        entradas = serie.entradas[prob[serie.entradas] >= threshold]
+        if len(entradas) == 0:
+            continue
+        saida, preco_saida, retorno, codigo = simular_trades(
+            serie, lado, entradas, alvo_percentual, stop_percent, dias_equivalentes_selic
+        )
+        partes.append((entradas, np.full(len(entradas), ordem), lado, prob[entradas], saida, preco_saida, retorno, codigo))
+
+    trades: List[Tuple[int, int, TradeSimulado]] = []
+    for entradas, ordens, lado, probs, saida, preco_saida, retorno, codigo in partes:
+        datas_entrada = serie.datas[entradas].astype(object)
+        datas_saida = serie.datas[saida].astype(object)
+        for i in range(len(entradas)):
+            trades.append(
+                (
+                    int(entradas[i]),
+                    int(ordens[i]),
+                    TradeSimulado(
+                        acao=serie.acao,
+                        data_entrada=datas_entrada[i],
+                        data_saida=datas_saida[i],
+                        lado=lado,
+                        prob_no_momento=float(probs[i]),
+                        preco_entrada=float(serie.fechamento[entradas[i]]),
+                        preco_saida=float(preco_saida[i]),
+                        retorno_percentual=float(retorno[i]),
+                        resultado=str(RESULTADOS[codigo[i]]),
+                    ),
+                )
+            )
+    trades.sort(key=lambda t: (t[0], t[1]))
+    return [t for _, _, t in trades]
+
+
+def carregar_features_acao(
+    acao: Acao,
+    usar_store: bool = True,
+    dias_equivalentes_selic: Optional[int] = None,
+) -> pd.DataFrame:
+    """Features da ação: feature store (se houver) ou cálculo a partir das cotações."""
+    df_feat = ler_features(acao.id) if usar_store else pd.DataFrame()
+    if df_feat.empty:
         # Carrega histórico completo da ação a partir do início do treino
         df_cot = carregar_cotacoes_acao(acao, data_inicio=DATA_INICIO_TREINO)
         if df_cot.empty:
-            continue
-
+            return pd.DataFrame()
         # Cria features usando a mesma função do treino
         df_feat, _ = criar_features_direcionais(
             df_cot, dias_equivalentes_selic=dias_equivalentes_selic or 0
         )
-        if df_feat.empty:
-            continue
+    return df_feat
 
-        df_feat["data"] = pd.to_datetime(df_feat["data"])
-        df_feat.sort_values("data", inplace=True)
-        df_feat.reset_index(drop=True, inplace=True)
 
-        # Garante que todas as features esperadas existem
-        missing_cols = [c for c in artefato.feature_names if c not in df_feat.columns]
-        if missing_cols:
-            # se faltar qualquer coluna usada no treino, não conseguimos
-            # replicar o modelo corretamente para este ativo
-            continue
+def _backtest_acao(
+    artefato: ArtefatoModeloDirecional,
+    acao: Acao,
+    usar_store: bool,
+    parametros: Tuple[float, float, float, float, Optional[int]],
+) -> List[TradeSimulado]:
+    threshold_up, threshold_down, stop_percent, alvo_percentual, dias_equivalentes_selic = parametros
+    df_feat = carregar_features_acao(acao, usar_store, dias_equivalentes_selic)
+    serie = preparar_series_acao(artefato, acao, df_feat)
+    if serie is None:
+        return []
+    return backtest_serie(
+        serie,
+        threshold_up,
+        threshold_down,
+        stop_percent,
+        alvo_percentual,
+        dias_equivalentes_selic,
+    )
 
-        # Matriz de features limpa (sem NaN/inf) na mesma ordem do treino
-        feat_mat = (
-            df_feat[artefato.feature_names]
-            .astype(float)
-            .replace([np.inf, -np.inf], np.nan)
-        )
-        mask_valid = feat_mat.notna().all(axis=1)
-        if not mask_valid.any():
-            continue
 
-        df = df_feat.loc[mask_valid].reset_index(drop=True)
-        feat_mat = feat_mat.loc[mask_valid].reset_index(drop=True)
+# artefato do processo worker. Com fork, o pai o atribui antes de criar o
+# pool e os workers herdam o modelo já carregado: os arrays das árvores ficam
+# nas páginas do pai, compartilhadas copy-on-write (a predição não as escreve).
+# Sem fork (spawn), cada worker carrega o seu no initializer.
+_artefato_worker: Optional[ArtefatoModeloDirecional] = None
 
-        if df.empty:
-            continue
 
-        # posição simples (no máximo 1 trade aberto por lado por vez)
-        aberto_compra = False
-        aberto_venda = False
+def _inicializar_worker(modelo_path: Optional[str]) -> None:
+    global _artefato_worker
+    # conexões herdadas do processo pai (fork) não podem ser compartilhadas
+    connections.close_all()
+    if _artefato_worker is None:
+        _artefato_worker = carregar_modelo(modelo_path)
 
-        for idx in range(len(df)):
-            row = df.iloc[idx]
-            data_ref = row["data"].date()
-            if data_ref < DATA_INICIO_TREINO:
-                continue
 
-            X_row = feat_mat.iloc[idx].values.reshape(1, -1)
-            probas = artefato.model.predict_proba(X_row)[0]
+def _backtest_acao_worker(acao: Acao, usar_store: bool, parametros) -> Tuple[int, List[TradeSimulado]]:
+    return acao.id, _backtest_acao(_artefato_worker, acao, usar_store, parametros)
 
-            prob_up = 0.0
-            prob_down = 0.0
-            for cls, p in zip(artefato.classes_, probas):
-                if cls == "UP_FIRST":
-                    prob_up = float(p)
-                elif cls == "DOWN_FIRST":
-                    prob_down = float(p)
 
-            p0 = float(row["fechamento"])
+def _conferir_artefato_do_pool(artefato: ArtefatoModeloDirecional, modelo_path: Optional[str | Path]) -> None:
+    """
+    Sem fork, os workers carregam o modelo de `modelo_path` (ou do caminho
+    padrão), não recebem `artefato`: recusa o pool se `artefato` não for o que
+    está gravado lá (ex.: modelo recém-treinado só em memória).
+    """
+    try:
+        gravado = carregar_modelo(modelo_path)
+    except FileNotFoundError as exc:
+        raise ValueError(
+            f"workers > 1 exige o modelo gravado em disco; arquivo não encontrado: {exc.filename}"
+        ) from exc
+    # carregar_modelo usa o cache do processo: mesmo arquivo → mesmo objeto model
+    if gravado.model is not artefato.model:
+        raise ValueError(
+            "workers > 1: `artefato` não é o modelo gravado em `modelo_path` (ou no caminho "
+            "padrão). Grave-o com salvar_modelo e informe o caminho, ou use workers=1."
+        )
+
 
-            # janela futura para simulação (a partir do próximo pregão)
-            janela_fut = df.iloc[idx + 1 : idx + 1 + 25].copy()
-            if janela_fut.empty:
+def iterar_backtest(
+    artefato: ArtefatoModeloDirecional,
+    universo: Iterable[Acao],
+    parametros: Tuple[float, float, float, float, Optional[int]],
+    usar_store: bool = True,
+    workers: int = 1,
+    modelo_path: Optional[str | Path] = None,
+) -> Iterator[Tuple[Acao, List[TradeSimulado], Optional[str]]]:
+    """
+    Gera (acao, trades, erro) à medida que cada ação termina; uma ação que
+    falha (inclusive worker morto) vem com trades vazios e a mensagem em
+    `erro`, sem interromper as demais.
+
+    Com `workers` > 1 as ações vão para um pool de processos. Onde há fork,
+    os workers herdam `artefato` do processo pai (sem serializar o modelo a
+    cada tarefa nem recarregá-lo por worker); sem fork, cada worker carrega o
+    modelo de `modelo_path` (default: caminho padrão do modelo direcional) e
+    `artefato` precisa ser esse mesmo modelo (ValueError caso contrário).
+    `parametros` = (threshold_up, threshold_down, stop_percent, alvo_percentual, dias_equivalentes_selic).
+    """
+    if workers <= 1:
+        for acao in universo:
+            try:
+                trades = _backtest_acao(artefato, acao, usar_store, parametros)
+            except Exception as e:
+                yield acao, [], f"{type(e).__name__}: {e}"
                 continue
+            yield acao, trades, None
+        return
 
-            # COMPRA
-            if (not aberto_compra) and prob_up >= threshold_up:
-                data_saida, preco_saida, ret, resultado = _simular_trade_dia(
-                    "COMPRA",
-                    p0,
-                    janela_fut,
-                    alvo_percentual=alvo_percentual,
-                    stop_percent=stop_percent,
-                    dias_equivalentes_selic=dias_equivalentes_selic,
-                )
-                if data_saida and preco_saida is not None and ret is not None:
-                    trades.append(
-                        TradeSimulado(
-                            acao=acao,
-                            data_entrada=data_ref,
-                            data_saida=data_saida,
-                            lado="COMPRA",
-                            prob_no_momento=prob_up,
-                            preco_entrada=p0,
-                            preco_saida=preco_saida,
-                            retorno_percentual=ret,
-                            resultado=resultado,
-                        )
+    global _artefato_worker
+    fork = "fork" in multiprocessing.get_all_start_methods()
+    if not fork:
+        _conferir_artefato_do_pool(artefato, modelo_path)
+    acoes = {acao.id: acao for acao in universo}
+    connections.close_all()
+    if fork:
+        _artefato_worker = artefato
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork") if fork else None,
+            initializer=_inicializar_worker,
+            initargs=(str(modelo_path) if modelo_path else None,),
+        ) as pool:
+            futuros = {
+                pool.submit(_backtest_acao_worker, acao, usar_store, parametros): acao_id
+                for acao_id, acao in acoes.items()
+            }
+            for futuro in as_completed(futuros):
+                acao = acoes[futuros[futuro]]
+                try:
+                    _, trades = futuro.result()
+                except Exception as e:  # inclui BrokenProcessPool
+                    yield acao, [], f"{type(e).__name__}: {e}"
+                    continue
+                for trade in trades:
+                    trade.acao = acao
+                yield acao, trades, None
+    finally:
+        _artefato_worker = None
+
+
+def executar_backtest_completo(
+    artefato: ArtefatoModeloDirecional,
+    universo: Optional[Iterable[Acao]] = None,
+    threshold_up: float = 0.5,
+    threshold_down: float = 0.5,
+    stop_percent: float = -0.20,
+    alvo_percentual: float = 0.05,
+    dias_equivalentes_selic: Optional[int] = None,
+    usar_store: bool = True,
+    workers: int = 1,
+    modelo_path: Optional[str | Path] = None,
+    falhas: Optional[Dict[int, str]] = None,
+) -> List[TradeSimulado]:
+    """
+    Executa backtest completo da estratégia, retornando lista de trades simulados.
+    Com `usar_store`, as features vêm do feature store (atualizado antes pelo
+    chamador); ações fora do store caem no cálculo a partir das cotações.
+
+    Cada ação é pontuada com um único predict_proba e todas as entradas são
+    simuladas de uma vez (simular_trades); _simular_trade_dia continua como
+    implementação de referência. Com `workers` > 1 as ações rodam em paralelo
+    (ver iterar_backtest); a lista final segue a ordem do universo. Ações que
+    falham são registradas no log, ficam sem trades e, se `falhas` for
+    informado, entram nele como {acao_id: erro} (para o chamador não
+    confundir "falhou" com "não tem mais trades" ao persistir).
+    """
+    if universo is None:
+        universo = Acao.objects.all()
+    universo = list(universo)
+
+    if dias_equivalentes_selic is None:
+        selic = get_selic_anual_atual()
+        dias_equivalentes_selic = calcular_dias_equivalentes_selic(selic)
+
+    parametros = (threshold_up, threshold_down, stop_percent, alvo_percentual, dias_equivalentes_selic)
+    if falhas is None:
+        falhas = {}
+    por_acao: Dict[int, List[TradeSimulado]] = {}
+    for acao, trades_acao, erro in iterar_backtest(
+        artefato, universo, parametros, usar_store=usar_store, workers=workers, modelo_path=modelo_path
+    ):
+        if erro:
+            falhas[acao.id] = erro
+            logger.error("Backtest de %s falhou: %s", acao.ticker, erro)
+        por_acao[acao.id] = trades_acao
+    if falhas:
+        logger.warning("Backtest: %s de %s ações falharam (sem trades)", len(falhas), len(universo))
+
+    trades: List[TradeSimulado] = []
+    for acao in universo:
+        trades.extend(por_acao.get(acao.id, []))
+    return trades
+
+
+def carregar_series(
+    artefato: ArtefatoModeloDirecional,
+    universo: Iterable[Acao],
+    usar_store: bool = True,
+    dias_equivalentes_selic: Optional[int] = None,
+) -> List[SeriesBacktest]:
+    """Features + probabilidades do universo, calculadas uma vez (base da varredura)."""
+    series: List[SeriesBacktest] = []
+    for acao in universo:
+        df_feat = carregar_features_acao(acao, usar_store, dias_equivalentes_selic)
+        serie = preparar_series_acao(artefato, acao, df_feat)
+        if serie is not None:
+            series.append(serie)
+    return series
+
+
+def varrer_parametros(
+    series: Sequence[SeriesBacktest],
+    thresholds_up: Sequence[float],
+    thresholds_down: Sequence[float],
+    stops: Sequence[float],
+    alvos: Sequence[float],
+    dias_equivalentes_selic: Optional[int],
+) -> pd.DataFrame:
+    """
+    Avalia a grade inteira de parâmetros sobre as séries já pontuadas.
+
+    A saída de um trade não depende dos thresholds: para cada (stop, alvo)
+    todas as entradas elegíveis são simuladas uma vez por lado e ordenadas
+    pela data de saída; cada par de thresholds vira só uma máscara sobre
+    esses arrays. Métricas por combinação: trades, hit rate (% com retorno
+    > 0), retorno médio e drawdown máximo da soma acumulada dos retornos na
+    ordem de saída (tamanho fixo por trade).
+    """
+    linhas = []
+    for stop_percent in stops:
+        for alvo_percentual in alvos:
+            probs, rets, saidas, compra = [], [], [], []
+            for serie in series:
+                for lado, prob in (("COMPRA", serie.prob_up), ("VENDA", serie.prob_down)):
+                    saida, _, retorno, _ = simular_trades(
+                        serie, lado, serie.entradas, alvo_percentual, stop_percent, dias_equivalentes_selic
                     )
-                    aberto_compra = False  # trade é totalmente fechado na simulação
-
-            # VENDA
-            if (not aberto_venda) and prob_down >= threshold_down:
-                data_saida, preco_saida, ret, resultado = _simular_trade_dia(
-                    "VENDA",
-                    p0,
-                    janela_fut,
-                    alvo_percentual=alvo_percentual,
-                    stop_percent=stop_percent,
-                    dias_equivalentes_selic=dias_equivalentes_selic,
-                )
-                if data_saida and preco_saida is not None and ret is not None:
-                    trades.append(
-                        TradeSimulado(
-                            acao=acao,
-                            data_entrada=data_ref,
-                            data_saida=data_saida,
-                            lado="VENDA",
-                            prob_no_momento=prob_down,
-                            preco_entrada=p0,
-                            preco_saida=preco_saida,
-                            retorno_percentual=ret,
-                            resultado=resultado,
-                        )
+                    probs.append(prob[serie.entradas])
+                    rets.append(retorno)
+                    saidas.append(serie.datas[saida])
+                    compra.append(np.full(len(saida), lado == "COMPRA"))
+
+            if probs:
+                prob = np.concatenate(probs)
+                ret = np.concatenate(rets)
+                ordem = np.argsort(np.concatenate(saidas), kind="stable")
+                prob, ret, eh_compra = prob[ordem], ret[ordem], np.concatenate(compra)[ordem]
+            else:
+                prob = ret = np.zeros(0)
+                eh_compra = np.zeros(0, dtype=bool)
+
+            for threshold_up in thresholds_up:
+                for threshold_down in thresholds_down:
+                    mask = np.where(eh_compra, prob >= threshold_up, prob >= threshold_down)
+                    r = ret[mask]
+                    n = len(r)
+                    if n:
+                        acumulado = np.cumsum(r)
+                        drawdown = float(np.min(acumulado - np.maximum.accumulate(np.maximum(acumulado, 0.0))))
+                    else:
+                        drawdown = 0.0
+                    linhas.append(
+                        {
+                            "threshold_up": threshold_up,
+                            "threshold_down": threshold_down,
+                            "stop_percent": stop_percent,
+                            "alvo_percentual": alvo_percentual,
+                            "trades": n,
+                            "hit_rate": 100.0 * float(np.mean(r > 0)) if n else 0.0,
+                            "retorno_medio": float(np.mean(r)) if n else 0.0,
+                            "drawdown_max": drawdown,
+                        }
                     )
-                    aberto_venda = False
+    return pd.DataFrame(linhas)
 
-    return trades
 
+CAMPOS_TRADE = [
+    "data_saida",
+    "prob_no_momento",
+    "preco_entrada",
+    "preco_saida",
+    "retorno_percentual",
+    "resultado",
+]
 
-def persistir_trades(trades: List[TradeSimulado], origem: str = "modelo_direcional_v1") -> None:
+
+def persistir_trades(
+    trades: List[TradeSimulado],
+    origem: str = "modelo_direcional_v1",
+    incremental: bool = True,
+    preservar: Iterable[int] = (),
+) -> Dict[str, int]:
     """
-    Limpa e recria cotacoes_trades_historicos para a origem informada.
+    Grava os trades simulados em cotacoes_trades_historicos para a origem.
+
+    Incremental (default): cada trade é identificado por (acao, lado,
+    data_entrada, origem); só entram os novos, só mudam os alterados e só
+    saem os que não existem mais, numa transação. Com `incremental=False`,
+    limpa e recria tudo da origem. Os trades gravados das ações em
+    `preservar` (ex.: as que falharam no backtest) não são tocados.
     """
-    TradeHistorico.objects.filter(origem=origem).delete()
-
-    objetos: List[TradeHistorico] = []
-    for t in trades:
-        objetos.append(
-            TradeHistorico(
-                acao=t.acao,
-                data_entrada=t.data_entrada,
-                data_saida=t.data_saida,
-                lado=t.lado,
-                prob_no_momento=t.prob_no_momento,
-                preco_entrada=t.preco_entrada,
-                preco_saida=t.preco_saida,
-                retorno_percentual=t.retorno_percentual,
-                resultado=t.resultado,
-                origem=origem,
+    novos = {
+        (t.acao.id, t.lado, t.data_entrada): {
+            "data_saida": t.data_saida,
+            "prob_no_momento": t.prob_no_momento,
+            "preco_entrada": t.preco_entrada,
+            "preco_saida": t.preco_saida,
+            "retorno_percentual": t.retorno_percentual,
+            "resultado": t.resultado,
+        }
+        for t in trades
+    }
+
+    gravados = TradeHistorico.objects.filter(origem=origem).exclude(acao_id__in=list(preservar))
+    with transaction.atomic():
+        if incremental:
+            return sincronizar_por_chave(
+                TradeHistorico,
+                gravados,
+                ["acao_id", "lado", "data_entrada"],
+                novos,
+                fixos={"origem": origem},
             )
-        )
 
-    if objetos:
-        TradeHistorico.objects.bulk_create(objetos, batch_size=1000)
+        removidos, _ = gravados.delete()
+        objetos = [
+            TradeHistorico(acao_id=acao_id, lado=lado, data_entrada=data_entrada, origem=origem, **valores)
+            for (acao_id, lado, data_entrada), valores in novos.items()
+        ]
+        if objetos:
+            TradeHistorico.objects.bulk_create(objetos, batch_size=1000)
+        return {"inseridos": len(objetos), "atualizados": 0, "removidos": removidos}
 
 
-def recalcular_estatisticas_estrategia(
-    origem: str = "modelo_direcional_v1",
+BINS_PROBABILIDADE = [0.0, 0.4, 0.5, 0.6, 0.7, 1.0]
+
+
+def agregar_estatisticas(
+    trades: pd.DataFrame,
     bins_probabilidade: Optional[List[float]] = None,
-) -> None:
+) -> Dict[Tuple[Optional[int], str, float, float], dict]:
     """
-    Recalcula estatísticas agregadas a partir de TradeHistorico.
+    Estatísticas por (acao_id, lado, faixa_min, faixa_max) a partir de um
+    DataFrame com acao_id, lado, prob_no_momento e retorno_percentual.
+
+    Faixas fechadas à esquerda ([lo, hi)); probabilidades fora delas são
+    descartadas. Além das linhas por ação, gera as globais (acao_id None)
+    por lado e faixa, usadas como fallback no serializer.
     """
     if bins_probabilidade is None:
-        bins_probabilidade = [0.0, 0.4, 0.5, 0.6, 0.7, 1.0]
-
-    EstatisticaEstrategia.objects.filter(origem=origem).delete()
-
-    trades = TradeHistorico.objects.filter(origem=origem)
-    if not trades.exists():
-        return
+        bins_probabilidade = BINS_PROBABILIDADE
+    if trades.empty:
+        return {}
+
+    # Decimal/None do banco: astype(float) converte direto (None -> NaN)
+    prob = trades["prob_no_momento"].astype(float).fillna(0.0)
+    ret = trades["retorno_percentual"].astype(float).fillna(0.0)
+    faixa = pd.cut(prob, bins=bins_probabilidade, right=False, labels=False)
+
+    df = pd.DataFrame(
+        {
+            "acao_id": trades["acao_id"].to_numpy(),
+            "lado": trades["lado"].to_numpy(),
+            "faixa": faixa.to_numpy(),
+            "ret": ret.to_numpy(),
+        }
+    )
+    df = df[df["faixa"].notna()]
+    if df.empty:
+        return {}
+    df["faixa"] = df["faixa"].astype(int)
+    df["ganho"] = df["ret"].where(df["ret"] > 0)
+    df["perda"] = df["ret"].where(df["ret"] <= 0)
+
+    agregacoes = dict(
+        numero_trades=("ret", "size"),
+        ganhos=("ganho", "count"),
+        ganho_medio=("ganho", "mean"),
+        ganho_maximo=("ganho", "max"),
+        ganho_minimo=("ganho", "min"),
+        perda_media=("perda", "mean"),
+        perda_maxima=("perda", "min"),
+        perda_minima=("perda", "max"),
+    )
+    por_acao = df.groupby(["acao_id", "lado", "faixa"], sort=False).agg(**agregacoes).reset_index()
+    globais = df.groupby(["lado", "faixa"], sort=False).agg(**agregacoes).reset_index()
+    globais.insert(0, "acao_id", None)
+    agg = pd.concat([por_acao, globais], ignore_index=True)
+
+    agg["hit_rate"] = 100.0 * agg["ganhos"] / agg["numero_trades"]
+    metricas = ["ganho_medio", "perda_media", "ganho_maximo", "ganho_minimo", "perda_maxima", "perda_minima"]
+    agg[metricas] = agg[metricas].fillna(0.0)
+
+    novos: Dict[Tuple[Optional[int], str, float, float], dict] = {}
+    for linha in agg.itertuples(index=False):
+        acao_id = None if pd.isna(linha.acao_id) else int(linha.acao_id)
+        chave = (acao_id, linha.lado, bins_probabilidade[linha.faixa], bins_probabilidade[linha.faixa + 1])
+        novos[chave] = {
+            "numero_trades": int(linha.numero_trades),
+            "hit_rate": float(linha.hit_rate),
+            **{m: float(getattr(linha, m)) for m in metricas},
+        }
+    return novos
 
-    # Agrupa por ação, lado e faixa de probabilidade
-    grupos: Dict[Tuple[Optional[int], str, float, float], List[TradeHistorico]] = {}
-
-    for t in trades:
-        prob = float(t.prob_no_momento or 0.0)
-        # determina faixa
-        faixa_min = None
-        faixa_max = None
-        for i in range(len(bins_probabilidade) - 1):
-            lo = bins_probabilidade[i]
-            hi = bins_probabilidade[i + 1]
-            if prob >= lo and prob < hi:
-                faixa_min = lo
-                faixa_max = hi
-                break
-        if faixa_min is None:
-            continue
 
-        key = (t.acao_id, t.lado, faixa_min, faixa_max)
-        grupos.setdefault(key, []).append(t)
+def recalcular_estatisticas_estrategia(
+    origem: str = "modelo_direcional_v1",
+    bins_probabilidade: Optional[List[float]] = None,
+    incremental: bool = True,
+) -> Dict[str, int]:
+    """
+    Recalcula estatísticas agregadas a partir de TradeHistorico (por ação e
+    globais). Como em persistir_trades, por padrão só grava as linhas que
+    mudaram.
+    """
+    colunas = ["acao_id", "lado", "prob_no_momento", "retorno_percentual"]
+    trades = pd.DataFrame.from_records(
+        TradeHistorico.objects.filter(origem=origem).values_list(*colunas),
+        columns=colunas,
+    )
+    novos = agregar_estatisticas(trades, bins_probabilidade)
+    return _persistir_estatisticas(novos, origem, incremental)
+
+
+def _persistir_estatisticas(
+    novos: Dict[Tuple[Optional[int], str, float, float], dict],
+    origem: str,
+    incremental: bool,
+) -> Dict[str, int]:
+    """Grava as estatísticas da origem: diff por (acao, lado, faixa) ou recriação completa."""
+    with transaction.atomic():
+        if incremental:
+            return sincronizar_por_chave(
+                EstatisticaEstrategia,
+                EstatisticaEstrategia.objects.filter(origem=origem),
+                ["acao_id", "lado", "faixa_prob_min", "faixa_prob_max"],
+                novos,
+                fixos={"origem": origem},
+                carimbo={"atualizado_em": timezone.now()},
+            )
 
-    objetos: List[EstatisticaEstrategia] = []
-    for (acao_id, lado, faixa_min, faixa_max), lista in grupos.items():
-        if not lista:
-            continue
-        rets = [float(x.retorno_percentual or 0.0) for x in lista]
-        ganhos = [r for r in rets if r > 0]
-        perdas = [r for r in rets if r <= 0]
-
-        numero_trades = len(rets)
-        hit_rate = 100.0 * len(ganhos) / numero_trades if numero_trades else 0.0
-        ganho_medio = float(np.mean(ganhos)) if ganhos else 0.0
-        perda_media = float(np.mean(perdas)) if perdas else 0.0
-        ganho_maximo = max(ganhos) if ganhos else 0.0
-        ganho_minimo = min(ganhos) if ganhos else 0.0
-        perda_maxima = min(perdas) if perdas else 0.0
-        perda_minima = max(perdas) if perdas else 0.0
-
-        objetos.append(
+        removidos, _ = EstatisticaEstrategia.objects.filter(origem=origem).delete()
+        objetos = [
             EstatisticaEstrategia(
                 acao_id=acao_id,
                 lado=lado,
                 faixa_prob_min=faixa_min,
                 faixa_prob_max=faixa_max,
-                numero_trades=numero_trades,
-                hit_rate=hit_rate,
-                ganho_medio=ganho_medio,
-                perda_media=perda_media,
-                ganho_maximo=ganho_maximo,
-                ganho_minimo=ganho_minimo,
-                perda_maxima=perda_maxima,
-                perda_minima=perda_minima,
                 origem=origem,
+                **valores,
             )
-        )
-
-    if objetos:
-        EstatisticaEstrategia.objects.bulk_create(objetos, batch_size=1000)
+            for (acao_id, lado, faixa_min, faixa_max), valores in novos.items()
+        ]
+        if objetos:
+            EstatisticaEstrategia.objects.bulk_create(objetos, batch_size=1000)
+        return {"inseridos": len(objetos), "atualizados": 0, "removidos": removidos}
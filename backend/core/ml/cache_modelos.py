@@ -0,0 +1,96 @@
+"""
+Cache de artefatos de modelo por processo.
+
+- Cada arquivo é desserializado uma vez por processo e reaproveitado nos
+  acessos seguintes enquanto a assinatura do arquivo (mtime, tamanho) não
+  mudar: o ganho é não refazer o unpickle a cada chamada (ex.: POST intraday
+  que roda call_command dentro do worker web).
+- O cache é do processo: cada worker do gunicorn (ou do pool) tem a sua
+  cópia. O joblib.load(mmap_mode="r") só mapeia do arquivo os arrays NumPy
+  que chegam ao objeto como foram gravados; os estimadores de árvore do
+  sklearn copiam os arrays dos nós ao desserializar, então esses modelos não
+  compartilham memória entre processos por aqui.
+- Se a assinatura mudou, o novo artefato é carregado e a referência trocada
+  de uma vez (quem já pegou a versão anterior continua com ela).
+- salvar_artefato grava em arquivo temporário e faz os.replace, então um
+  leitor nunca vê um arquivo pela metade.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import joblib
+
+
+_Assinatura = Tuple[int, int]
+
+_cache: Dict[str, Tuple[_Assinatura, Any]] = {}
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _assinatura(path: Path) -> _Assinatura:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def _lock_para(chave: str) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(chave)
+        if lock is None:
+            lock = _locks[chave] = threading.Lock()
+        return lock
+
+
+def carregar_artefato(path: str | Path, *, mmap: bool = True) -> Any:
+    """
+    Artefato em `path`, servido do cache do processo enquanto o arquivo não
+    mudar. Levanta FileNotFoundError se o arquivo não existir.
+    """
+    path = Path(path).resolve()
+    chave = str(path)
+    assinatura = _assinatura(path)
+
+    item = _cache.get(chave)
+    if item is not None and item[0] == assinatura:
+        return item[1]
+
+    # uma carga por arquivo de cada vez; quem esperou reaproveita a carga
+    with _lock_para(chave):
+        item = _cache.get(chave)
+        assinatura = _assinatura(path)
+        if item is not None and item[0] == assinatura:
+            return item[1]
+        obj = joblib.load(path, mmap_mode="r" if mmap else None)
+        _cache[chave] = (assinatura, obj)
+        return obj
+
+
+def salvar_artefato(obj: Any, path: str | Path) -> Path:
+    """
+    Grava o artefato de forma atômica (temporário + os.replace), sem
+    compressão. Os processos que usam o cache passam a enxergar a nova
+    versão no próximo acesso.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        joblib.dump(obj, tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return path
+
+
+def limpar_cache(path: Optional[str | Path] = None) -> None:
+    """Descarta o artefato de `path` (ou todos) do cache do processo."""
+    if path is None:
+        _cache.clear()
+    else:
+        _cache.pop(str(Path(path).resolve()), None)
@@ -0,0 +1,290 @@
+"""
+Feature store em disco para o modelo direcional.
+
+Um Parquet por ação (<FEATURE_STORE_DIR>/<VERSAO_FEATURES>/acao_id=<id>.parquet)
+com as colunas de cotação, as features de criar_features_direcionais e o
+label_direcional, desde DATA_INICIO_TREINO.
+
+- Atualização incremental: só as datas novas são calculadas, reaproveitando
+  as últimas LOOKBACK_FEATURES linhas gravadas como aquecimento das janelas
+  (todas as features olham só para trás; a maior janela é a sma_50).
+- Passado alterado no banco (backfill de lacunas, indicadores regravados):
+  linhas e somas das colunas até a última data gravada são comparadas com
+  cotacoes_cotacao; se divergirem, a ação é recalculada do zero.
+- Labels: uma linha só recebe label quando os LABEL_JANELA pregões
+  seguintes já existem; até lá fica nula e é rotulada na atualização em que
+  o lookahead se completa.
+- Mudou criar_features_direcionais ou a regra de label? Suba VERSAO_FEATURES:
+  o store novo é montado do zero em outro diretório.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max, Sum
+
+from core.models import Acao, Cotacao
+from core.ml.features_direcionais import criar_features_direcionais
+from core.ml.labeling_direcional import gerar_labels_direcionais
+from core.ml.utils_direcionais import COLUNAS_COTACAO_ML, DATA_INICIO_TREINO, carregar_cotacoes_universo
+
+
+logger = logging.getLogger(__name__)
+
+VERSAO_FEATURES = "v1"
+
+LABEL_JANELA = 10
+LABEL_ALVO = 0.05
+LOOKBACK_FEATURES = 60
+
+# colunas conferidas contra o banco para detectar histórico alterado
+COLUNAS_ASSINATURA = [c for c in COLUNAS_COTACAO_ML if c != "data"]
+
+
+def diretorio_store() -> Path:
+    base = getattr(settings, "FEATURE_STORE_DIR", None) or (
+        Path(settings.BASE_DIR) / "cache" / "features"
+    )
+    path = Path(base) / VERSAO_FEATURES
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _path(acao_id: int) -> Path:
+    return diretorio_store() / f"acao_id={int(acao_id)}.parquet"
+
+
+def ler_features(acao_id: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Linhas gravadas de uma ação, ordenadas por data (vazio se não houver)."""
+    arq = _path(acao_id)
+    if not arq.exists():
+        return pd.DataFrame()
+    try:
+        return pd.read_parquet(arq, columns=columns)
+    except Exception:
+        logger.warning("Feature store ilegível para acao_id=%s; ignorando", acao_id, exc_info=True)
+        return pd.DataFrame()
+
+
+def _gravar(acao_id: int, df: pd.DataFrame) -> None:
+    arq = _path(acao_id)
+    tmp = arq.with_name(f"{arq.name}.{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, arq)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _rotular_pendentes(df: pd.DataFrame) -> pd.DataFrame:
+    """Preenche label_direcional das linhas cujo lookahead de LABEL_JANELA pregões se completou."""
+    n = len(df)
+    if "label_direcional" not in df:
+        df["label_direcional"] = pd.Series([None] * n, dtype=object)
+    completas = np.arange(n) + LABEL_JANELA <= n - 1
+    pendentes = np.flatnonzero(df["label_direcional"].isna().to_numpy() & completas)
+    if len(pendentes) == 0:
+        return df
+
+    # o label de i só olha i+1..i+janela: basta a cauda a partir do 1º pendente
+    inicio = int(pendentes[0])
+    labels = gerar_labels_direcionais(
+        df.iloc[inicio:][["data", "fechamento", "maxima", "minima"]],
+        janela_pregoes=LABEL_JANELA,
+        alvo_percentual=LABEL_ALVO,
+    )
+    por_data = dict(zip(labels["data"], labels["label_direcional"]))
+    df.loc[df.index[pendentes], "label_direcional"] = df["data"].iloc[pendentes].map(por_data).to_numpy()
+    return df
+
+
+def estender(existente: pd.DataFrame, cotacoes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Acrescenta ao conteúdo gravado (`existente`) as datas de `cotacoes`
+    posteriores à última gravada, calculando features só para elas, e rotula
+    as linhas cujo lookahead se completou. Sem `existente`, monta do zero.
+    """
+    if cotacoes is None or cotacoes.empty:
+        return existente
+
+    cotacoes = cotacoes.sort_values("data")
+    if existente is None or existente.empty:
+        df, _ = criar_features_direcionais(cotacoes)
+        df["label_direcional"] = pd.Series([None] * len(df), dtype=object)
+        return _rotular_pendentes(df)
+
+    ultima = existente["data"].max()
+    novas = cotacoes[cotacoes["data"] > ultima]
+    if novas.empty:
+        return _rotular_pendentes(existente)
+
+    colunas_cotacao = [c for c in cotacoes.columns if c in existente.columns]
+    aquecimento = existente[colunas_cotacao].tail(LOOKBACK_FEATURES)
+    calc, _ = criar_features_direcionais(pd.concat([aquecimento, novas[colunas_cotacao]], ignore_index=True))
+    calc = calc[calc["data"] > ultima].copy()
+    calc["label_direcional"] = None
+
+    df = pd.concat([existente, calc[existente.columns]], ignore_index=True)
+    return _rotular_pendentes(df)
+
+
+def _atualizar_acao(acao_id: int, cotacoes: pd.DataFrame, reconstruir: bool) -> Tuple[int, int]:
+    """Atualiza o Parquet de uma ação. Retorna (acao_id, linhas novas)."""
+    existente = pd.DataFrame() if reconstruir else ler_features(acao_id)
+    antes = len(existente)
+    rotulados = int(existente["label_direcional"].notna().sum()) if antes else 0
+    df = estender(existente, cotacoes)
+    if df is None or df.empty:
+        return acao_id, 0
+    # grava se entrou data nova ou algum lookahead se completou
+    if reconstruir or len(df) != antes or int(df["label_direcional"].notna().sum()) != rotulados:
+        _gravar(acao_id, df)
+    return acao_id, len(df) - antes
+
+
+def _ultimas_no_banco(acao_ids: List[int]) -> Dict[int, date]:
+    """Último pregão desde DATA_INICIO_TREINO por ação; ações sem cotação ficam de fora."""
+    qs = (
+        Cotacao.objects.filter(acao_id__in=acao_ids, data__gte=DATA_INICIO_TREINO)
+        .values("acao_id")
+        .annotate(ultima=Max("data"))
+        .order_by()
+    )
+    return {r["acao_id"]: r["ultima"] for r in qs}
+
+
+def _assinaturas_banco(cortes: Dict[int, date]) -> Dict[int, np.ndarray]:
+    """
+    [linhas, soma de cada coluna de COLUNAS_ASSINATURA] das cotações de cada
+    ação entre DATA_INICIO_TREINO e seu corte (inclusive). Uma consulta
+    agregada por data de corte distinta (em geral, uma só).
+    """
+    por_corte: Dict[date, List[int]] = defaultdict(list)
+    for acao_id, corte in cortes.items():
+        por_corte[corte].append(acao_id)
+
+    saida: Dict[int, np.ndarray] = {}
+    for corte, ids in por_corte.items():
+        qs = (
+            Cotacao.objects.filter(acao_id__in=ids, data__gte=DATA_INICIO_TREINO, data__lte=corte)
+            .values("acao_id")
+            .annotate(linhas=Count("pk"), **{f"soma_{c}": Sum(c) for c in COLUNAS_ASSINATURA})
+            .order_by()
+        )
+        for r in qs:
+            saida[r["acao_id"]] = np.array(
+                [r["linhas"], *(float(r[f"soma_{c}"] or 0.0) for c in COLUNAS_ASSINATURA)]
+            )
+    return saida
+
+
+def _assinatura_store(df: pd.DataFrame) -> np.ndarray:
+    """Mesma assinatura de _assinaturas_banco, calculada sobre as linhas gravadas."""
+    return np.array([len(df), *(float(df[c].sum()) for c in COLUNAS_ASSINATURA)])
+
+
+def atualizar_store(
+    acao_ids: Optional[Iterable[int]] = None,
+    *,
+    reconstruir: bool = False,
+    workers: int = 1,
+) -> Dict[int, int]:
+    """
+    Leva o store até a última cotação, com corte por ação:
+
+    - sem cotação desde DATA_INICIO_TREINO: ignorada (não força recarga);
+    - sem arquivo, `reconstruir`, ou passado alterado no banco (backfill,
+      indicadores regravados pelo A02 — detectado comparando linhas e somas
+      até a última data gravada): recalculada desde DATA_INICIO_TREINO;
+    - demais: só as cotações posteriores à própria última data gravada.
+
+    Retorna {acao_id: linhas novas} das ações recalculadas ou estendidas.
+    """
+    if acao_ids is None:
+        acao_ids = Acao.objects.values_list("id", flat=True)
+    acao_ids = list(acao_ids)
+
+    ultimas_banco = _ultimas_no_banco(acao_ids)
+    sem_cotacao = len(acao_ids) - len(ultimas_banco)
+    if sem_cotacao:
+        logger.info("Feature store: %s ações sem cotações desde %s ignoradas", sem_cotacao, DATA_INICIO_TREINO)
+
+    refazer: List[int] = []
+    cortes: Dict[int, date] = {}
+    assinaturas: Dict[int, np.ndarray] = {}
+    for acao_id in ultimas_banco:
+        gravado = pd.DataFrame() if reconstruir else ler_features(acao_id, columns=["data", *COLUNAS_ASSINATURA])
+        if gravado.empty:
+            refazer.append(acao_id)
+            continue
+        cortes[acao_id] = pd.Timestamp(gravado["data"].max()).date()
+        assinaturas[acao_id] = _assinatura_store(gravado)
+
+    banco = _assinaturas_banco(cortes)
+    estender_ids: Dict[date, List[int]] = defaultdict(list)
+    for acao_id, corte in cortes.items():
+        # sem linhas até o corte no banco conta como histórico alterado
+        if acao_id not in banco or not np.allclose(banco[acao_id], assinaturas[acao_id], rtol=1e-9, atol=1e-6):
+            logger.info("Feature store: histórico da acao_id=%s mudou no banco; recalculando", acao_id)
+            refazer.append(acao_id)
+        elif ultimas_banco[acao_id] > corte:
+            estender_ids[corte].append(acao_id)
+
+    tarefas: List[Tuple[int, pd.DataFrame, bool]] = []
+    lotes = [(refazer, DATA_INICIO_TREINO, True)]
+    lotes += [(ids, corte + timedelta(days=1), False) for corte, ids in estender_ids.items()]
+    for ids, desde, do_zero in lotes:
+        if not ids:
+            continue
+        df_lote = carregar_cotacoes_universo(ids, data_inicio=desde)
+        for acao_id, df in df_lote.groupby("acao_id", sort=False):
+            tarefas.append((acao_id, df.drop(columns="acao_id").reset_index(drop=True), do_zero))
+        del df_lote
+
+    if workers <= 1 or len(tarefas) <= 1:
+        resultados = [_atualizar_acao(*tarefa) for tarefa in tarefas]
+    else:
+        connections.close_all()
+        ids, dfs, flags = zip(*tarefas)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_atualizar_acao, ids, dfs, flags))
+    return dict(resultados)
+
+
+def ler_universo(
+    acao_ids: Optional[Iterable[int]] = None,
+    *,
+    rotulados: bool = False,
+) -> pd.DataFrame:
+    """
+    Concatena o store das ações (todas, se `acao_ids` for None), com as
+    colunas `acao_id` e `ticker`. Com `rotulados`, só linhas com label.
+    """
+    acoes = Acao.objects.all()
+    if acao_ids is not None:
+        acoes = acoes.filter(id__in=list(acao_ids))
+    frames = []
+    for acao_id, ticker in acoes.order_by("id").values_list("id", "ticker"):
+        df = ler_features(acao_id)
+        if df.empty:
+            continue
+        if rotulados:
+            df = df[df["label_direcional"].notna()]
+        df["acao_id"] = acao_id
+        df["ticker"] = ticker
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from typing import Optional, Tuple
+from typing import Dict, Iterable, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
+from core.indicators import rolling_max, rolling_mean, rolling_min, rolling_std
+
 
 def _pct_change_safe(series: pd.Series, periods: int = 1) -> pd.Series:
     try:
@@ -44,9 +46,9 @@ def criar_features_direcionais(
     df["ret_10d"] = _pct_change_safe(close, periods=10)
 
     # Médias móveis simples
-    df["sma_9"] = close.rolling(window=9, min_periods=3).mean()
-    df["sma_21"] = close.rolling(window=21, min_periods=5).mean()
-    df["sma_50"] = close.rolling(window=50, min_periods=10).mean()
+    df["sma_9"] = rolling_mean(close, 9, min_periods=3)
+    df["sma_21"] = rolling_mean(close, 21, min_periods=5)
+    df["sma_50"] = rolling_mean(close, 50, min_periods=10)
 
     # Médias Welles Wilder já calculadas em tabela (se existirem)
     for col in ("wma17", "wma34", "wma72", "wma144", "wma602"):
@@ -59,8 +61,8 @@ def criar_features_direcionais(
         df["preco_sobre_sma50"] = np.where(long_ma != 0, close / long_ma, np.nan)
 
     # Volatilidade: desvio padrão dos retornos de 10 e 20 dias
-    df["vol_10d"] = df["ret_1d"].rolling(window=10, min_periods=5).std()
-    df["vol_20d"] = df["ret_1d"].rolling(window=20, min_periods=10).std()
+    df["vol_10d"] = rolling_std(df["ret_1d"], 10, min_periods=5)
+    df["vol_20d"] = rolling_std(df["ret_1d"], 20, min_periods=10)
 
     # ATR, se disponível
     if "atr" not in df.columns:
@@ -76,8 +78,8 @@ def criar_features_direcionais(
 
     # Posição no range 20 dias
     if "maxima" in df.columns and "minima" in df.columns:
-        max20 = df["maxima"].astype(float).rolling(window=20, min_periods=5).max()
-        min20 = df["minima"].astype(float).rolling(window=20, min_periods=5).min()
+        max20 = rolling_max(df["maxima"].astype(float), 20, min_periods=5)
+        min20 = rolling_min(df["minima"].astype(float), 20, min_periods=5)
         rng = max20 - min20
         with np.errstate(divide="ignore", invalid="ignore"):
             df["pos_range_20d"] = np.where(rng != 0, (close - min20) / rng, np.nan)
@@ -98,6 +100,46 @@ def criar_features_direcionais(
     return df, retorno_medio_selic_ativo
 
 
+def retornos_medios_janela_corridos(
+    df: pd.DataFrame,
+    horizontes: Iterable[int],
+) -> Dict[int, Optional[float]]:
+    """
+    Retorno médio em janelas de X dias corridos para vários X de uma vez.
+
+    Para cada data t e cada horizonte X, pega o preço em t e o da primeira
+    cotação com data >= t+X; o retorno médio de cada X é a média desses
+    retornos. Um único searchsorted resolve a matriz (horizontes × datas).
+    `df` deve estar ordenado por data. Horizontes <= 0 ou sem nenhuma janela
+    completa ficam com None.
+    """
+    horizontes = [int(h) for h in horizontes]
+    out: Dict[int, Optional[float]] = {h: None for h in horizontes}
+    validos = np.array([h for h in out if h > 0], dtype="int64")
+    if df is None or len(df) < 2 or len(validos) == 0:
+        return out
+
+    datas = pd.to_datetime(df["data"]).values
+    close = df["fechamento"].astype(float).values
+    n = len(datas)
+
+    alvos = datas[None, :] + validos[:, None].astype("timedelta64[D]")
+    j = datas.searchsorted(alvos.ravel(), side="left").reshape(alvos.shape)
+
+    # só entra quem tem cotação em t+X e preço base não nulo
+    ok = (j < n) & (close != 0)[None, :]
+    p1 = close[np.minimum(j, n - 1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        retornos = np.where(ok, p1 / close[None, :] - 1.0, 0.0)
+    contagem = ok.sum(axis=1)
+    soma = retornos.sum(axis=1)
+
+    for h, c, s in zip(validos.tolist(), contagem.tolist(), soma.tolist()):
+        if c:
+            out[h] = float(s / c)
+    return out
+
+
 def _calcular_retorno_medio_janela_corridos(
     df: pd.DataFrame,
     dias_corridos: int,
@@ -109,28 +151,4 @@ def _calcular_retorno_medio_janela_corridos(
     """
     if df is None or df.empty or dias_corridos <= 0:
         return None
-
-    datas = pd.to_datetime(df["data"]).values
-    close = df["fechamento"].astype(float).values
-
-    if len(datas) < 2:
-        return None
-
-    # Usa busca binária via searchsorted
-    retornos = []
-    for i in range(len(datas)):
-        data_ref = datas[i]
-        target = data_ref + np.timedelta64(dias_corridos, "D")
-        j = datas.searchsorted(target, side="left")
-        if j < len(datas):
-            p0 = close[i]
-            p1 = close[j]
-            if p0 and p0 != 0:
-                ret = (p1 / p0) - 1.0
-                retornos.append(ret)
-
-    if not retornos:
-        return None
-
-    return float(np.mean(retornos))
-
+    return retornos_medios_janela_corridos(df, [dias_corridos])[dias_corridos]
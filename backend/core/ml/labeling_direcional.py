@@ -3,7 +3,9 @@ from __future__ import annotations
 from datetime import date
 from typing import Optional
 
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
 
 def gerar_labels_direcionais(
@@ -37,57 +39,52 @@ def gerar_labels_direcionais(
     else:
         df_ref = df.copy()
 
-    labels = []
     n = len(df)
+    if n < 2 or janela_pregoes < 1:
+        return pd.DataFrame(columns=["data", "label_direcional"])
 
-    for idx_ref in df_ref.index:
-        # índice no df completo (mesmo que df_ref seja filtro)
-        i = idx_ref
-        if i >= n:
-            continue
-
-        # janela de lookahead
-        start = i + 1
-        end = min(i + 1 + janela_pregoes, n)
-        if start >= end:
-            # não há janelas futuras suficientes
-            continue
-
-        row = df.iloc[i]
-        p0 = float(row["fechamento"])
-        alvo_up = p0 * (1.0 + alvo_percentual)
-        alvo_down = p0 * (1.0 - alvo_percentual)
-
-        label = "NONE"
-        for j in range(start, end):
-            r = df.iloc[j]
-            high = float(r.get("maxima", r["fechamento"]))
-            low = float(r.get("minima", r["fechamento"]))
-
-            up_hit = high >= alvo_up
-            down_hit = low <= alvo_down
-
-            if up_hit and not down_hit:
-                label = "UP_FIRST"
-                break
-            if down_hit and not up_hit:
-                label = "DOWN_FIRST"
-                break
-            # quando atinge ambos no mesmo pregão, não sabemos a ordem → mantém NONE
-
-        labels.append(
-            {
-                "data": row["data"],
-                "label_direcional": label,
-            }
-        )
-
-    if not labels:
+    fech = pd.to_numeric(df["fechamento"], errors="coerce").to_numpy(dtype=float)
+    high = pd.to_numeric(df["maxima"], errors="coerce").to_numpy(dtype=float) if "maxima" in df else fech
+    low = pd.to_numeric(df["minima"], errors="coerce").to_numpy(dtype=float) if "minima" in df else fech
+
+    # matriz (n, janela) com as máximas/mínimas dos próximos pregões de cada
+    # linha; o fim da série é completado com NaN, que nunca atinge alvo
+    pad = np.full(janela_pregoes, np.nan)
+    highs = sliding_window_view(np.concatenate([high[1:], pad]), janela_pregoes)
+    lows = sliding_window_view(np.concatenate([low[1:], pad]), janela_pregoes)
+
+    alvo_up = fech * (1.0 + alvo_percentual)
+    alvo_down = fech * (1.0 - alvo_percentual)
+    with np.errstate(invalid="ignore"):
+        up_hit = highs >= alvo_up[:, None]
+        down_hit = lows <= alvo_down[:, None]
+
+    # só conta o pregão que atinge um lado apenas; quando atinge ambos no
+    # mesmo pregão não sabemos a ordem → segue para o próximo (se nenhum
+    # decidir, fica NONE)
+    so_up = up_hit & ~down_hit
+    decisivo = so_up | (down_hit & ~up_hit)
+    primeiro = decisivo.argmax(axis=1)
+    up_first = so_up[np.arange(n), primeiro]
+    label = np.where(
+        decisivo.any(axis=1),
+        np.where(up_first, "UP_FIRST", "DOWN_FIRST"),
+        "NONE",
+    )
+
+    # a última linha não tem pregão futuro
+    ref = df_ref.index.to_numpy()
+    ref = ref[ref < n - 1]
+    if len(ref) == 0:
         return pd.DataFrame(columns=["data", "label_direcional"])
 
-    out = pd.DataFrame(labels)
+    out = pd.DataFrame(
+        {
+            "data": df["data"].to_numpy()[ref],
+            "label_direcional": label[ref],
+        }
+    )
     out["data"] = pd.to_datetime(out["data"])
     out.sort_values("data", inplace=True)
     out.reset_index(drop=True, inplace=True)
     return out
-
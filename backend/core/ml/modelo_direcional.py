@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import date
 from pathlib import Path
@@ -8,12 +9,16 @@ from typing import Dict, Iterable, List, Optional, Tuple
 import numpy as np
 import pandas as pd
 from django.conf import settings
+from django.db import connections
 
 from core.models import Acao
+from core.ml.cache_modelos import carregar_artefato, salvar_artefato
 from core.ml.labeling_direcional import gerar_labels_direcionais
-from core.ml.features_direcionais import criar_features_direcionais
+from core.ml.features_direcionais import criar_features_direcionais, retornos_medios_janela_corridos
+from core.ml import feature_store
 from core.ml.utils_direcionais import (
-    carregar_cotacoes_acao,
+    DATA_INICIO_TREINO,
+    carregar_cotacoes_universo,
     calcular_dias_equivalentes_selic,
     get_selic_anual_atual,
 )
@@ -22,7 +27,6 @@ try:
     from sklearn.ensemble import GradientBoostingClassifier
     from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
     from sklearn.preprocessing import LabelEncoder
-    import joblib
 except ImportError as exc:  # pragma: no cover - ambiente sem dependências de ML
     raise ImportError(
         "Dependências de ML não estão instaladas. "
@@ -30,9 +34,6 @@ except ImportError as exc:  # pragma: no cover - ambiente sem dependências de M
     ) from exc
 
 
-DATA_INICIO_TREINO = date(2022, 1, 1)
-
-
 @dataclass
 class ArtefatoModeloDirecional:
     model: GradientBoostingClassifier
@@ -40,70 +41,119 @@ class ArtefatoModeloDirecional:
     classes_: List[str]  # ordem das colunas de probabilidade
 
 
+def _dataset_acao(
+    acao_id: int,
+    ticker: str,
+    df_cot: pd.DataFrame,
+    dias_equivalentes_selic: int,
+) -> Tuple[int, Optional[pd.DataFrame], Optional[float]]:
+    """Features + labels de uma ação (sem acesso ao banco; roda no pool)."""
+    # Labels
+    df_labels = gerar_labels_direcionais(
+        df_cot,
+        janela_pregoes=10,
+        alvo_percentual=0.05,
+        data_inicio=DATA_INICIO_TREINO,
+    )
+    if df_labels.empty:
+        return acao_id, None, None
+
+    # Features
+    df_feat, ret_medio = criar_features_direcionais(
+        df_cot,
+        dias_equivalentes_selic=dias_equivalentes_selic,
+    )
+
+    # Merge por data
+    df_feat["data"] = pd.to_datetime(df_feat["data"])
+    df_labels["data"] = pd.to_datetime(df_labels["data"])
+    df_merged = pd.merge(
+        df_feat,
+        df_labels,
+        on="data",
+        how="inner",
+        suffixes=("", "_label"),
+    )
+    if df_merged.empty:
+        return acao_id, None, ret_medio
+
+    # Adiciona identificadores
+    df_merged["acao_id"] = acao_id
+    df_merged["ticker"] = ticker
+    return acao_id, df_merged, ret_medio
+
+
+def _universo_ids(universo: Optional[Iterable[Acao]]) -> List[Tuple[int, str]]:
+    if universo is None:
+        universo = Acao.objects.all()
+    if hasattr(universo, "values_list"):
+        return list(universo.values_list("id", "ticker"))
+    return [(acao.id, acao.ticker) for acao in universo]
+
+
 def montar_dataset_direcional(
     universo: Optional[Iterable[Acao]] = None,
     dias_equivalentes_selic: Optional[int] = None,
+    workers: int = 1,
 ) -> Tuple[pd.DataFrame, Dict[int, float], int]:
     """
     Monta dataset unificado (todas as ações) com features + label_direcional.
 
+    As cotações do universo desde DATA_INICIO_TREINO vêm de uma única
+    consulta (carregar_cotacoes_universo), são separadas por acao_id e cada
+    ação tem features e labels calculados à parte; com `workers` > 1 isso
+    roda num pool de processos. O concat acontece uma vez, no fim.
+
     Retorna:
         df_merged: DataFrame com colunas ['acao_id', 'ticker', 'data', ..., 'label_direcional']
         retorno_medio_por_acao: dict {acao_id: retorno_medio_selic_ativo}
         dias_equivalentes_selic: valor inteiro efetivamente utilizado
     """
-    if universo is None:
-        universo = Acao.objects.all()
+    acoes = _universo_ids(universo)
 
     if dias_equivalentes_selic is None:
         selic = get_selic_anual_atual()
         dias_equivalentes_selic = calcular_dias_equivalentes_selic(selic) or 0
 
     retorno_medio_por_acao: Dict[int, float] = {}
-    frames: List[pd.DataFrame] = []
-
-    for acao in universo:
-        df_cot = carregar_cotacoes_acao(acao, data_inicio=DATA_INICIO_TREINO)
-        if df_cot.empty:
-            continue
-
-        # Labels
-        df_labels = gerar_labels_direcionais(
-            df_cot,
-            janela_pregoes=10,
-            alvo_percentual=0.05,
-            data_inicio=DATA_INICIO_TREINO,
-        )
-        if df_labels.empty:
-            continue
+    if not acoes:
+        return pd.DataFrame(), retorno_medio_por_acao, dias_equivalentes_selic
 
-        # Features
-        df_feat, ret_medio = criar_features_direcionais(
-            df_cot,
-            dias_equivalentes_selic=dias_equivalentes_selic,
-        )
+    df_universo = carregar_cotacoes_universo(
+        None if universo is None else [acao_id for acao_id, _ in acoes],
+        data_inicio=DATA_INICIO_TREINO,
+    )
+    grupos = {
+        acao_id: df.drop(columns="acao_id").reset_index(drop=True)
+        for acao_id, df in df_universo.groupby("acao_id", sort=False)
+    }
+    del df_universo
+
+    tarefas = [(acao_id, ticker, grupos[acao_id]) for acao_id, ticker in acoes if acao_id in grupos]
+    if workers <= 1 or len(tarefas) <= 1:
+        resultados = [_dataset_acao(*tarefa, dias_equivalentes_selic) for tarefa in tarefas]
+    else:
+        # workers não usam o banco, mas não devem herdar a conexão do pai (fork)
+        connections.close_all()
+        ids, tickers, dfs = zip(*tarefas)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(
+                pool.map(
+                    _dataset_acao,
+                    ids,
+                    tickers,
+                    dfs,
+                    [dias_equivalentes_selic] * len(ids),
+                    chunksize=max(1, len(ids) // (workers * 4)),
+                )
+            )
 
+    frames: List[pd.DataFrame] = []
+    for acao_id, df_merged, ret_medio in resultados:
         if ret_medio is not None:
-            retorno_medio_por_acao[acao.id] = float(ret_medio)
-
-        # Merge por data
-        df_feat["data"] = pd.to_datetime(df_feat["data"])
-        df_labels["data"] = pd.to_datetime(df_labels["data"])
-        df_merged = pd.merge(
-            df_feat,
-            df_labels,
-            on="data",
-            how="inner",
-            suffixes=("", "_label"),
-        )
-
-        if df_merged.empty:
-            continue
-
-        # Adiciona identificadores
-        df_merged["acao_id"] = acao.id
-        df_merged["ticker"] = acao.ticker
-        frames.append(df_merged)
+            retorno_medio_por_acao[acao_id] = float(ret_medio)
+        if df_merged is not None:
+            frames.append(df_merged)
 
     if not frames:
         return pd.DataFrame(), retorno_medio_por_acao, dias_equivalentes_selic
@@ -116,6 +166,45 @@ def montar_dataset_direcional(
     return full, retorno_medio_por_acao, dias_equivalentes_selic
 
 
+def montar_dataset_do_store(
+    universo: Optional[Iterable[Acao]] = None,
+    dias_equivalentes_selic: Optional[int] = None,
+    workers: int = 1,
+) -> Tuple[pd.DataFrame, Dict[int, float], int]:
+    """
+    Mesmo retorno de montar_dataset_direcional, lido do feature store: o
+    store é atualizado (só datas novas) e entram as linhas já rotuladas,
+    isto é, com os 10 pregões de lookahead completos.
+    """
+    acoes = _universo_ids(universo)
+    ids = [acao_id for acao_id, _ in acoes]
+
+    if dias_equivalentes_selic is None:
+        selic = get_selic_anual_atual()
+        dias_equivalentes_selic = calcular_dias_equivalentes_selic(selic) or 0
+
+    retorno_medio_por_acao: Dict[int, float] = {}
+    if not ids:
+        return pd.DataFrame(), retorno_medio_por_acao, dias_equivalentes_selic
+
+    feature_store.atualizar_store(ids, workers=workers)
+    full = feature_store.ler_universo(ids)
+    if full.empty:
+        return pd.DataFrame(), retorno_medio_por_acao, dias_equivalentes_selic
+
+    if dias_equivalentes_selic:
+        for acao_id, df in full.groupby("acao_id", sort=False):
+            ret = retornos_medios_janela_corridos(df, [dias_equivalentes_selic])[dias_equivalentes_selic]
+            if ret is not None:
+                retorno_medio_por_acao[acao_id] = float(ret)
+
+    full = full[full["label_direcional"].notna()].copy()
+    full["data"] = pd.to_datetime(full["data"])
+    full.sort_values(["data", "ticker"], inplace=True)
+    full.reset_index(drop=True, inplace=True)
+    return full, retorno_medio_por_acao, dias_equivalentes_selic
+
+
 def split_temporal(
     df: pd.DataFrame,
     data_treino_fim: date = date(2023, 12, 31),
@@ -284,15 +373,14 @@ def salvar_modelo(artefato: ArtefatoModeloDirecional, path: Optional[str | Path]
         "feature_names": artefato.feature_names,
         "classes_": artefato.classes_,
     }
-    joblib.dump(payload, path)
-    return path
+    return salvar_artefato(payload, path)
 
 
 def carregar_modelo(path: Optional[str | Path] = None) -> ArtefatoModeloDirecional:
     if path is None:
         path = _default_model_path()
-    path = Path(path)
-    payload = joblib.load(path)
+    # cache por processo: só desserializa de novo quando o arquivo muda
+    payload = carregar_artefato(path)
     return ArtefatoModeloDirecional(
         model=payload["model"],
         feature_names=list(payload["feature_names"]),
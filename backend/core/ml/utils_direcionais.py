@@ -1,22 +1,25 @@
 from __future__ import annotations
 
 import math
+from itertools import islice
 from dataclasses import dataclass
 from datetime import date, timedelta
 from decimal import Decimal
-from typing import Optional
+from typing import Iterable, Optional
 
 import pandas as pd
-import yfinance as yf
 from django.db.models import QuerySet
 
 from core.models import Acao, Cotacao, Cliente
-from core.mt5_client import MT5Client
+from core.services.market_cache import get_day_quotes
+from core.services.market_data import get_provider, get_provider_cliente
 from core.views import BCB_SERIES, _fetch_bcb_series_latest
 
 
 SELIG_KEY = "selic"
 
+DATA_INICIO_TREINO = date(2022, 1, 1)
+
 
 def get_selic_anual_atual() -> Optional[float]:
     """
@@ -78,77 +81,66 @@ class PrecoAtual:
     preco: Optional[float]
     maxima: Optional[float]
     minima: Optional[float]
-    origem: str  # "mt5" | "yfinance" | "indefinido"
+    origem: str  # "mt5" | "yfinance" | "replay" | "indefinido"
 
 
 def get_preco_atual_base_b3(ticker_base: str) -> PrecoAtual:
     """
     Retorna preço atual para um ticker da B3 no formato base (ex: PETR4),
     tentando primeiro via MT5 (API interna) e, em caso de falha, usando
-    yfinance como fallback.
+    o provider de dados de mercado configurado como fallback.
     """
     ticker_base = (ticker_base or "").strip().upper()
     if not ticker_base:
         return PrecoAtual(None, None, None, origem="indefinido")
 
     # 1) Tenta via MT5 em um IP de referência
-    ip = _get_referencia_mt5_ip()
-    if ip:
+    provider = get_provider_cliente(_get_referencia_mt5_ip())
+    if provider is not None:
         try:
-            client = MT5Client(ip)
-            resp = client.cotacao(ticker_base)
-            if resp.ok and isinstance(resp.data, dict):
-                data = resp.data
-                preco = data.get("last") or data.get("ask") or data.get("bid")
-                maxima = data.get("high")
-                minima = data.get("low")
-                def _to_float(x):
-                    try:
-                        return float(x)
-                    except (TypeError, ValueError):
-                        return None
-                preco_f = _to_float(preco)
-                max_f = _to_float(maxima)
-                min_f = _to_float(minima)
-                if preco_f is not None:
-                    return PrecoAtual(preco_f, max_f, min_f, origem="mt5")
+            info = provider.day_quotes([ticker_base]).get(ticker_base, {})
+            if info.get("preco") is not None:
+                return PrecoAtual(
+                    info["preco"], info.get("maxima"), info.get("minima"), origem="mt5"
+                )
         except Exception:
             # falha silenciosa → tenta fallback
             pass
 
-    # 2) Fallback yfinance
-    ticker_yp = f"{ticker_base}.SA"
+    # 2) Fallback no provider configurado (via cache compartilhado)
     try:
-        data = yf.download(
-            tickers=[ticker_yp],
-            period="1d",
-            interval="1d",
-            progress=False,
-            auto_adjust=False,
-        )
-        if isinstance(data, pd.DataFrame) and not data.empty:
-            last = data.iloc[-1]
-
-            def _get_value(row: pd.Series, column: str) -> Optional[float]:
-                try:
-                    if isinstance(row.index, pd.MultiIndex):
-                        raw = row[(column, ticker_yp)]
-                    else:
-                        raw = row[column]
-                    return float(raw)
-                except Exception:
-                    return None
-
-            preco = _get_value(last, "Close")
-            maxima = _get_value(last, "High")
-            minima = _get_value(last, "Low")
-            return PrecoAtual(preco, maxima, minima, origem="yfinance")
+        info = get_day_quotes([ticker_base]).get(ticker_base)
+        if info:
+            return PrecoAtual(
+                info.get("preco"),
+                info.get("maxima"),
+                info.get("minima"),
+                origem=get_provider().nome,
+            )
     except Exception:
         pass
 
     return PrecoAtual(None, None, None, origem="indefinido")
 
 
+COLUNAS_COTACAO_ML = [
+    "data",
+    "abertura",
+    "fechamento",
+    "minima",
+    "maxima",
+    "volume",
+    "wma17",
+    "wma34",
+    "wma72",
+    "wma144",
+    "wma602",
+    "rsi_14",
+    "media_volume_20d",
+    "atr",
+]
+
+
 def carregar_cotacoes_acao(acao: Acao, data_inicio: Optional[date] = None) -> pd.DataFrame:
     """
     Carrega histórico de cotações de uma ação como DataFrame,
@@ -158,24 +150,7 @@ def carregar_cotacoes_acao(acao: Acao, data_inicio: Optional[date] = None) -> pd
     if data_inicio:
         qs = qs.filter(data__gte=data_inicio)
     qs = qs.order_by("data")
-    registros = list(
-        qs.values(
-            "data",
-            "abertura",
-            "fechamento",
-            "minima",
-            "maxima",
-            "volume",
-            "wma17",
-            "wma34",
-            "wma72",
-            "wma144",
-            "wma602",
-            "rsi_14",
-            "media_volume_20d",
-            "atr",
-        )
-    )
+    registros = list(qs.values(*COLUNAS_COTACAO_ML))
     if not registros:
         return pd.DataFrame()
     df = pd.DataFrame(registros)
@@ -184,3 +159,38 @@ def carregar_cotacoes_acao(acao: Acao, data_inicio: Optional[date] = None) -> pd
     df.reset_index(drop=True, inplace=True)
     return df
 
+
+def carregar_cotacoes_universo(
+    acao_ids: Optional[Iterable[int]] = None,
+    data_inicio: Optional[date] = None,
+    chunk_size: int = 50_000,
+) -> pd.DataFrame:
+    """
+    Cotações de várias ações (todas, se `acao_ids` for None) em uma única
+    consulta, lida em streaming e convertida para float bloco a bloco, em vez
+    de uma consulta e um DataFrame de Decimals por ação.
+    Colunas: acao_id + COLUNAS_COTACAO_ML, ordenado por (acao_id, data).
+    """
+    qs = Cotacao.objects.all()
+    if acao_ids is not None:
+        qs = qs.filter(acao_id__in=list(acao_ids))
+    if data_inicio:
+        qs = qs.filter(data__gte=data_inicio)
+    colunas = ["acao_id", *COLUNAS_COTACAO_ML]
+    linhas = qs.order_by("acao_id", "data").values_list(*colunas).iterator(chunk_size=chunk_size)
+
+    blocos = []
+    while True:
+        bloco = list(islice(linhas, chunk_size))
+        if not bloco:
+            break
+        df = pd.DataFrame.from_records(bloco, columns=colunas)
+        numericas = colunas[2:]
+        df[numericas] = df[numericas].astype(float)
+        blocos.append(df)
+
+    if not blocos:
+        return pd.DataFrame(columns=colunas)
+    df = pd.concat(blocos, ignore_index=True)
+    df["data"] = pd.to_datetime(df["data"])
+    return df
@@ -111,6 +111,10 @@ class RecomendacaoDiaria(models.Model):
     data_alvo = models.DateField(null=True, blank=True)
     fechamento_alvo = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     perc_alvo_realizado = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    # último pregão já conferido pelo A03VerificaAlvos (marca d'água da verificação)
+    # tabela não gerenciada: a coluna vem de sql/2026-10-18_recomendacaodiaria_verificado_ate.sql
+    # (aplicar antes do deploy; ver sql/README.md)
+    verificado_ate = models.DateField(null=True, blank=True)
 
     origem = models.CharField(
         max_length=10,
@@ -278,6 +282,39 @@ class EstatisticaEstrategia(models.Model):
         return f"{acao} {self.lado} ({self.faixa_prob_min}-{self.faixa_prob_max})"
 
 
+class EstadoJanelaAcao(models.Model):
+    """
+    Snapshot por ação da janela móvel usada no scoring (mantido pelo A02):
+    agregados de ~80 pregões já calculados e o buffer das últimas linhas.
+    """
+    acao = models.OneToOneField(Acao, on_delete=models.DO_NOTHING, db_constraint=False, primary_key=True)
+    data = models.DateField()  # último pregão incluído no snapshot
+
+    rsi_4m = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    max_4m = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    min_4m = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    obv_5d = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+
+    # retorno médio em janelas de N dias corridos (histórico inteiro), por N,
+    # calculado até o pregão retorno_medio_ate (estendido a cada pregão novo)
+    dias_equivalentes_selic = models.IntegerField(null=True, blank=True)
+    retorno_medio_selic_ativo = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    retorno_medio_ate = models.DateField(null=True, blank=True)
+
+    janela_json = models.TextField()  # JSON list: últimas linhas de cotação/indicadores
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "cotacoes_estado_janela"
+        managed = False  # DDL em sql/2026-10-18_cotacoes_estado_janela.sql
+        indexes = [
+            models.Index(fields=["data"]),
+        ]
+
+    def __str__(self):
+        return f"{self.acao_id} {self.data}"
+
+
 # =======================
 # Clientes / Operações
 # =======================
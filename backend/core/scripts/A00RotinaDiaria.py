@@ -3,12 +3,16 @@ import A02CalculaMedias as medias
 import A03VerificaAlvos as alvo
 import A03Recomendcoes_intraday as recomenda
 
+from core.ml.feature_store import atualizar_store
+
 
 def main():
     print("=== CARGA DE COTAÇÕES ===")
     carga.atualizar_cotacoes(0)
     print("=== CALCULO DE MÉDIAS ===")
     medias.calcular_todas()
+    print("=== FEATURE STORE ===")
+    atualizar_store()
     print("=== VERIFICA ALVOS ===")
     alvo.verificar_alvos_recomendacoes()
     print("=== RELATORIO DE RECOMENDACOES ===")
@@ -3,7 +3,6 @@ import sys
 import django
 import pandas as pd
 import numpy as np
-import joblib
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
@@ -14,6 +13,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 django.setup()
 
 from cotacoes.models import Cotacao
+from core.ml.cache_modelos import salvar_artefato
 
 
 def treinar_modelo():
@@ -98,7 +98,7 @@ def treinar_modelo():
     # 💾 Salva o modelo
     os.makedirs("modelos", exist_ok=True)
     caminho = "modelos/modelo_random_forest.pkl"
-    joblib.dump(modelo, caminho)
+    salvar_artefato(modelo, caminho)
     print(f"\n✅ Modelo salvo com sucesso em: {caminho}")
 
 
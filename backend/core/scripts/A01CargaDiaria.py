@@ -1,5 +1,4 @@
 from decimal import Decimal
-import yfinance as yf
 import pandas as pd
 from datetime import timedelta
 import os
@@ -17,6 +16,8 @@ import django
 django.setup()
 
 from core.models import Acao, Cotacao
+from core.services.bulk_upsert import bulk_upsert
+from core.services.market_cache import get_daily_bars
 
 def get_dia_util(offset=0):
     hoje = pd.Timestamp.today(tz='America/Sao_Paulo').normalize()
@@ -36,56 +37,170 @@ def safe_decimal(value):
     except:
         return None
 
-def atualizar_cotacoes(dia_offset):
-    data = get_dia_util(dia_offset)
-    acoes = Acao.objects.all()
 
-    for acao in acoes:
-        print(f"\n📈 Buscando {acao.ticker} para o dia {data}...")
+CAMPOS_OHLCV = ['abertura', 'fechamento', 'minima', 'maxima', 'volume']
 
-        if Cotacao.objects.filter(acao=acao, data=data).exists():
-            print(f"✔️ Cotação de {acao.ticker} em {data} já está salva")
-            continue
 
-        try:
-            df = yf.download(f"{acao.ticker}.SA", start=data, end=data + timedelta(days=1), progress=False)
+def montar_cotacao(acao_id, data, row):
+    """Converte uma linha OHLCV do yfinance em Cotacao (None se incompleta)."""
+    abertura = safe_decimal(row['Open'])
+    fechamento = safe_decimal(row['Close'])
+    minima = safe_decimal(row['Low'])
+    maxima = safe_decimal(row['High'])
+    volume = int(row['Volume']) if pd.notna(row['Volume']) else 0
 
-            if isinstance(df.columns, pd.MultiIndex):
-                df.columns = df.columns.droplevel(1)
+    if None in [abertura, fechamento, minima, maxima]:
+        return None
 
-            if df.empty or data.strftime('%Y-%m-%d') not in df.index.strftime('%Y-%m-%d'):
-                print(f"⚠ Nenhum dado disponível para {acao.ticker} no dia {data}")
-                continue
+    return Cotacao(
+        acao_id=acao_id,
+        data=data,
+        abertura=abertura,
+        fechamento=fechamento,
+        minima=minima,
+        maxima=maxima,
+        volume=volume,
+    )
 
-            row = df.iloc[0]
 
-            abertura = safe_decimal(row['Open'])
-            fechamento = safe_decimal(row['Close'])
-            minima = safe_decimal(row['Low'])
-            maxima = safe_decimal(row['High'])
-            volume = int(row['Volume']) if pd.notna(row['Volume']) else 0
+def salvar_cotacoes(cotacoes):
+    """Upsert em lote das cotações (chave única acao/data)."""
+    return bulk_upsert(
+        Cotacao,
+        cotacoes,
+        unique_fields=['acao', 'data'],
+        update_fields=CAMPOS_OHLCV,
+    )
 
-            if None in [abertura, fechamento, minima, maxima]:
-                print(f"⚠ Dados incompletos para {acao.ticker} em {data}")
-                continue
 
-            Cotacao.objects.update_or_create(
-                acao=acao,
-                data=data,
-                defaults={
-                    'abertura': abertura,
-                    'fechamento': fechamento,
-                    'minima': minima,
-                    'maxima': maxima,
-                    'volume': volume
-                }
-            )
-            print(f"✅ Cotação de {acao.ticker} salva com sucesso")
-
-        except Exception as e:
-            print(f"❌ Erro ao processar {acao.ticker}: {e}")
+def atualizar_cotacoes(dia_offset, batch_size=50):
+    data = get_dia_util(dia_offset)
+
+    acoes = {
+        (ticker or '').strip().upper(): acao_id
+        for ticker, acao_id in Acao.objects.values_list('ticker', 'id')
+        if ticker
+    }
+    # uma única consulta para saber quem já tem cotação no dia
+    ja_salvas = set(Cotacao.objects.filter(data=data).values_list('acao_id', flat=True))
+    faltando = {ticker: acao_id for ticker, acao_id in acoes.items() if acao_id not in ja_salvas}
+
+    print(f"\n📈 {len(ja_salvas)} cotações já salvas em {data}; buscando {len(faltando)} ações...")
+    if not faltando:
+        return
+
+    barras = get_daily_bars(
+        faltando.keys(),
+        start=data,
+        end=data + timedelta(days=1),
+        batch_size=batch_size,
+    )
+
+    dia = pd.Timestamp(data)
+    cotacoes = []
+    for ticker, acao_id in faltando.items():
+        df = barras.get(ticker)
+        if df is None or dia not in df.index:
+            print(f"⚠ Nenhum dado disponível para {ticker} no dia {data}")
             continue
 
+        cotacao = montar_cotacao(acao_id, data, df.loc[dia])
+        if cotacao is None:
+            print(f"⚠ Dados incompletos para {ticker} em {data}")
+            continue
+        cotacoes.append(cotacao)
+
+    try:
+        total = salvar_cotacoes(cotacoes)
+        print(f"✅ {total} cotações salvas para {data}")
+    except Exception as e:
+        print(f"❌ Erro ao salvar cotações de {data}: {e}")
+
+def detectar_lacunas(data_inicio, data_fim):
+    """
+    Retorna {acao_id: [datas faltantes]} entre data_inicio e data_fim,
+    comparando o universo com os pares (acao, data) já gravados em
+    cotacoes_cotacao em uma única consulta.
+
+    O calendário esperado são os pregões que já existem no banco para
+    alguma ação (feriados da B3 nunca aparecem ali, então não viram lacuna)
+    mais os dias úteis depois do último pregão gravado no intervalo, que
+    cobrem uma carga diária que falhou para todo o universo.
+    """
+    acao_ids = list(Acao.objects.values_list('id', flat=True))
+    gravados = list(
+        Cotacao.objects
+        .filter(data__range=(data_inicio, data_fim))
+        .values_list('acao_id', 'data')
+    )
+    pregoes = {data for _, data in gravados}
+    inicio_cauda = max(pregoes) + timedelta(days=1) if pregoes else data_inicio
+    calendario = sorted(pregoes | {d.date() for d in pd.bdate_range(inicio_cauda, data_fim)})
+    if not calendario or not acao_ids:
+        return {}
+
+    esperado = pd.MultiIndex.from_product([acao_ids, calendario], names=['acao_id', 'data'])
+    existentes = pd.MultiIndex.from_tuples(gravados, names=['acao_id', 'data'])
+
+    faltantes = esperado.difference(existentes)
+    lacunas = {}
+    for acao_id, data in faltantes:
+        lacunas.setdefault(acao_id, []).append(data)
+    return lacunas
+
+
+def backfill_cotacoes(data_inicio, data_fim=None, batch_size=50):
+    """
+    Preenche as lacunas de cotações no intervalo: cada ação baixa seu
+    intervalo faltante em um único download (agrupando em lote as ações
+    com o mesmo intervalo) e tudo é gravado com um upsert em lote.
+    """
+    if data_fim is None:
+        data_fim = get_dia_util(0)
+
+    lacunas = detectar_lacunas(data_inicio, data_fim)
+    total_faltantes = sum(len(d) for d in lacunas.values())
+    print(f"\n🔎 {total_faltantes} pares (ação, data) faltantes em {len(lacunas)} ações entre {data_inicio} e {data_fim}")
+    if not lacunas:
+        return 0
+
+    tickers = {
+        acao_id: (ticker or '').strip().upper()
+        for acao_id, ticker in Acao.objects.filter(id__in=lacunas.keys()).values_list('id', 'ticker')
+    }
+
+    # ações com o mesmo intervalo faltante compartilham o download multi-ticker
+    por_intervalo = {}
+    for acao_id, datas in lacunas.items():
+        if not tickers.get(acao_id):
+            continue
+        por_intervalo.setdefault((min(datas), max(datas)), []).append(acao_id)
+
+    cotacoes = []
+    for (inicio, fim), ids in por_intervalo.items():
+        barras = get_daily_bars(
+            [tickers[i] for i in ids],
+            start=inicio,
+            end=fim + timedelta(days=1),
+            batch_size=batch_size,
+        )
+        for acao_id in ids:
+            df = barras.get(tickers[acao_id])
+            if df is None:
+                print(f"⚠ Nenhum dado disponível para {tickers[acao_id]} entre {inicio} e {fim}")
+                continue
+            faltantes = set(lacunas[acao_id])
+            for dia, row in df.iterrows():
+                if dia.date() not in faltantes:
+                    continue
+                cotacao = montar_cotacao(acao_id, dia.date(), row)
+                if cotacao is not None:
+                    cotacoes.append(cotacao)
+
+    total = salvar_cotacoes(cotacoes)
+    print(f"✅ {total} cotações inseridas no backfill")
+    return total
+
 if __name__ == '__main__':
     DIA_OFFSET = 0 # Altere para -1, -2, etc. conforme necessário
     atualizar_cotacoes(DIA_OFFSET)
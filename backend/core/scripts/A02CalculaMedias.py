@@ -1,7 +1,9 @@
 import django
 import os
 import sys
+import time
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from decimal import Decimal, InvalidOperation
 
 # Caminho absoluto da pasta raiz do projeto
@@ -13,23 +15,21 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 django.setup()
 
 
-from core.models import Cotacao, Acao
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Max
 
-# ... cabeçalho permanece igual ...
-
-from core.models import Cotacao, Acao
-
-def wilder_moving_average(series, period):
-    return series.ewm(alpha=1/period, adjust=False).mean()
-
-def calcular_rsi(series, period=14):
-    delta = series.diff()
-    ganho = delta.where(delta > 0, 0)
-    perda = -delta.where(delta < 0, 0)
-    media_ganho = ganho.ewm(alpha=1/period, adjust=False).mean()
-    media_perda = perda.ewm(alpha=1/period, adjust=False).mean()
-    rs = media_ganho / media_perda
-    return 100 - (100 / (1 + rs))
+from core.indicators import (
+    calcular_obv,
+    calcular_rsi,
+    defasar,
+    max_proximos,
+    rolling_mean,
+    true_range,
+    wilder_moving_average,
+)
+from core.models import Cotacao, Acao, EstadoJanelaAcao
+from core.services.bulk_upsert import bulk_update_alterados
+from core.services.estado_janela import montar_estado, salvar_estado
 
 def to_decimal_safe(value):
     try:
@@ -39,65 +39,107 @@ def to_decimal_safe(value):
     except (InvalidOperation, TypeError, ValueError):
         return None
 
-def calcular_medias_para_acao(acao_id):
-    cotacoes = Cotacao.objects.filter(acao_id=acao_id).order_by('data')
+PERIODOS_WMA = [17, 34, 72, 144, 602]
+
+CAMPOS_INDICADORES = [
+    'wma17', 'wma34', 'wma72', 'wma144', 'wma602',
+    'obv', 'rsi_14', 'media_volume_20d',
+    'fechamento_anterior', 'rsi_14_anterior', 'volume_m3', 'max_5dias',
+    'atr',
+]
+
+# Pregões carregados até a semente no modo incremental. O RSI não tem
+# estado gravado (só o valor final), então é recalculado sobre essa janela:
+# com alpha=1/14 a influência do ponto inicial cai abaixo de 1e-8 em 300 pregões.
+# As médias de Wilder (WMAs e ATR) também são recalculadas sobre ela, partindo
+# do valor gravado no primeiro pregão da janela: o arredondamento do banco
+# (2 casas) entra só nesse ponto e é amortecido pela janela inteira, em vez de
+# ser realimentado a cada pregão (o que trava a média quando o passo diário
+# fica abaixo de 0,005). Para a wma602 o peso da semente é (1-1/602)^300 ≈ 0,6,
+# então o desvio para o recálculo completo fica limitado a ~2,5 × 0,005.
+JANELA_AQUECIMENTO = 300
+
+COLUNAS_WILDER = [f'wma{periodo}' for periodo in PERIODOS_WMA] + ['atr']
 
-    if cotacoes.count() < 602:
-        print(f"⚠ {acao_id} não possui dados suficientes para calcular WMA602")
-        return
 
+def carregar_cotacoes(qs):
     df = pd.DataFrame.from_records(
-        cotacoes.values('id', 'data', 'fechamento', 'volume', 'rsi_14', 'maxima', 'minima'),
+        qs.values(
+            'id', 'data', 'abertura', 'fechamento', 'volume', 'maxima', 'minima',
+            'wma17', 'wma34', 'wma72', 'wma144', 'wma602', 'obv', 'atr',
+        ),
         index='data'
     ).sort_index()
 
-
     # ✅ Conversão segura para float (evita erros do tipo Decimal + float)
-    # for col in ['fechamento', 'volume', 'rsi_14']:
-    #     df[col] = pd.to_numeric(df[col], errors='coerce')
+    for col in df.columns:
+        if col != 'id':
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
 
-    for col in ['fechamento', 'volume', 'rsi_14', 'maxima', 'minima']:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
 
-    # calcular após a conversão de fechamento
-    df['fechamento_anterior'] = df['fechamento'].shift(1)
+def _continuar(df, col, novos, pos):
+    # mantém os valores gravados até `pos` e encaixa a continuação depois dela
+    serie = df[col].astype(float).copy()
+    serie.iloc[pos + 1:] = novos.values
+    df[col] = serie
+
+
+def _wilder_na_janela(df, col, serie, periodo):
+    # recalcula a média sobre a janela inteira a partir do valor gravado no 1º pregão
+    novos = wilder_moving_average(serie.iloc[1:], periodo, semente=df[col].iloc[0])
+    _continuar(df, col, novos, 0)
+
 
+def calcular_indicadores(df, semente=None):
+    """
+    Calcula os indicadores sobre o histórico `df` (índice = data).
+
+    Sem `semente`, recalcula tudo desde o primeiro pregão. Com `semente`
+    (data de uma linha já completa no banco, presente em `df`, que começa na
+    janela de aquecimento), as médias de Wilder (WMAs e ATR) são recalculadas
+    sobre todo o `df` a partir dos valores gravados no primeiro pregão, o OBV
+    continua do valor gravado na semente e as janelas móveis usam o próprio
+    `df`. Só as linhas posteriores à semente devem ser gravadas.
+    """
+    pos = None if semente is None else df.index.get_loc(semente)
+    fechamento = df['fechamento']
+
+    # calcular após a conversão de fechamento
+    df['fechamento_anterior'] = defasar(fechamento)
 
     # Médias Welles Wilder
-    for periodo in [17, 34, 72, 144, 602]:
-        df[f'wma{periodo}'] = wilder_moving_average(df['fechamento'], periodo)
+    for periodo in PERIODOS_WMA:
+        col = f'wma{periodo}'
+        if pos is None:
+            df[col] = wilder_moving_average(fechamento, periodo)
+        else:
+            _wilder_na_janela(df, col, fechamento, periodo)
 
     # OBV
-    obv = [0]
-    for i in range(1, len(df)):
-        if df['fechamento'].iloc[i] > df['fechamento'].iloc[i - 1]:
-            obv.append(obv[-1] + df['volume'].iloc[i])
-        elif df['fechamento'].iloc[i] < df['fechamento'].iloc[i - 1]:
-            obv.append(obv[-1] - df['volume'].iloc[i])
-        else:
-            obv.append(obv[-1])
-    df['obv'] = obv
+    if pos is None:
+        df['obv'] = calcular_obv(fechamento, df['volume'])
+    else:
+        novos = calcular_obv(fechamento.iloc[pos:], df['volume'].iloc[pos:], inicial=df['obv'].iloc[pos])
+        _continuar(df, 'obv', novos.iloc[1:], pos)
 
     # ATR - Average True Range (14 períodos)
-    df['fechamento_anterior'] = df['fechamento'].shift(1)
-    tr1 = df['maxima'] - df['minima']
-    tr2 = (df['maxima'] - df['fechamento_anterior']).abs()
-    tr3 = (df['minima'] - df['fechamento_anterior']).abs()
-    df['tr'] = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-    df['atr'] = wilder_moving_average(df['tr'], period=14)
-
+    df['tr'] = true_range(df['maxima'], df['minima'], fechamento)
+    if pos is None:
+        df['atr'] = wilder_moving_average(df['tr'], 14)
+    else:
+        _wilder_na_janela(df, 'atr', df['tr'], 14)
 
     # RSI 14
-    df['rsi_14'] = calcular_rsi(df['fechamento'], 14)
+    df['rsi_14'] = calcular_rsi(fechamento, 14)
 
     # Média de volume 20 dias
-    df['media_volume_20d'] = df['volume'].rolling(window=20).mean()
+    df['media_volume_20d'] = rolling_mean(df['volume'], 20)
 
     # 🔁 Novos campos para IA
-    df['fechamento_anterior'] = df['fechamento'].shift(1)
-    df['rsi_14_anterior'] = df['rsi_14'].shift(1)
-    df['volume_m3'] = df['volume'].shift(1).rolling(window=3).mean()
-    df['max_5dias'] = df['fechamento'].shift(-1).rolling(window=5).max()
+    df['rsi_14_anterior'] = defasar(df['rsi_14'])
+    df['volume_m3'] = rolling_mean(defasar(df['volume']), 3)
+    df['max_5dias'] = max_proximos(fechamento, 5)
 
     # 🎯 Regras da estratégia para definir entrada
     df['target_compra'] = (
@@ -105,40 +147,168 @@ def calcular_medias_para_acao(acao_id):
         (df['wma17'].shift(1) <= df['wma34'].shift(1)) &
         (df['max_5dias'] > df['fechamento'])
     )
+    return df
+
+
+def ultima_data_completa(acao_id):
+    """
+    Última data com todos os indicadores gravados. max_5dias depende do
+    fechamento do pregão seguinte, então a última linha de cada carga
+    fica incompleta e é recalculada na próxima execução.
+
+    Retorna None (recálculo completo) quando não há linha completa ou quando
+    existe pregão sem indicadores anterior a ela (ex.: lacuna preenchida
+    pelo backfill).
+    """
+    qs = Cotacao.objects.filter(acao_id=acao_id)
+    ultima = qs.filter(
+        wma602__isnull=False,
+        obv__isnull=False,
+        atr__isnull=False,
+        max_5dias__isnull=False,
+    ).aggregate(ultima=Max('data'))['ultima']
+    if ultima is None:
+        return None
+    if qs.filter(data__lt=ultima, wma602__isnull=True).exists():
+        return None
+    return ultima
+
+
+def snapshot_em_dia(acao_id, data):
+    try:
+        return EstadoJanelaAcao.objects.filter(acao_id=acao_id, data=data).exists()
+    except DatabaseError as e:
+        print(f"⚠ Snapshot da janela indisponível para {acao_id}: {e}")
+        return False
+
+
+def gravar_snapshot(acao_id, estado):
+    # fora da transação dos indicadores: falha no snapshot não descarta o que já foi gravado
+    try:
+        salvar_estado(estado)
+    except DatabaseError as e:
+        print(f"⚠ Snapshot da janela não gravado para {acao_id}: {e}")
+
+
+def calcular_medias_para_acao(acao_id, completo=False, batch_size=1000):
+    """
+    Atualiza os indicadores de uma ação.
+
+    Por padrão é incremental: parte da última linha completa gravada e só
+    recalcula as linhas posteriores. `completo=True` recalcula todo o
+    histórico. Em ambos os casos só as linhas cujos valores mudaram são
+    gravadas, via bulk_update em lotes de `batch_size`, e o snapshot da
+    janela móvel da ação (EstadoJanelaAcao) é atualizado.
+    """
+    semente = None if completo else ultima_data_completa(acao_id)
+
+    if semente is not None:
+        datas_janela = list(
+            Cotacao.objects
+            .filter(acao_id=acao_id, data__lte=semente)
+            .order_by('-data')
+            .values_list('data', flat=True)[:JANELA_AQUECIMENTO]
+        )
+        df = carregar_cotacoes(
+            Cotacao.objects.filter(acao_id=acao_id, data__gte=datas_janela[-1])
+        )
+        pendentes = (df.index > semente).sum()
+        if pendentes == 0 and snapshot_em_dia(acao_id, df.index.max()):
+            print(f"✔️ Indicadores de {acao_id} já estão atualizados")
+            return
+        if pendentes > JANELA_AQUECIMENTO or df[COLUNAS_WILDER].iloc[0].isna().any():
+            semente = None
 
-    # Atualização no banco
-    for idx, row in df.iterrows():
-        try:
-            cotacao = Cotacao.objects.get(id=row['id'])
-        except Cotacao.DoesNotExist:
-            continue
+    if semente is None:
+        cotacoes = Cotacao.objects.filter(acao_id=acao_id).order_by('data')
 
-        cotacao.wma17 = to_decimal_safe(row.get('wma17'))
-        cotacao.wma34 = to_decimal_safe(row.get('wma34'))
-        cotacao.wma72 = to_decimal_safe(row.get('wma72'))
-        cotacao.wma144 = to_decimal_safe(row.get('wma144'))
-        cotacao.wma602 = to_decimal_safe(row.get('wma602'))
+        if cotacoes.count() < 602:
+            print(f"⚠ {acao_id} não possui dados suficientes para calcular WMA602")
+            return
 
-        cotacao.obv = to_decimal_safe(row.get('obv'))
-        cotacao.rsi_14 = to_decimal_safe(row.get('rsi_14'))
-        cotacao.media_volume_20d = to_decimal_safe(row.get('media_volume_20d'))
+        df = carregar_cotacoes(cotacoes)
 
-        cotacao.fechamento_anterior = to_decimal_safe(row.get('fechamento_anterior'))
-        cotacao.rsi_14_anterior = to_decimal_safe(row.get('rsi_14_anterior'))
-        cotacao.volume_m3 = to_decimal_safe(row.get('volume_m3'))
-        cotacao.max_5dias = to_decimal_safe(row.get('max_5dias'))
-        cotacao.target_compra = bool(row.get('target_compra'))
+    df = calcular_indicadores(df, semente=semente)
+    estado = montar_estado(acao_id, df)
+    if semente is not None:
+        df = df[df.index > semente]
 
-        cotacao.atr = to_decimal_safe(row.get('atr'))
+    # Atualização no banco: só campos alterados, em lote
+    novos = {}
+    for row in df.to_dict('records'):
+        valores = {campo: to_decimal_safe(row.get(campo)) for campo in CAMPOS_INDICADORES}
+        valores['target_compra'] = bool(row.get('target_compra'))
+        novos[int(row['id'])] = valores
 
-        cotacao.save()
+    gravados = Cotacao.objects.filter(acao_id=acao_id)
+    if semente is not None:
+        gravados = gravados.filter(data__gt=semente)
+    atuais = {row.pop('id'): row for row in gravados.values('id', *CAMPOS_INDICADORES, 'target_compra')}
 
-    print(f"✅ Indicadores atualizados para {cotacoes[0].acao.ticker}")
+    with transaction.atomic():
+        alteradas = bulk_update_alterados(Cotacao, novos, atuais, batch_size=batch_size)
+    gravar_snapshot(acao_id, estado)
 
+    modo = "completo" if semente is None else f"incremental desde {semente}"
+    print(f"✅ Indicadores atualizados para {acao_id} ({alteradas}/{len(df)} linhas alteradas, {modo})")
 
-def calcular_todas():
-    for acao in Acao.objects.all():
-        calcular_medias_para_acao(acao.id)
+
+def _inicializar_worker():
+    # conexões herdadas do processo pai (fork) não podem ser compartilhadas:
+    # cada worker abre a sua na primeira consulta
+    connections.close_all()
+
+
+def _executar_acao(acao_id, completo, batch_size):
+    inicio = time.perf_counter()
+    try:
+        calcular_medias_para_acao(acao_id, completo=completo, batch_size=batch_size)
+        erro = None
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+    return acao_id, time.perf_counter() - inicio, erro
+
+
+def calcular_todas(completo=False, workers=1, batch_size=1000):
+    """
+    Atualiza os indicadores de todo o universo. Com `workers` > 1 as ações
+    são distribuídas num pool de processos, cada um com sua conexão ao banco.
+    Falhas de uma ação não interrompem as demais; ao final imprime o resumo.
+    """
+    acoes = dict(Acao.objects.order_by('id').values_list('id', 'ticker'))
+    inicio = time.perf_counter()
+    resultados = []
+
+    if workers <= 1:
+        for acao_id in acoes:
+            resultados.append(_executar_acao(acao_id, completo, batch_size))
+    else:
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_worker) as pool:
+            futuros = [pool.submit(_executar_acao, acao_id, completo, batch_size) for acao_id in acoes]
+            for futuro in as_completed(futuros):
+                resultados.append(futuro.result())
+
+    total = time.perf_counter() - inicio
+    falhas = [(acao_id, erro) for acao_id, _, erro in resultados if erro]
+    tempos = sorted(((duracao, acao_id) for acao_id, duracao, _ in resultados), reverse=True)
+    soma = sum(duracao for duracao, _ in tempos)
+
+    print("\n📊 Resumo do cálculo de indicadores")
+    print(f"   Ações: {len(resultados)} | OK: {len(resultados) - len(falhas)} | Falhas: {len(falhas)}")
+    print(f"   Tempo total: {total:.1f}s | soma por ação: {soma:.1f}s | workers: {max(workers, 1)}")
+    for duracao, acao_id in tempos[:5]:
+        print(f"   ⏱ {acoes.get(acao_id, acao_id)}: {duracao:.2f}s")
+    for acao_id, erro in falhas:
+        print(f"   ❌ {acoes.get(acao_id, acao_id)}: {erro}")
+    return resultados
 
 if __name__ == '__main__':
-    calcular_todas()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calcula médias e indicadores das cotações.")
+    parser.add_argument('--completo', action='store_true', help="Recalcula todo o histórico (ignora o modo incremental)")
+    parser.add_argument('--workers', type=int, default=1, help="Processos em paralelo (default: 1)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Linhas por UPDATE em lote (default: 1000)")
+    args = parser.parse_args()
+    calcular_todas(completo=args.completo, workers=args.workers, batch_size=args.batch_size)
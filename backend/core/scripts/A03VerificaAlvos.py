@@ -14,56 +14,143 @@ sys.path.append(BASE_DIR)
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 django.setup()
 
+import pandas as pd
+from django.db.models import Max, Q
+
 from core.models import Cotacao, RecomendacaoDiaria
+from core.services.bulk_upsert import bulk_update_alterados
+
+CEM = Decimal('100.00')
+
+
+def _percentual(fechamento_atual, preco_entrada):
+    if preco_entrada > 0:
+        return Decimal(((fechamento_atual / preco_entrada) - 1) * 100).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return Decimal('0.00')
 
-def verificar_alvos_recomendacoes():
-    recomendacoes = RecomendacaoDiaria.objects.filter(preco_compra__isnull=False)
 
-    for recomendacao in recomendacoes:
-        print(f"→ Verificando {recomendacao.acao.ticker} em {recomendacao.data} (preço compra: {recomendacao.preco_compra})")
+def _verificar_lote(recs):
+    """
+    Verifica um lote de recomendações pendentes com uma única consulta de
+    cotações, olhando só pregões posteriores à marca d'água de cada uma
+    (`desde`). Retorna {id: campos a gravar}.
+    """
+    cotacoes = pd.DataFrame.from_records(
+        Cotacao.objects.filter(
+            acao_id__in=recs['acao_id'].unique().tolist(),
+            data__gt=recs['desde'].min(),
+        ).values('acao_id', 'data', 'maxima', 'fechamento'),
+        columns=['acao_id', 'data', 'maxima', 'fechamento'],
+    )
+    if cotacoes.empty:
+        return {}
 
-        preco_alvo = float(recomendacao.alvo_sugerido) if recomendacao.alvo_sugerido else float(recomendacao.preco_compra) * 1.05
+    cotacoes = cotacoes.rename(columns={'data': 'data_cot'})
+    cotacoes['maxima_f'] = pd.to_numeric(cotacoes['maxima'], errors='coerce')
 
-        ultima_cotacao = Cotacao.objects.filter(
-            acao_id=recomendacao.acao_id,
-            data__gt=recomendacao.data
-        ).order_by('-data').first()
+    df = recs.merge(cotacoes, on='acao_id')
+    df = df[df['data_cot'] > df['desde']].sort_values(['id', 'data_cot'])
+    if df.empty:
+        return {}
 
-        if not ultima_cotacao:
-            print(f"[!] Sem cotação após {recomendacao.data} para {recomendacao.acao.ticker}")
+    atingiu = df['maxima_f'].notna() & (df['maxima_f'] != 0) & (df['maxima_f'] >= df['alvo'])
+    # linhas inteiras (já ordenadas por id/data): groupby().first()/last() pegam o
+    # primeiro/último não nulo coluna a coluna e podem misturar pregões
+    primeiro_alvo = df[atingiu].drop_duplicates('id', keep='first').set_index('id')
+    ultima = df.drop_duplicates('id', keep='last').set_index('id')
+
+    novos = {}
+    for rec_id, row in primeiro_alvo.iterrows():
+        novos[rec_id] = {
+            'data_alvo': row['data_cot'],
+            'fechamento_alvo': row['fechamento'],
+            'perc_alvo_realizado': CEM,
+            'verificado_ate': row['data_cot'],
+        }
+        print(f"[✔] Alvo atingido: {row['ticker']} em {row['data_cot']}")
+
+    for rec_id, row in ultima.iterrows():
+        if rec_id in novos:
             continue
+        fechamento_atual = float(row['fechamento'] or 0)
+        novos[rec_id] = {
+            'perc_alvo_realizado': _percentual(fechamento_atual, row['preco_entrada']),
+            'verificado_ate': row['data_cot'],
+        }
+    return novos
+
+
+def verificar_alvos_recomendacoes(batch_size=500):
+    """
+    Verificação em lote: recomendações já liquidadas (data_alvo preenchida)
+    são só normalizadas para 100%; as pendentes são cruzadas com as cotações
+    posteriores em uma consulta por lote, e o primeiro pregão com
+    máxima >= alvo fecha a recomendação. Só linhas alteradas são gravadas.
+
+    Cada recomendação guarda em `verificado_ate` o último pregão conferido;
+    as execuções seguintes só leem cotações mais novas que essa marca, e
+    recomendações já conferidas até o último pregão carregado nem são lidas.
+    """
+    corrigidas = (
+        RecomendacaoDiaria.objects
+        .filter(preco_compra__isnull=False, data_alvo__isnull=False)
+        .exclude(perc_alvo_realizado=CEM)
+        .update(perc_alvo_realizado=CEM)
+    )
+    if corrigidas:
+        print(f"[=] Corrigidas para 100%: {corrigidas}")
+
+    ultima_data = Cotacao.objects.aggregate(ultima=Max('data'))['ultima']
+    if ultima_data is None:
+        print("❌ Nenhuma cotação disponível.")
+        return
+
+    campos = [
+        'id', 'acao_id', 'acao__ticker', 'data', 'preco_compra', 'alvo_sugerido',
+        'perc_alvo_realizado', 'verificado_ate',
+    ]
+    pendentes = pd.DataFrame.from_records(
+        RecomendacaoDiaria.objects
+        .filter(preco_compra__isnull=False, data_alvo__isnull=True)
+        .filter(Q(verificado_ate__isnull=True) | Q(verificado_ate__lt=ultima_data))
+        .values(*campos),
+        columns=campos,
+    )
+    if pendentes.empty:
+        print("Nenhuma recomendação pendente.")
+        return
+
+    pendentes = pendentes.rename(columns={'acao__ticker': 'ticker'})
+    pendentes['desde'] = [
+        max(data, verificado) if verificado else data
+        for data, verificado in zip(pendentes['data'], pendentes['verificado_ate'])
+    ]
+    pendentes['preco_entrada'] = [float(p or 0) for p in pendentes['preco_compra']]
+    pendentes['alvo'] = [
+        round(float(alvo) if alvo else float(preco) * 1.05, 2)
+        for alvo, preco in zip(pendentes['alvo_sugerido'], pendentes['preco_compra'])
+    ]
+    print(f"→ Verificando {len(pendentes)} recomendações pendentes")
+
+    atuais = {
+        row['id']: {
+            'data_alvo': None,
+            'fechamento_alvo': None,
+            'perc_alvo_realizado': row['perc_alvo_realizado'],
+            'verificado_ate': row['verificado_ate'],
+        }
+        for row in pendentes[['id', 'perc_alvo_realizado', 'verificado_ate']].to_dict('records')
+    }
+
+    # lotes por ação, para que cada consulta de cotações cubra poucos tickers
+    pendentes = pendentes.sort_values(['acao_id', 'data']).reset_index(drop=True)
+    atingidas = atualizadas = 0
+    for inicio in range(0, len(pendentes), batch_size):
+        novos = _verificar_lote(pendentes.iloc[inicio:inicio + batch_size])
+        atingidas += sum(1 for campos in novos.values() if 'data_alvo' in campos)
+        atualizadas += bulk_update_alterados(RecomendacaoDiaria, novos, atuais)
 
-        if recomendacao.data_alvo is None:
-            cotacoes_pos = Cotacao.objects.filter(
-                acao_id=recomendacao.acao_id,
-                data__gt=recomendacao.data
-            ).order_by('data')
-
-            for cotacao in cotacoes_pos:
-                if cotacao.maxima and float(cotacao.maxima) >= round(preco_alvo, 2):
-                    recomendacao.data_alvo = cotacao.data
-                    recomendacao.fechamento_alvo = cotacao.fechamento
-                    recomendacao.perc_alvo_realizado = Decimal('100.00')
-                    recomendacao.save()
-                    print(f"[✔] Alvo atingido: {recomendacao.acao.ticker} em {cotacao.data}")
-                    break
-            else:
-                fechamento_atual = float(ultima_cotacao.fechamento or 0)
-                preco_entrada = float(recomendacao.preco_compra or 0)
-
-                if preco_entrada > 0:
-                    porcentagem = Decimal(((fechamento_atual / preco_entrada) - 1) * 100).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-                else:
-                    porcentagem = Decimal('0.00')
-
-                recomendacao.perc_alvo_realizado = porcentagem
-                recomendacao.save()
-                print(f"[...] {recomendacao.acao.ticker} está em {porcentagem}% do alvo.")
-        else:
-            if recomendacao.perc_alvo_realizado != Decimal('100.00'):
-                recomendacao.perc_alvo_realizado = Decimal('100.00')
-                recomendacao.save()
-                print(f"[=] Corrigido para 100%: {recomendacao.acao.ticker}")
+    print(f"✅ Verificação concluída: {atingidas} alvos atingidos, {atualizadas} recomendações atualizadas.")
 
 if __name__ == '__main__':
     verificar_alvos_recomendacoes()
@@ -0,0 +1,167 @@
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Type
+
+from django.db import connections, models, router
+
+
+def bulk_upsert(
+    model: Type[models.Model],
+    objetos: Sequence[models.Model],
+    *,
+    unique_fields: Iterable[str],
+    update_fields: Iterable[str],
+    batch_size: int = 1000,
+) -> int:
+    """
+    Insere ou atualiza `objetos` em lote (INSERT ... ON DUPLICATE KEY UPDATE /
+    ON CONFLICT DO UPDATE), em uma ida ao banco por lote.
+
+    MySQL/MariaDB resolvem o conflito pela própria chave única da tabela e não
+    aceitam `unique_fields`; nesses backends o parâmetro é omitido.
+    Retorna a quantidade de objetos enviados.
+    """
+    if not objetos:
+        return 0
+
+    conn = connections[router.db_for_write(model)]
+    kwargs = {
+        "update_conflicts": True,
+        "update_fields": list(update_fields),
+    }
+    if conn.features.supports_update_conflicts_with_target:
+        kwargs["unique_fields"] = list(unique_fields)
+
+    objs: List[models.Model] = list(objetos)
+    model.objects.bulk_create(objs, batch_size=batch_size, **kwargs)
+    return len(objs)
+
+
+def normalizar_valor(field: models.Field, valor: Any) -> Any:
+    """
+    Converte `valor` para a forma em que o banco o devolve: DecimalField é
+    arredondado nas casas do campo (NaN/inf viram None), BooleanField vira bool.
+    """
+    if valor is None:
+        return None
+    if isinstance(field, models.DecimalField):
+        try:
+            dec = valor if isinstance(valor, Decimal) else Decimal(str(valor))
+            if not dec.is_finite():
+                return None
+            return dec.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+        except (InvalidOperation, TypeError, ValueError):
+            return None
+    if isinstance(field, models.BooleanField):
+        return bool(valor)
+    return valor
+
+
+def bulk_update_alterados(
+    model: Type[models.Model],
+    novos: Mapping[Hashable, Mapping[str, Any]],
+    atuais: Mapping[Hashable, Mapping[str, Any]],
+    *,
+    carimbo: Optional[Mapping[str, Any]] = None,
+    batch_size: int = 1000,
+) -> int:
+    """
+    Grava em lote só o que mudou.
+
+    `novos` e `atuais` mapeiam pk -> {campo: valor}. Os valores novos são
+    normalizados para a precisão do campo e comparados com os atuais; linhas
+    sem diferença são ignoradas. As demais são agrupadas pelo conjunto de
+    campos alterados e cada grupo vira um bulk_update (UPDATE ... CASE WHEN)
+    em lotes de `batch_size`. `carimbo` são valores gravados junto apenas nas
+    linhas alteradas (ex.: atualizado_em, que bulk_update não preenche
+    sozinho mesmo com auto_now). Retorna a quantidade de linhas atualizadas.
+    """
+    fields: Dict[str, models.Field] = {}
+    grupos: Dict[tuple, List[models.Model]] = defaultdict(list)
+
+    for pk, valores in novos.items():
+        antigo = atuais.get(pk, {})
+        alterados: Dict[str, Any] = {}
+        for campo, valor in valores.items():
+            field = fields.get(campo)
+            if field is None:
+                field = fields[campo] = model._meta.get_field(campo)
+            valor = normalizar_valor(field, valor)
+            if campo not in antigo or normalizar_valor(field, antigo[campo]) != valor:
+                alterados[campo] = valor
+        if alterados:
+            alterados.update(carimbo or {})
+            obj = model(pk=pk, **alterados)
+            grupos[tuple(sorted(alterados))].append(obj)
+
+    total = 0
+    for campos, objs in grupos.items():
+        model.objects.bulk_update(objs, list(campos), batch_size=batch_size)
+        total += len(objs)
+    return total
+
+
+def sincronizar_por_chave(
+    model: Type[models.Model],
+    qs: models.QuerySet,
+    chave: Sequence[str],
+    novos: Mapping[tuple, Mapping[str, Any]],
+    *,
+    fixos: Optional[Mapping[str, Any]] = None,
+    carimbo: Optional[Mapping[str, Any]] = None,
+    batch_size: int = 1000,
+) -> Dict[str, int]:
+    """
+    Deixa as linhas de `qs` iguais a `novos` (chave -> {campo: valor}),
+    mexendo só no que difere: insere chaves novas, atualiza só os campos
+    alterados (bulk_update_alterados) e apaga chaves que sumiram, em lotes.
+
+    `chave` são os campos (attname, ex. "acao_id") que identificam a linha
+    dentro de `qs`; seus valores são normalizados como no banco antes de
+    comparar. `fixos` são valores comuns a todas as linhas inseridas (ex.:
+    origem); `carimbo` vai só nas linhas atualizadas (ver
+    bulk_update_alterados). Linhas repetidas para a mesma chave (a tabela
+    pode não ter restrição única) são reduzidas a uma: fica a de menor pk e
+    as demais são apagadas. Não abre transação: o chamador decide o escopo.
+    Retorna {"inseridos", "atualizados", "removidos"}.
+    """
+    campos_chave = [model._meta.get_field(c) for c in chave]
+
+    def normalizar_chave(valores) -> tuple:
+        return tuple(normalizar_valor(f, v) for f, v in zip(campos_chave, valores))
+
+    novos = {normalizar_chave(k): v for k, v in novos.items()}
+    campos = sorted({c for valores in novos.values() for c in valores})
+
+    atuais: Dict[tuple, Any] = {}
+    valores_atuais: Dict[Any, Dict[str, Any]] = {}
+    remover: List[Any] = []
+    for linha in qs.order_by("pk").values("pk", *chave, *campos):
+        k = normalizar_chave(linha[c] for c in chave)
+        if k in atuais:
+            remover.append(linha["pk"])  # duplicata da chave
+            continue
+        atuais[k] = linha["pk"]
+        valores_atuais[linha["pk"]] = {c: linha[c] for c in campos}
+
+    remover += [pk for k, pk in atuais.items() if k not in novos]
+    for i in range(0, len(remover), batch_size):
+        model.objects.filter(pk__in=remover[i : i + batch_size]).delete()
+
+    atualizados = bulk_update_alterados(
+        model,
+        {atuais[k]: valores for k, valores in novos.items() if k in atuais},
+        valores_atuais,
+        carimbo=carimbo,
+        batch_size=batch_size,
+    )
+
+    inserir = [
+        model(**dict(zip(chave, k)), **(fixos or {}), **valores)
+        for k, valores in novos.items()
+        if k not in atuais
+    ]
+    if inserir:
+        model.objects.bulk_create(inserir, batch_size=batch_size)
+
+    return {"inseridos": len(inserir), "atualizados": atualizados, "removidos": len(remover)}
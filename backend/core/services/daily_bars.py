@@ -0,0 +1,136 @@
+import logging
+from datetime import date
+from typing import Dict, Iterable, List
+
+import pandas as pd
+import yfinance as yf
+
+from core.services.intraday_quotes import _chunked
+
+
+logger = logging.getLogger(__name__)
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# os tickers vão ao Yahoo com o sufixo .SA (B3), cotados em reais; o download
+# em lote não traz o "currency" do Ticker.info
+MOEDA_B3 = "BRL"
+
+
+def _normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    cols = [c for c in OHLCV_COLUMNS if c in df.columns]
+    df = df[cols].dropna(how="all", subset=[c for c in cols if c != "Volume"])
+    if df.empty:
+        return df
+    idx = pd.to_datetime(df.index)
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    df = df.copy()
+    df.index = idx.normalize()
+    df.index.name = "Date"
+    return df.sort_index()
+
+
+def _split_by_ticker(raw: pd.DataFrame, bases: List[str]) -> Dict[str, pd.DataFrame]:
+    out: Dict[str, pd.DataFrame] = {}
+    if not isinstance(raw, pd.DataFrame) or raw.empty:
+        return out
+
+    if not isinstance(raw.columns, pd.MultiIndex):
+        df = _normalize_frame(raw)
+        if not df.empty:
+            out[bases[0]] = df
+        return out
+
+    disponiveis = set(raw.columns.get_level_values(1))
+    for base in bases:
+        col = f"{base}.SA"
+        if col not in disponiveis:
+            continue
+        df = _normalize_frame(raw.xs(col, axis=1, level=1))
+        if not df.empty:
+            out[base] = df
+    return out
+
+
+def fetch_daily_bars(
+    tickers: Iterable[str],
+    start: date,
+    end: date,
+    *,
+    batch_size: int = 50,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Baixa barras diárias (OHLCV) via yfinance em lotes multi-ticker.
+
+    `end` é exclusivo (mesma semântica do yfinance). Retorna um mapeamento
+    base_ticker -> DataFrame indexado por data (Open/High/Low/Close/Volume).
+    """
+    bases = sorted({(ticker or "").strip().upper() for ticker in tickers if ticker})
+    if not bases:
+        return {}
+
+    resultados: Dict[str, pd.DataFrame] = {}
+    for chunk in _chunked(bases, batch_size):
+        suffix = [f"{base}.SA" for base in chunk]
+        try:
+            data = yf.download(
+                tickers=suffix,
+                start=start,
+                end=end,
+                interval="1d",
+                progress=False,
+                auto_adjust=True,
+            )
+            resultados.update(_split_by_ticker(data, chunk))
+        except Exception:  # pragma: no cover - rede externa
+            logger.exception("Falha ao buscar barras diárias para %s", chunk)
+            continue
+
+    return resultados
+
+
+def fetch_day_quotes(
+    tickers: Iterable[str], *, batch_size: int = 50
+) -> Dict[str, Dict[str, float]]:
+    """
+    Resolve a barra do pregão corrente (ou do último pregão) via yfinance,
+    em lotes. Retorna base_ticker -> {"preco", "abertura", "maxima", "minima",
+    "moeda"}.
+    """
+    bases = sorted({(ticker or "").strip().upper() for ticker in tickers if ticker})
+    if not bases:
+        return {}
+
+    resultados: Dict[str, Dict[str, float]] = {}
+    for chunk in _chunked(bases, batch_size):
+        suffix = [f"{base}.SA" for base in chunk]
+        try:
+            data = yf.download(
+                tickers=suffix,
+                period="1d",
+                interval="1d",
+                progress=False,
+                auto_adjust=False,
+            )
+        except Exception:  # pragma: no cover - rede externa
+            logger.exception("Falha ao buscar barra do dia para %s", chunk)
+            continue
+
+        for base, df in _split_by_ticker(data, chunk).items():
+            last = df.iloc[-1]
+            info: Dict[str, float] = {}
+            for key, col in (
+                ("preco", "Close"),
+                ("abertura", "Open"),
+                ("maxima", "High"),
+                ("minima", "Low"),
+            ):
+                val = last.get(col)
+                if val is not None and pd.notna(val):
+                    info[key] = float(val)
+            if info:
+                info["moeda"] = MOEDA_B3
+                resultados[base] = info
+
+    return resultados
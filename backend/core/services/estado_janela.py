@@ -0,0 +1,131 @@
+"""
+Snapshot da janela móvel por ação (EstadoJanelaAcao).
+
+O A02 grava, ao fim do cálculo de cada ação, as últimas JANELA_4M linhas de
+cotação/indicadores e os agregados que o scoring usa (rsi_4m, max_4m,
+min_4m, obv_5d). O scoring intraday e o gerar_sinais_direcionais leem uma
+linha por ação em vez de recalcular a janela a partir do histórico.
+"""
+
+import json
+import math
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from core.models import EstadoJanelaAcao
+from core.services.bulk_upsert import normalizar_valor
+from core.services.janela_cotacoes import CAMPOS_OBRIGATORIOS, JANELA_4M
+
+
+CAMPOS_JANELA = [
+    "abertura", "fechamento", "minima", "maxima", "volume",
+    "wma17", "wma34", "wma72", "wma144", "wma602",
+    "obv", "rsi_14", "media_volume_20d", "fechamento_anterior", "atr",
+]
+
+
+def _float(value) -> Optional[float]:
+    try:
+        val = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(val) or math.isinf(val) else val
+
+
+def _decimal(campo: str, value) -> Optional[Decimal]:
+    field = EstadoJanelaAcao._meta.get_field(campo)
+    return normalizar_valor(field, _float(value))
+
+
+def montar_estado(acao_id: int, df: pd.DataFrame) -> Optional[EstadoJanelaAcao]:
+    """
+    Monta o snapshot a partir do histórico calculado de uma ação
+    (índice = data, colunas de CAMPOS_JANELA). Não grava.
+    """
+    if df is None or df.empty:
+        return None
+
+    janela = df.sort_index().tail(JANELA_4M)
+    linhas: List[Dict] = []
+    for data, row in janela.iterrows():
+        linha = {"data": pd.Timestamp(data).date().isoformat()}
+        for campo in CAMPOS_JANELA:
+            linha[campo] = _float(row.get(campo))
+        linhas.append(linha)
+
+    # agregados só sobre as linhas que a consulta de fallback do scoring
+    # (recomendacoes._base_janela) aceita na mesma janela
+    validas = janela.dropna(subset=CAMPOS_OBRIGATORIOS)
+    validas = validas[validas["volume"].astype(float) > 0]
+    obv = validas["obv"]
+    return EstadoJanelaAcao(
+        acao_id=acao_id,
+        data=pd.Timestamp(janela.index[-1]).date(),
+        rsi_4m=_decimal("rsi_4m", validas["rsi_14"].astype(float).mean()),
+        max_4m=_decimal("max_4m", validas["maxima"].astype(float).max()),
+        min_4m=_decimal("min_4m", validas["minima"].astype(float).min()),
+        obv_5d=_decimal("obv_5d", obv.iloc[-6] if len(obv) > 5 else None),
+        janela_json=json.dumps(linhas),
+    )
+
+
+def salvar_estado(estado: Optional[EstadoJanelaAcao]) -> None:
+    if estado is None:
+        return
+    campos = {
+        "rsi_4m": estado.rsi_4m,
+        "max_4m": estado.max_4m,
+        "min_4m": estado.min_4m,
+        "obv_5d": estado.obv_5d,
+        "janela_json": estado.janela_json,
+    }
+    # o retorno médio guardado é mantido: fica marcado com o pregão até o qual
+    # foi calculado (retorno_medio_ate) e o gerar_sinais_direcionais o estende
+    EstadoJanelaAcao.objects.update_or_create(
+        acao_id=estado.acao_id,
+        defaults={**campos, "data": estado.data},
+    )
+
+
+def carregar_estados(ate: date, acao_ids: Optional[Iterable[int]] = None) -> Dict[int, EstadoJanelaAcao]:
+    """Snapshots cujo último pregão é `ate`, por acao_id."""
+    qs = EstadoJanelaAcao.objects.filter(data=ate).select_related("acao")
+    if acao_ids is not None:
+        qs = qs.filter(acao_id__in=list(acao_ids))
+    return {estado.acao_id: estado for estado in qs}
+
+
+def salvar_retorno_medio(acao_id: int, data: date, dias: int, retorno: Optional[float]) -> None:
+    """Guarda o retorno médio do histórico até o pregão `data`, para `dias`, no snapshot."""
+    EstadoJanelaAcao.objects.filter(acao_id=acao_id).update(
+        dias_equivalentes_selic=dias,
+        retorno_medio_selic_ativo=_decimal("retorno_medio_selic_ativo", retorno),
+        retorno_medio_ate=data,
+    )
+
+
+def janela_df(estado: EstadoJanelaAcao) -> pd.DataFrame:
+    """Buffer do snapshot como DataFrame (coluna `data` datetime), ordenado por data."""
+    df = pd.DataFrame(json.loads(estado.janela_json or "[]"))
+    if df.empty:
+        return df
+    df["data"] = pd.to_datetime(df["data"])
+    return df.sort_values("data").reset_index(drop=True)
+
+
+def ultima_linha(estado: EstadoJanelaAcao) -> Dict:
+    """Último pregão do buffer + agregados da janela, como dict plano."""
+    linhas = json.loads(estado.janela_json or "[]")
+    linha = dict(linhas[-1]) if linhas else {}
+    linha.update(
+        {
+            "rsi_4m": _float(estado.rsi_4m),
+            "max_4m": _float(estado.max_4m),
+            "min_4m": _float(estado.min_4m),
+            "obv_5d": _float(estado.obv_5d),
+        }
+    )
+    return linha
@@ -61,9 +61,22 @@ def fetch_intraday_quotes(
     tickers: Iterable[str], *, interval: str = "1m", batch_size: int = 25
 ) -> Dict[str, float]:
     """
-    Resolve intraday quotes via yfinance in batches to reduce latency.
+    Resolve intraday quotes through the shared market-data cache
+    (short-TTL in-process LRU in front of the configured provider).
     Returns a mapping base_ticker -> last price (float).
     """
+    from core.services.market_cache import get_last_prices
+
+    return get_last_prices(tickers, interval=interval, batch_size=batch_size)
+
+
+def download_intraday_quotes(
+    tickers: Iterable[str], *, interval: str = "1m", batch_size: int = 25
+) -> Dict[str, float]:
+    """
+    Resolve intraday quotes via yfinance in batches to reduce latency,
+    bypassing the cache. Returns a mapping base_ticker -> last price (float).
+    """
     bases = sorted({(ticker or "").strip().upper() for ticker in tickers if ticker})
     if not bases:
         return {}
@@ -0,0 +1,46 @@
+from datetime import date
+from typing import List, Optional
+
+from django.db.models import QuerySet
+
+from core.models import Cotacao
+
+
+# ~4 meses de pregões: janela de rsi_4m / max_4m / min_4m nas recomendações
+JANELA_4M = 80
+
+# indicadores que o scoring exige preenchidos; linhas sem eles (ou com volume
+# zero) ficam fora da janela, tanto no snapshot quanto na consulta de fallback
+CAMPOS_OBRIGATORIOS = [
+    'wma602', 'wma17', 'wma34', 'obv', 'rsi_14',
+    'media_volume_20d', 'fechamento_anterior', 'atr',
+]
+
+
+def ultimos_pregoes(k: int, *, ate: Optional[date] = None) -> List[date]:
+    """
+    Últimas `k` datas de pregão (datas distintas em cotacoes_cotacao),
+    da mais recente para a mais antiga, limitadas a `ate` quando informado.
+    """
+    qs = Cotacao.objects.all()
+    if ate is not None:
+        qs = qs.filter(data__lte=ate)
+    return list(qs.order_by("-data").values_list("data", flat=True).distinct()[:k])
+
+
+def filtrar_janela(qs: QuerySet, k: int, *, ate: Optional[date] = None) -> QuerySet:
+    """
+    Restringe um queryset de Cotacao aos últimos `k` pregões do calendário
+    (até `ate`), em vez do histórico inteiro. Uma consulta pequena resolve a
+    data de corte; o filtro vira `data >= corte` e usa o índice (acao, data).
+
+    Ações que não negociaram em algum desses pregões ficam com menos de `k`
+    linhas na janela.
+    """
+    datas = ultimos_pregoes(k, ate=ate)
+    if not datas:
+        return qs.none()
+    qs = qs.filter(data__gte=datas[-1])
+    if ate is not None:
+        qs = qs.filter(data__lte=ate)
+    return qs
@@ -0,0 +1,281 @@
+"""
+Cache de dados de mercado compartilhado por rotinas, comandos e views,
+na frente do provider configurado (core.services.market_data).
+
+- Barras diárias: armazenamento colunar em disco (um Parquet por ticker em
+  MARKET_DATA_CACHE_DIR) com a faixa de datas coberta registrada ao lado.
+  Pregões já encerrados não mudam, então ficam válidos por muito tempo.
+- Último preço e barra do dia: LRU em memória do processo com TTL de
+  poucos segundos.
+
+Os TTLs (em segundos) por tipo vêm de settings.MARKET_DATA_CACHE_TTL.
+Entradas de providers diferentes nunca se misturam.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from django.conf import settings
+
+from core.services.market_data import get_provider
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = {
+    "daily": 7 * 24 * 3600,  # barras diárias de pregões encerrados
+    "day": 15,  # barra do pregão corrente (abertura/máxima/mínima/preço)
+    "quote": 5,  # último preço intraday
+}
+
+# barras mais recentes que isso ainda podem não ter sido publicadas
+DIAS_BARRA_ABERTA = 3
+
+
+def _ttl(kind: str) -> float:
+    ttl = getattr(settings, "MARKET_DATA_CACHE_TTL", None) or {}
+    return float(ttl.get(kind, DEFAULT_TTL[kind]))
+
+
+def _normalize(tickers: Iterable[str]) -> List[str]:
+    return sorted({(ticker or "").strip().upper() for ticker in tickers if ticker})
+
+
+# -------------------
+# LRU em memória (cotações)
+# -------------------
+
+class _TTLCache:
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, ttl: float) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stamp, value = item
+            if time.monotonic() - stamp > ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_memoria = _TTLCache(getattr(settings, "MARKET_DATA_CACHE_LRU_SIZE", 4096))
+
+
+def _cached_lookup(
+    kind: Hashable,
+    bases: List[str],
+    ttl: float,
+    fetch: Callable[[List[str]], Dict[str, Any]],
+) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    faltando: List[str] = []
+    for base in bases:
+        value = _memoria.get((kind, base), ttl)
+        if value is None:
+            faltando.append(base)
+        else:
+            out[base] = value
+
+    if faltando:
+        for base, value in fetch(faltando).items():
+            _memoria.set((kind, base), value)
+            out[base] = value
+    return out
+
+
+def get_last_prices(
+    tickers: Iterable[str], *, interval: str = "1m", batch_size: int = 25
+) -> Dict[str, float]:
+    """Último preço por ticker base, servido pelo LRU quando ainda fresco."""
+    provider = get_provider()
+    return _cached_lookup(
+        (provider.nome, "quote", interval),
+        _normalize(tickers),
+        _ttl("quote"),
+        lambda faltando: provider.last_prices(
+            faltando, interval=interval, batch_size=batch_size
+        ),
+    )
+
+
+def get_day_quotes(
+    tickers: Iterable[str], *, batch_size: int = 50
+) -> Dict[str, Dict[str, float]]:
+    """
+    Barra do dia por ticker base: {"preco", "abertura", "maxima", "minima"}
+    (chaves ausentes quando a fonte não traz o valor).
+    """
+    provider = get_provider()
+    cached = _cached_lookup(
+        (provider.nome, "day"),
+        _normalize(tickers),
+        _ttl("day"),
+        lambda faltando: provider.day_quotes(faltando, batch_size=batch_size),
+    )
+    # cópia rasa: quem chama costuma completar o dict com dados do MT5
+    return {base: dict(info) for base, info in cached.items()}
+
+
+# -------------------
+# Store colunar em disco (barras diárias)
+# -------------------
+
+def _cache_dir() -> Path:
+    base = getattr(settings, "MARKET_DATA_CACHE_DIR", None) or (
+        Path(settings.BASE_DIR) / "cache" / "market_data"
+    )
+    path = Path(base) / "daily" / get_provider().nome
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _paths(base: str) -> Tuple[Path, Path]:
+    pasta = _cache_dir()
+    return pasta / f"{base}.parquet", pasta / f"{base}.json"
+
+
+def _ler_barras(base: str) -> Tuple[Optional[pd.DataFrame], Optional[dict]]:
+    try:
+        arq, arq_meta = _paths(base)
+        if not arq_meta.exists():
+            return None, None
+        meta = json.loads(arq_meta.read_text())
+        df = pd.read_parquet(arq) if arq.exists() else pd.DataFrame()
+        return df, meta
+    except Exception:
+        logger.warning("Cache de barras ilegível para %s; ignorando", base, exc_info=True)
+        return None, None
+
+
+def _gravar_barras(base: str, df: pd.DataFrame, meta: dict) -> None:
+    try:
+        arq, arq_meta = _paths(base)
+        sufixo = f".{os.getpid()}.tmp"
+        tmp, tmp_meta = arq.with_name(arq.name + sufixo), arq_meta.with_name(arq_meta.name + sufixo)
+        df.to_parquet(tmp)
+        tmp_meta.write_text(json.dumps(meta))
+        os.replace(tmp, arq)
+        os.replace(tmp_meta, arq_meta)
+    except Exception:
+        logger.warning("Falha ao gravar cache de barras para %s", base, exc_info=True)
+
+
+def _cobre(meta: Optional[dict], start: date, end: date, ttl: float) -> bool:
+    if not meta:
+        return False
+    try:
+        inicio = date.fromisoformat(meta["inicio"])
+        fim = date.fromisoformat(meta["fim"])
+        atualizado = float(meta["atualizado_em"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return inicio <= start and fim >= end and (time.time() - atualizado) <= ttl
+
+
+def _atualizar_disco(
+    base: str,
+    antigo: Optional[pd.DataFrame],
+    meta: Optional[dict],
+    novo: Optional[pd.DataFrame],
+    start: date,
+    end: date,
+) -> None:
+    # sem barras (falha do provider, ticker sem negociação) nada é marcado
+    # como coberto: a faixa é pedida de novo na próxima chamada
+    if novo is None or novo.empty:
+        return
+    # só marca como coberto o que já está consolidado: perto de hoje a barra
+    # pode ainda não ter sido publicada, então a cobertura vai até a última
+    # barra recebida
+    if end <= date.today() - timedelta(days=DIAS_BARRA_ABERTA):
+        fim = end
+    else:
+        fim = min(end, novo.index.max().date() + timedelta(days=1))
+    if fim <= start:
+        return
+
+    inicio = start
+    if meta:
+        try:
+            m_inicio = date.fromisoformat(meta["inicio"])
+            m_fim = date.fromisoformat(meta["fim"])
+            if m_inicio <= fim and start <= m_fim:
+                inicio, fim = min(m_inicio, start), max(m_fim, fim)
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    partes = [df for df in (antigo, novo) if df is not None and not df.empty]
+    df = pd.concat(partes)
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+
+    _gravar_barras(
+        base,
+        df,
+        {"inicio": inicio.isoformat(), "fim": fim.isoformat(), "atualizado_em": time.time()},
+    )
+
+
+def get_daily_bars(
+    tickers: Iterable[str],
+    start: date,
+    end: date,
+    *,
+    batch_size: int = 50,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Barras diárias (OHLCV) de [start, end) por ticker base.
+
+    Tickers cuja faixa já está coberta no disco são lidos do Parquet; os
+    demais são baixados juntos em lotes e incorporados ao cache.
+    """
+    ttl = _ttl("daily")
+    ini_ts, fim_ts = pd.Timestamp(start), pd.Timestamp(end)
+
+    out: Dict[str, pd.DataFrame] = {}
+    faltando: List[Tuple[str, Optional[pd.DataFrame], Optional[dict]]] = []
+    for base in _normalize(tickers):
+        df, meta = _ler_barras(base)
+        if df is not None and _cobre(meta, start, end, ttl):
+            if not df.empty:
+                fatia = df[(df.index >= ini_ts) & (df.index < fim_ts)]
+                if not fatia.empty:
+                    out[base] = fatia
+            continue
+        faltando.append((base, df, meta))
+
+    if faltando:
+        baixados = get_provider().daily_bars(
+            [base for base, _, _ in faltando], start, end, batch_size=batch_size
+        )
+        for base, antigo, meta in faltando:
+            novo = baixados.get(base)
+            if novo is not None and not novo.empty:
+                out[base] = novo
+            _atualizar_disco(base, antigo, meta, novo, start, end)
+
+    return out
@@ -0,0 +1,279 @@
+"""
+Provedores de dados de mercado.
+
+Todo consumo de cotações (rotinas, comandos e views) passa por um
+MarketDataProvider resolvido a partir de settings.MARKET_DATA_PROVIDER:
+
+- "yfinance": Yahoo Finance (padrão);
+- "mt5": API MT5 de uma VM de referência (settings.MARKET_DATA_MT5_IP);
+- "replay": arquivos locais CSV/Parquet por ticker em
+  settings.MARKET_DATA_REPLAY_DIR, determinístico e sem rede — permite
+  medir ingestão, scoring e dashboard offline.
+"""
+
+import logging
+import math
+import threading
+from abc import ABC, abstractmethod
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from django.conf import settings
+
+from core.mt5_client import MT5Client
+from core.services.daily_bars import MOEDA_B3, OHLCV_COLUMNS, fetch_daily_bars, fetch_day_quotes
+from core.services.intraday_quotes import download_intraday_quotes
+
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(tickers: Iterable[str]) -> List[str]:
+    return sorted({(ticker or "").strip().upper() for ticker in tickers if ticker})
+
+
+def _finite(value) -> Optional[float]:
+    try:
+        val = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(val) or math.isinf(val):
+        return None
+    return val
+
+
+class MarketDataProvider(ABC):
+    """Interface comum: barras diárias, último preço e barra do dia."""
+
+    nome = "base"
+
+    @abstractmethod
+    def daily_bars(
+        self, tickers: Iterable[str], start: date, end: date, *, batch_size: int = 50
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Barras diárias de [start, end) por ticker base, como DataFrame indexado
+        por data com colunas Open/High/Low/Close/Volume.
+        """
+
+    @abstractmethod
+    def last_prices(
+        self, tickers: Iterable[str], *, interval: str = "1m", batch_size: int = 25
+    ) -> Dict[str, float]:
+        """Último preço por ticker base."""
+
+    @abstractmethod
+    def day_quotes(
+        self, tickers: Iterable[str], *, batch_size: int = 50
+    ) -> Dict[str, Dict[str, float]]:
+        """
+        Barra do dia por ticker base: {"preco", "abertura", "maxima", "minima"}
+        e, quando a fonte informa, "moeda".
+        """
+
+
+class YFinanceProvider(MarketDataProvider):
+    nome = "yfinance"
+
+    def daily_bars(self, tickers, start, end, *, batch_size=50):
+        return fetch_daily_bars(tickers, start, end, batch_size=batch_size)
+
+    def last_prices(self, tickers, *, interval="1m", batch_size=25):
+        return download_intraday_quotes(tickers, interval=interval, batch_size=batch_size)
+
+    def day_quotes(self, tickers, *, batch_size=50):
+        return fetch_day_quotes(tickers, batch_size=batch_size)
+
+
+class MT5Provider(MarketDataProvider):
+    """
+    Cotações via API MT5 de uma VM. A API não expõe histórico diário, então
+    daily_bars é atendido pelo yfinance.
+    """
+
+    nome = "mt5"
+
+    _ALIASES = {
+        "preco": ("last", "ask", "bid", "price"),
+        "abertura": ("open", "open_price", "openPrice", "session_open"),
+        "maxima": ("high", "max", "maximum", "high_price", "highPrice", "max_price"),
+        "minima": ("low", "min", "minimum", "low_price", "lowPrice", "min_price"),
+    }
+
+    def __init__(self, ip: str):
+        self.ip = ip
+        self.client = MT5Client(ip)
+        self._historico = YFinanceProvider()
+
+    def daily_bars(self, tickers, start, end, *, batch_size=50):
+        return self._historico.daily_bars(tickers, start, end, batch_size=batch_size)
+
+    def _cotacao(self, base: str) -> Dict[str, float]:
+        info: Dict[str, float] = {}
+        try:
+            resp = self.client.cotacao(base)
+        except Exception:
+            return info
+        if not resp.ok or not isinstance(resp.data, dict):
+            return info
+        for chave, aliases in self._ALIASES.items():
+            for alias in aliases:
+                val = _finite(resp.data.get(alias))
+                if val is not None:
+                    info[chave] = val
+                    break
+        moeda = resp.data.get("currency")
+        if info and isinstance(moeda, str) and moeda:
+            info["moeda"] = moeda
+        return info
+
+    def last_prices(self, tickers, *, interval="1m", batch_size=25):
+        out: Dict[str, float] = {}
+        for base in _normalize(tickers):
+            preco = self._cotacao(base).get("preco")
+            if preco is not None:
+                out[base] = preco
+        return out
+
+    def day_quotes(self, tickers, *, batch_size=50):
+        out: Dict[str, Dict[str, float]] = {}
+        for base in _normalize(tickers):
+            info = self._cotacao(base)
+            if info:
+                out[base] = info
+        return out
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Reproduz barras diárias gravadas em disco: <dir>/<TICKER>.parquet ou
+    <dir>/<TICKER>.csv, com coluna de data (Date/data) e Open/High/Low/Close/Volume.
+
+    O "agora" do replay é settings.MARKET_DATA_REPLAY_DATA (YYYY-MM-DD);
+    sem ela, usa a última barra de cada arquivo. Último preço e barra do dia
+    são o fechamento/OHLC da barra nessa data.
+    """
+
+    nome = "replay"
+
+    def __init__(self, diretorio: Path, data_ref: Optional[date] = None):
+        self.diretorio = Path(diretorio)
+        self.data_ref = data_ref
+        self._frames: Dict[str, Optional[pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+
+    def _ler(self, base: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            if base in self._frames:
+                return self._frames[base]
+
+        df = None
+        parquet = self.diretorio / f"{base}.parquet"
+        csv = self.diretorio / f"{base}.csv"
+        try:
+            if parquet.exists():
+                df = pd.read_parquet(parquet)
+            elif csv.exists():
+                df = pd.read_csv(csv)
+        except Exception:
+            logger.warning("Arquivo de replay ilegível para %s", base, exc_info=True)
+            df = None
+
+        if df is not None:
+            col_data = next((c for c in ("Date", "data", "date") if c in df.columns), None)
+            if col_data is not None:
+                df = df.set_index(col_data)
+            df.index = pd.to_datetime(df.index).normalize()
+            df.index.name = "Date"
+            df = df[[c for c in OHLCV_COLUMNS if c in df.columns]].sort_index()
+            if self.data_ref is not None:
+                df = df[df.index <= pd.Timestamp(self.data_ref)]
+
+        with self._lock:
+            self._frames[base] = df
+        return df
+
+    def daily_bars(self, tickers, start, end, *, batch_size=50):
+        out: Dict[str, pd.DataFrame] = {}
+        ini, fim = pd.Timestamp(start), pd.Timestamp(end)
+        for base in _normalize(tickers):
+            df = self._ler(base)
+            if df is None:
+                continue
+            fatia = df[(df.index >= ini) & (df.index < fim)]
+            if not fatia.empty:
+                out[base] = fatia
+        return out
+
+    def day_quotes(self, tickers, *, batch_size=50):
+        out: Dict[str, Dict[str, float]] = {}
+        for base in _normalize(tickers):
+            df = self._ler(base)
+            if df is None or df.empty:
+                continue
+            last = df.iloc[-1]
+            info: Dict[str, float] = {}
+            for chave, col in (("preco", "Close"), ("abertura", "Open"), ("maxima", "High"), ("minima", "Low")):
+                val = _finite(last.get(col))
+                if val is not None:
+                    info[chave] = val
+            if info:
+                info["moeda"] = MOEDA_B3
+                out[base] = info
+        return out
+
+    def last_prices(self, tickers, *, interval="1m", batch_size=25):
+        return {
+            base: info["preco"]
+            for base, info in self.day_quotes(tickers).items()
+            if "preco" in info
+        }
+
+
+_provider: Optional[MarketDataProvider] = None
+_provider_lock = threading.Lock()
+
+
+def _build_provider(nome: str) -> MarketDataProvider:
+    if nome == "yfinance":
+        return YFinanceProvider()
+    if nome == "mt5":
+        ip = getattr(settings, "MARKET_DATA_MT5_IP", None)
+        if not ip:
+            raise ValueError("MARKET_DATA_PROVIDER='mt5' exige settings.MARKET_DATA_MT5_IP")
+        return MT5Provider(ip)
+    if nome == "replay":
+        diretorio = getattr(settings, "MARKET_DATA_REPLAY_DIR", None) or (
+            Path(settings.BASE_DIR) / "replay"
+        )
+        data_ref = getattr(settings, "MARKET_DATA_REPLAY_DATA", None)
+        if isinstance(data_ref, str):
+            data_ref = date.fromisoformat(data_ref)
+        return ReplayProvider(diretorio, data_ref)
+    raise ValueError(f"MARKET_DATA_PROVIDER desconhecido: {nome!r}")
+
+
+def get_provider() -> MarketDataProvider:
+    """Provider configurado em settings.MARKET_DATA_PROVIDER (instância por processo)."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = _build_provider(getattr(settings, "MARKET_DATA_PROVIDER", "yfinance"))
+        return _provider
+
+
+def get_provider_cliente(ip: Optional[str]) -> Optional[MarketDataProvider]:
+    """
+    Provider MT5 da VM de um cliente (consulta "MT5 primeiro").
+    Retorna None quando não há IP, quando settings.MARKET_DATA_MT5_CLIENTES
+    está desligado ou no modo replay (que nunca sai para a rede).
+    """
+    if not ip:
+        return None
+    if getattr(settings, "MARKET_DATA_PROVIDER", "yfinance") == "replay":
+        return None
+    if not getattr(settings, "MARKET_DATA_MT5_CLIENTES", True):
+        return None
+    return MT5Provider(ip)
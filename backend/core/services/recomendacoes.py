@@ -0,0 +1,414 @@
+"""
+Motor único de recomendações (modelo Random Forest + alvo k×ATR×f_RSI).
+
+O fechamento e o intraday usam o mesmo pipeline; muda só a origem do preço
+de entrada:
+
+- "fechamento": fechamento do último pregão;
+- "intraday":   cotação ao vivo (fetch_intraday_quotes);
+- dict:         mapa explícito {ticker: preço}.
+
+A base (snapshot do A02 ou, na falta dele, janela de ~80 pregões) e as
+features que não dependem do preço são montadas uma vez em carregar_base;
+pontuar aplica um vetor de preços sobre ela, então a mesma base pode ser
+pontuada várias vezes com preços diferentes. PontuadorIntraday usa isso no
+modo daemon: mantém base e pontuação em memória e, a cada ciclo, repontua
+só os tickers cujo preço andou mais que `epsilon`.
+"""
+
+from decimal import Decimal
+from typing import Dict, Mapping, Union
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Max
+
+from core.indicators import defasar, rolling_max, rolling_mean, rolling_min
+from core.ml.cache_modelos import carregar_artefato
+from core.models import Acao, Cotacao, RecomendacaoDiaria
+from core.services.bulk_upsert import bulk_upsert, normalizar_valor
+from core.services.estado_janela import carregar_estados, ultima_linha
+from core.services.intraday_quotes import fetch_intraday_quotes
+from core.services.janela_cotacoes import CAMPOS_OBRIGATORIOS, JANELA_4M, filtrar_janela
+
+
+FONTE_FECHAMENTO = "fechamento"
+FONTE_INTRADAY = "intraday"
+
+FontePreco = Union[str, Mapping[str, float]]
+
+MODELO_PATH = settings.BASE_DIR / "modelos" / "modelo_random_forest.pkl"
+
+FEATURES_MODELO = [
+    'fechamento_div_wma602',
+    'wma17_div_wma34',
+    'obv_ratio',
+    'rsi_14',
+    'volume_ratio',
+    'candlestick',
+    'potencial_alta',
+]
+
+# alvo: k_base * ATR * f_RSI, com cap pela resistência de 4m
+K_BASE = 1.3
+C1 = 0.5
+POS_RANGE_ESTICADO = 0.85
+
+
+def _base_snapshot(ultima_data):
+    """Última linha + agregados de 4m lidos do snapshot mantido pelo A02."""
+    estados = carregar_estados(ultima_data)
+    linhas = []
+    for estado in estados.values():
+        linha = ultima_linha(estado)
+        linha['acao__ticker'] = estado.acao.ticker
+        linha['data'] = ultima_data
+        linhas.append(linha)
+
+    df = pd.DataFrame(linhas)
+    if not df.empty:
+        df = df.dropna(subset=CAMPOS_OBRIGATORIOS)
+        df = df[df['volume'] > 0]
+    return df, set(estados)
+
+
+def _base_janela(ultima_data, excluir=()):
+    """Calcula os agregados de 4m a partir da janela de cotações (ações sem snapshot)."""
+    # só os últimos ~80 pregões: suficiente para rsi_4m, max/min_4m e obv_5d
+    filtros = {f'{campo}__isnull': False for campo in CAMPOS_OBRIGATORIOS}
+    qs = filtrar_janela(Cotacao.objects, JANELA_4M, ate=ultima_data).filter(
+        volume__gt=0, **filtros
+    ).exclude(acao_id__in=list(excluir)).values(
+        'data', 'acao__ticker', 'fechamento', 'atr', 'wma602', 'wma17', 'wma34',
+        'obv', 'rsi_14', 'volume', 'media_volume_20d', 'fechamento_anterior',
+        'maxima', 'minima'
+    )
+
+    df = pd.DataFrame.from_records(qs)
+    if df.empty:
+        return df
+
+    campos_float = [c for c in df.columns if c not in ('data', 'acao__ticker')]
+    df[campos_float] = df[campos_float].astype(float)
+
+    # ordena por ticker/data para cálculos de janelas
+    df.sort_values(by=['acao__ticker', 'data'], inplace=True)
+    por_ticker = df['acao__ticker']
+
+    df['obv_5d'] = defasar(df['obv'], 5, por=por_ticker)
+    df['rsi_4m'] = rolling_mean(df['rsi_14'], JANELA_4M, min_periods=1, por=por_ticker)
+    df['max_4m'] = rolling_max(df['maxima'], JANELA_4M, min_periods=1, por=por_ticker)
+    df['min_4m'] = rolling_min(df['minima'], JANELA_4M, min_periods=1, por=por_ticker)
+
+    # mantém apenas a data mais recente para cada ticker
+    return df[df['data'] == ultima_data].copy()
+
+
+def ultima_data_cotacoes():
+    return Cotacao.objects.aggregate(ultima=Max('data'))['ultima']
+
+
+def carregar_base(ultima_data, *, abaixo_wma602=False):
+    """
+    Uma linha por ticker no pregão `ultima_data`, com os agregados de 4m e as
+    features que não dependem do preço de entrada. Indexada por ticker.
+    `abaixo_wma602` restringe aos papéis que fecharam abaixo da WMA602.
+    """
+    df_snapshot, com_snapshot = _base_snapshot(ultima_data)
+    df_janela = _base_janela(ultima_data, excluir=com_snapshot)
+    print(f"📦 {len(df_snapshot)} ações via snapshot, {len(df_janela)} via janela de cotações")
+
+    partes = [d for d in (df_snapshot, df_janela) if not d.empty]
+    if not partes:
+        return pd.DataFrame()
+    df = pd.concat(partes, ignore_index=True)
+
+    num = [c for c in df.columns if c not in ('data', 'acao__ticker')]
+    df[num] = df[num].astype(float)
+
+    if abaixo_wma602:
+        df = df[df['fechamento'] < df['wma602']]
+
+    for col in ['wma34', 'wma602', 'media_volume_20d', 'fechamento_anterior', 'obv_5d', 'atr']:
+        df[col] = df[col].replace(0, np.nan)
+
+    df['amplitude_4m'] = df['max_4m'] - df['min_4m']
+    df['wma17_div_wma34'] = df['wma17'] / df['wma34']
+    df['obv_ratio'] = df['obv'] / df['obv_5d']
+    df['volume_ratio'] = df['volume'] / df['media_volume_20d']
+    # f_RSI dentro de [0.85, 1.25]
+    df['fator_rsi'] = ((70 - df['rsi_4m']) / 70).clip(lower=0.85, upper=1.25)
+
+    return df.set_index('acao__ticker', drop=False)
+
+
+def precos_entrada(base: pd.DataFrame, fonte: FontePreco) -> pd.Series:
+    """Preço de entrada por ticker (índice de `base`) conforme a fonte."""
+    if isinstance(fonte, Mapping):
+        precos = {str(t).strip().upper(): p for t, p in fonte.items()}
+    elif fonte == FONTE_FECHAMENTO:
+        return base['fechamento']
+    elif fonte == FONTE_INTRADAY:
+        print("\n🔄 Buscando cotações intraday...")
+        precos = fetch_intraday_quotes(base.index.unique())
+    else:
+        raise ValueError(f"Fonte de preço inválida: {fonte!r}")
+    return pd.to_numeric(base.index.to_series().map(precos), errors='coerce')
+
+
+def pontuar(base: pd.DataFrame, precos: pd.Series, *, modelo=None) -> pd.DataFrame:
+    """
+    Aplica os preços de entrada sobre a base: features dependentes do preço,
+    alvo, probabilidade do modelo e faixa. Tickers sem preço são descartados.
+    """
+    df = base.copy()
+    df['preco_compra'] = precos.reindex(df.index).astype(float)
+    df = df[df['preco_compra'].notna()]
+    if df.empty:
+        return df
+
+    df['fechamento_div_wma602'] = df['preco_compra'] / df['wma602']
+    df['candlestick'] = df['preco_compra'] / df['fechamento_anterior']
+    # potencial usando ATR direto (D1/14) como base
+    df['potencial_alta'] = df['atr'] / df['preco_compra']
+
+    # posição no range de 4m; esticado → k_base menor e cap mais apertado
+    df['pos_range'] = (df['preco_compra'] - df['min_4m']) / df['amplitude_4m']
+    esticado = df['pos_range'] > POS_RANGE_ESTICADO
+    df['k_base'] = np.where(esticado, K_BASE * 0.85, K_BASE)
+    df['c1'] = np.where(esticado, 1.0, C1)
+
+    # alvo bruto e cap por resistência (só quando acima do preço de entrada)
+    df['target_raw'] = df['preco_compra'] + (df['k_base'] * df['atr'] * df['fator_rsi'])
+    df['cap_resistance'] = df['max_4m'] - (df['c1'] * df['atr'])
+    df['valor_alvo'] = np.where(
+        (df['cap_resistance'].notna()) & (df['cap_resistance'] > df['preco_compra']),
+        np.minimum(df['target_raw'], df['cap_resistance']),
+        df['target_raw']
+    )
+
+    df = df.dropna(subset=FEATURES_MODELO)
+    if df.empty:
+        return df
+
+    if modelo is None:
+        modelo = carregar_artefato(MODELO_PATH)
+    df['probabilidade'] = modelo.predict_proba(df[FEATURES_MODELO])[:, 1]
+    df['lucro_perc'] = ((df['valor_alvo'] / df['preco_compra']) - 1) * 100
+    df['probabilidade_pct'] = (df['probabilidade'] * 100).round(2)
+    df['classificacao'] = np.select(
+        [df['probabilidade_pct'] >= 15, df['probabilidade_pct'] >= 5],
+        ['forte', 'média'],
+        default='fraca',
+    )
+    return df
+
+
+def selecionar_top(df: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    resultado = df[['acao__ticker', 'preco_compra', 'probabilidade_pct', 'classificacao', 'lucro_perc', 'valor_alvo']]
+    return resultado.rename(columns={
+        'acao__ticker': 'ticker',
+        'preco_compra': 'valor_compra',
+        'probabilidade_pct': 'probabilidade (%)'
+    }).sort_values(by='probabilidade (%)', ascending=False, kind='stable').head(top_n)
+
+
+def imprimir_recomendacoes(resultado: pd.DataFrame, entrada: str) -> None:
+    print(f"\n📈 Recomendações com base no modelo (entrada = {entrada}, alvo = k×ATR×f_RSI, cap em MAX_4m):\n")
+    print(f"{'Ticker':<8} {'Compra':>8} {'Prob. (%)':>11} {'Faixa':>8} {'Lucro (%)':>11} {'Alvo':>10}")
+    print("-" * 60)
+    for _, row in resultado.iterrows():
+        print(f"{row['ticker']:<8} "
+              f"{row['valor_compra']:>8.2f} "
+              f"{row['probabilidade (%)']:>11.2f} "
+              f"{row['classificacao']:>8} "
+              f"{row['lucro_perc']:>11.2f} "
+              f"{row['valor_alvo']:>10.4f}")
+
+
+CAMPOS_RECOMENDACAO = [
+    'preco_compra', 'alvo_sugerido', 'perc_alvo', 'probabilidade', 'abaixo_wma',
+    'wma602', 'cruzamento_medias', 'volume_acima_media', 'obv_crescente',
+]
+
+
+def montar_recomendacoes(df: pd.DataFrame, data, ids: Dict[str, int], origem='ia'):
+    """RecomendacaoDiaria (não gravadas) para as linhas pontuadas de `df` com acao_id conhecido."""
+    df = df[df['acao__ticker'].isin(ids)]
+    cruzamento = (df['wma17_div_wma34'] > 1).tolist()
+    volume_acima = (df['volume_ratio'] > 1).tolist()
+    obv_cresc = (df['obv_ratio'] > 1).tolist()
+    return [
+        RecomendacaoDiaria(
+            acao_id=ids[ticker],
+            data=data,
+            preco_compra=Decimal(preco),
+            alvo_sugerido=Decimal(alvo),
+            perc_alvo=Decimal(lucro).quantize(Decimal('0.01')),
+            probabilidade=Decimal(prob).quantize(Decimal('0.01')),
+            abaixo_wma=True,
+            wma602=Decimal(wma602),
+            cruzamento_medias=cruza,
+            volume_acima_media=vol,
+            obv_crescente=obv,
+            origem=origem,
+        )
+        for ticker, preco, alvo, lucro, prob, wma602, cruza, vol, obv in zip(
+            df['acao__ticker'], df['preco_compra'], df['valor_alvo'],
+            df['lucro_perc'], df['probabilidade_pct'], df['wma602'],
+            cruzamento, volume_acima, obv_cresc,
+        )
+    ]
+
+
+def ids_por_ticker(tickers) -> Dict[str, int]:
+    tickers = list(tickers)
+    ids = dict(Acao.objects.filter(ticker__in=tickers).values_list('ticker', 'id'))
+    for ticker in sorted(set(tickers) - set(ids)):
+        print(f"⚠️ Ação não encontrada no banco: {ticker}")
+    return ids
+
+
+def salvar_recomendacoes(df_top, data, origem='ia'):
+    """
+    Grava as recomendações do dia em um único upsert em lote
+    (chave acao/data/origem), resolvendo ticker → acao_id em uma consulta.
+    """
+    ids = ids_por_ticker(df_top['acao__ticker'].unique())
+    total = bulk_upsert(
+        RecomendacaoDiaria,
+        montar_recomendacoes(df_top, data, ids, origem),
+        unique_fields=['acao', 'data', 'origem'],
+        update_fields=CAMPOS_RECOMENDACAO,
+    )
+    print(f"✅ {total} recomendações gravadas")
+    return total
+
+
+def gerar_recomendacoes(
+    fonte: FontePreco = FONTE_INTRADAY,
+    top_n: int = 30,
+    *,
+    abaixo_wma602: bool = False,
+    persistir: bool = False,
+    origem: str = 'ia',
+):
+    """
+    Pontua o universo com o preço de entrada de `fonte` e devolve as `top_n`
+    recomendações (lista de dicts). Com `persistir`, grava o top em
+    RecomendacaoDiaria com a `origem` informada.
+    """
+    ultima_data = ultima_data_cotacoes()
+    if not ultima_data:
+        print("❌ Nenhuma data disponível.")
+        return
+
+    print(f"📅 Usando dados até: {ultima_data}")
+
+    base = carregar_base(ultima_data, abaixo_wma602=abaixo_wma602)
+    if base.empty:
+        print("❌ Nenhuma ação elegível.")
+        return
+
+    df = pontuar(base, precos_entrada(base, fonte))
+    if df.empty:
+        print("⚠️ Nenhuma ação válida após limpeza dos dados.")
+        return
+
+    resultado = selecionar_top(df, top_n)
+    entrada = fonte if isinstance(fonte, str) else "preços informados"
+    imprimir_recomendacoes(resultado, entrada)
+
+    if persistir:
+        print("\n💾 Salvando recomendações no banco de dados...")
+        salvar_recomendacoes(df.loc[resultado.index], ultima_data, origem)
+
+    return resultado.to_dict(orient='records')
+
+
+def _assinatura(rec: RecomendacaoDiaria) -> tuple:
+    """Valores gravados de uma recomendação, na precisão do banco."""
+    return tuple(
+        normalizar_valor(rec._meta.get_field(campo), getattr(rec, campo))
+        for campo in CAMPOS_RECOMENDACAO
+    )
+
+
+class PontuadorIntraday:
+    """
+    Estado do modo daemon: base do pregão, última pontuação, preço usado em
+    cada ticker e o que já está gravado em RecomendacaoDiaria.
+
+    A cada ciclo busca as cotações, repontua só os tickers cujo preço mudou
+    mais que `epsilon` (variação relativa ao preço da última pontuação) e
+    grava apenas as recomendações do top cujo conteúdo mudou. A base é
+    remontada quando aparece um pregão novo em cotacoes_cotacao; o modelo
+    vem do cache de artefatos, que já recarrega se o arquivo for trocado.
+    """
+
+    def __init__(self, top_n: int = 30, *, epsilon: float = 0.001, origem: str = 'ia'):
+        self.top_n = top_n
+        self.epsilon = epsilon
+        self.origem = origem
+        self.data = None
+        self.base = pd.DataFrame()
+        self.pontuado = pd.DataFrame()
+        self.precos = pd.Series(dtype=float)
+        self.ids: Dict[str, int] = {}
+        self.gravado: Dict[int, tuple] = {}
+
+    def _recarregar_base(self, data) -> None:
+        print(f"📅 Montando base do pregão {data}")
+        self.data = data
+        self.base = carregar_base(data)
+        self.pontuado = self.base.iloc[0:0]
+        self.precos = pd.Series(dtype=float)
+        self.ids = ids_por_ticker(self.base.index) if not self.base.empty else {}
+
+        # o que já foi gravado hoje (ex.: execução anterior) não é regravado
+        existentes = RecomendacaoDiaria.objects.filter(data=data, origem=self.origem).only(
+            'acao_id', *CAMPOS_RECOMENDACAO
+        )
+        self.gravado = {rec.acao_id: _assinatura(rec) for rec in existentes}
+
+    def ciclo(self) -> Dict:
+        """Executa um ciclo; devolve contagens e o top atual (DataFrame)."""
+        data = ultima_data_cotacoes()
+        if data is None:
+            return {"repontuados": 0, "gravados": 0, "top": pd.DataFrame()}
+        if data != self.data:
+            self._recarregar_base(data)
+        if self.base.empty:
+            return {"repontuados": 0, "gravados": 0, "top": pd.DataFrame()}
+
+        cotacoes = fetch_intraday_quotes(self.base.index.unique())
+        precos = pd.to_numeric(self.base.index.to_series().map(cotacoes), errors='coerce').dropna()
+
+        anteriores = self.precos.reindex(precos.index)
+        moveu = anteriores.isna() | ((precos - anteriores).abs() > self.epsilon * anteriores.abs())
+        movidos = precos[moveu]
+
+        if not movidos.empty:
+            novos = pontuar(self.base.loc[movidos.index], movidos)
+            # quem moveu e saiu da pontuação (features inválidas) também sai do ranking
+            mantidos = self.pontuado[~self.pontuado.index.isin(movidos.index)]
+            self.pontuado = pd.concat([mantidos, novos]) if not novos.empty else mantidos
+            self.precos = pd.concat([self.precos[~self.precos.index.isin(movidos.index)], movidos])
+
+        if self.pontuado.empty:
+            return {"repontuados": len(movidos), "gravados": 0, "top": pd.DataFrame()}
+
+        top = selecionar_top(self.pontuado, self.top_n)
+        recs = montar_recomendacoes(self.pontuado.loc[top.index], self.data, self.ids, self.origem)
+        alterados = [rec for rec in recs if self.gravado.get(rec.acao_id) != _assinatura(rec)]
+        if alterados:
+            bulk_upsert(
+                RecomendacaoDiaria,
+                alterados,
+                unique_fields=['acao', 'data', 'origem'],
+                update_fields=CAMPOS_RECOMENDACAO,
+            )
+            self.gravado.update({rec.acao_id: _assinatura(rec) for rec in alterados})
+
+        return {"repontuados": len(movidos), "gravados": len(alterados), "top": top}
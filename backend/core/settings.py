@@ -169,3 +169,24 @@ MT5_CLIENT_API_TIMEOUT = 5
 
 
 
+
+
+# Cache de dados de mercado (core/services/market_cache.py)
+MARKET_DATA_CACHE_DIR = BASE_DIR / "cache" / "market_data"
+MARKET_DATA_CACHE_TTL = {
+    "daily": 7 * 24 * 3600,  # barras diárias de pregões encerrados
+    "day": 15,  # barra do pregão corrente
+    "quote": 5,  # último preço intraday
+}
+MARKET_DATA_CACHE_LRU_SIZE = 4096
+
+# Provider de dados de mercado (core/services/market_data.py):
+# "yfinance" | "mt5" | "replay" (arquivos locais, sem rede)
+MARKET_DATA_PROVIDER = "yfinance"
+MARKET_DATA_MT5_IP = None  # VM de referência quando MARKET_DATA_PROVIDER = "mt5"
+MARKET_DATA_MT5_CLIENTES = True  # consulta a VM MT5 do cliente antes do provider
+MARKET_DATA_REPLAY_DIR = BASE_DIR / "replay"  # <TICKER>.parquet | <TICKER>.csv
+MARKET_DATA_REPLAY_DATA = None  # "YYYY-MM-DD": data simulada do replay
+
+# Feature store do modelo direcional (core/ml/feature_store.py): Parquet por ação
+FEATURE_STORE_DIR = BASE_DIR / "cache" / "features"
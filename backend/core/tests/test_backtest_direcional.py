@@ -0,0 +1,158 @@
+"""
+Simulação vetorizada do backtest direcional (simular_trades/backtest_serie)
+contra _simular_trade_dia, o laço original por trade.
+
+Séries sintéticas fixas, sem banco nem modelo: as probabilidades entram
+prontas no SeriesBacktest.
+"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+django = pytest.importorskip("django")
+django.setup()
+
+from core.ml.backtest_direcional import (  # noqa: E402
+    SeriesBacktest,
+    _simular_trade_dia,
+    backtest_serie,
+    simular_trades,
+)
+
+
+def _serie(fechamento, maxima=None, minima=None, inicio="2024-01-01", prob_up=None, prob_down=None):
+    fechamento = np.asarray(fechamento, dtype=float)
+    n = len(fechamento)
+    return SeriesBacktest(
+        acao=None,
+        datas=pd.bdate_range(inicio, periods=n).to_numpy().astype("datetime64[D]"),
+        fechamento=fechamento,
+        maxima=np.asarray(maxima if maxima is not None else fechamento, dtype=float),
+        minima=np.asarray(minima if minima is not None else fechamento, dtype=float),
+        prob_up=np.asarray(prob_up if prob_up is not None else np.ones(n), dtype=float),
+        prob_down=np.asarray(prob_down if prob_down is not None else np.ones(n), dtype=float),
+        entradas=np.arange(n - 1),
+    )
+
+
+def _backtest_referencia(serie, threshold_up, threshold_down, stop_percent, alvo_percentual, dias):
+    """Laço original de executar_backtest_completo, com as probabilidades já calculadas."""
+    df = pd.DataFrame(
+        {
+            "data": pd.to_datetime(serie.datas),
+            "fechamento": serie.fechamento,
+            "maxima": serie.maxima,
+            "minima": serie.minima,
+        }
+    )
+    trades = []
+    for idx in serie.entradas:
+        janela_fut = df.iloc[idx + 1 : idx + 1 + 25]
+        p0 = float(serie.fechamento[idx])
+        for lado, prob, threshold in (
+            ("COMPRA", serie.prob_up[idx], threshold_up),
+            ("VENDA", serie.prob_down[idx], threshold_down),
+        ):
+            if prob >= threshold:
+                data_saida, preco_saida, ret, resultado = _simular_trade_dia(
+                    lado, p0, janela_fut,
+                    alvo_percentual=alvo_percentual,
+                    stop_percent=stop_percent,
+                    dias_equivalentes_selic=dias,
+                )
+                trades.append((df["data"].iloc[idx].date(), data_saida, lado, p0, preco_saida, ret, resultado))
+    return trades
+
+
+def _chave(t):
+    return (t.data_entrada, t.data_saida, t.lado, t.preco_entrada, t.preco_saida,
+            t.retorno_percentual, t.resultado)
+
+
+# -------------------
+# Casos conferidos à mão (entrada no pregão 0, p0 = 100)
+# -------------------
+
+def _saida_do_pregao_0(serie, lado, dias=None):
+    saida, preco, retorno, codigo = simular_trades(serie, lado, np.array([0]), 0.05, -0.20, dias)
+    return int(saida[0]), float(preco[0]), float(retorno[0]), ["ALVO", "STOP", "TEMPO"][int(codigo[0])]
+
+
+def test_compra_alvo():
+    serie = _serie([100.0, 101.0, 102.0], maxima=[100.0, 101.0, 106.0])
+    assert _saida_do_pregao_0(serie, "COMPRA") == (2, 105.0, pytest.approx(0.05), "ALVO")
+
+
+def test_compra_stop():
+    serie = _serie([100.0, 90.0, 85.0], minima=[100.0, 85.0, 79.0])
+    assert _saida_do_pregao_0(serie, "COMPRA") == (2, 80.0, pytest.approx(-0.20), "STOP")
+
+
+def test_alvo_tem_precedencia_sobre_stop_no_mesmo_pregao():
+    serie = _serie([100.0, 100.0], maxima=[100.0, 130.0], minima=[100.0, 70.0])
+    assert _saida_do_pregao_0(serie, "COMPRA")[3] == "ALVO"
+    assert _saida_do_pregao_0(serie, "VENDA")[3] == "ALVO"
+
+
+def test_venda_alvo_e_stop():
+    alvo = _serie([100.0, 96.0], minima=[100.0, 94.0])
+    assert _saida_do_pregao_0(alvo, "VENDA") == (1, 95.0, pytest.approx(100.0 / 95.0 - 1.0), "ALVO")
+    stop = _serie([100.0, 110.0], maxima=[100.0, 121.0])
+    assert _saida_do_pregao_0(stop, "VENDA") == (1, 120.0, pytest.approx(100.0 / 120.0 - 1.0), "STOP")
+
+
+def test_tempo_no_decimo_pregao():
+    serie = _serie([100.0] * 10 + [101.0] + [100.0] * 5)
+    assert _saida_do_pregao_0(serie, "COMPRA") == (10, 101.0, pytest.approx(0.01), "TEMPO")
+
+
+def test_tempo_pela_data_selic():
+    # pregões em dias úteis a partir de segunda; 1º pregão da janela = terça,
+    # + 3 dias corridos = sexta (pregão 4)
+    serie = _serie([100.0, 100.0, 100.0, 100.0, 102.0, 100.0, 100.0])
+    assert _saida_do_pregao_0(serie, "COMPRA", dias=3) == (4, 102.0, pytest.approx(0.02), "TEMPO")
+
+
+def test_fim_da_serie_sai_no_ultimo_pregao():
+    serie = _serie([100.0, 100.0, 103.0])
+    assert _saida_do_pregao_0(serie, "COMPRA") == (2, 103.0, pytest.approx(0.03), "TEMPO")
+
+
+def test_stop_positivo_e_rejeitado():
+    with pytest.raises(ValueError):
+        simular_trades(_serie([100.0, 100.0]), "COMPRA", np.array([0]), 0.05, 0.20, None)
+
+
+# -------------------
+# Série sintética: backtest_serie x laço com _simular_trade_dia
+# -------------------
+
+@pytest.mark.parametrize("dias", [None, 10])
+@pytest.mark.parametrize("thresholds", [(0.0, 0.0), (0.55, 0.6)])
+def test_backtest_serie_confere_com_laco_original(dias, thresholds):
+    rng = np.random.default_rng(5)
+    n = 300
+    fech = 30 * np.exp(np.cumsum(rng.normal(0, 0.06, n)))
+    amplitude = np.abs(rng.normal(0, 0.02, n)) * fech
+    serie = _serie(
+        fech,
+        fech + amplitude,
+        fech - amplitude,
+        inicio="2023-06-01",
+        prob_up=rng.random(n),
+        prob_down=rng.random(n),
+    )
+    threshold_up, threshold_down = thresholds
+
+    vet = [_chave(t) for t in backtest_serie(serie, threshold_up, threshold_down, -0.20, 0.05, dias)]
+    ref = _backtest_referencia(serie, threshold_up, threshold_down, -0.20, 0.05, dias)
+
+    assert len(vet) == len(ref) > 0
+    for a, b in zip(vet, ref):
+        assert a[:3] == b[:3] and a[6] == b[6]
+        np.testing.assert_allclose(a[3:6], b[3:6], rtol=1e-12, atol=0)
+    assert {t[6] for t in ref} == {"ALVO", "STOP", "TEMPO"}
+    assert isinstance(vet[0][0], date)
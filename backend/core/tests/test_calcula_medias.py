@@ -0,0 +1,86 @@
+"""
+Modo incremental do A02 (calcular_indicadores com semente) contra o
+recálculo completo.
+
+Simula N execuções diárias sobre um "banco" em DataFrame que arredonda os
+indicadores como as DecimalField de Cotacao, e compara o resultado final com
+um único cálculo completo do histórico.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+django = pytest.importorskip("django")
+django.setup()
+
+from core.scripts import A02CalculaMedias as a02  # noqa: E402
+
+
+# casas decimais das colunas em Cotacao
+CASAS = {campo: 2 for campo in a02.CAMPOS_INDICADORES}
+CASAS["atr"] = 4
+
+
+def _historico(n, seed=3):
+    rng = np.random.default_rng(seed)
+    fech = np.round(25 * np.exp(np.cumsum(rng.normal(0, 0.015, n))), 2)
+    amplitude = np.round(np.abs(rng.normal(0, 0.01, n)) * fech, 2)
+    df = pd.DataFrame(
+        {
+            "id": np.arange(1, n + 1),
+            "abertura": fech,
+            "fechamento": fech,
+            "volume": rng.integers(10_000, 1_000_000, n).astype(float),
+            "maxima": fech + amplitude,
+            "minima": fech - amplitude,
+        },
+        index=pd.bdate_range("2019-01-02", periods=n).date,
+    )
+    for campo in a02.CAMPOS_INDICADORES:
+        df[campo] = np.nan
+    return df
+
+
+def _gravar(banco, calculado):
+    for campo, casas in CASAS.items():
+        banco.loc[calculado.index, campo] = calculado[campo].astype(float).round(casas)
+    banco.loc[calculado.index, "target_compra"] = calculado["target_compra"].astype(bool)
+
+
+def _execucao_incremental(banco):
+    """Mesma seleção de calcular_medias_para_acao: semente = última linha completa."""
+    semente = banco.index[banco["max_5dias"].notna()][-1]
+    pos = banco.index.get_loc(semente)
+    janela = banco.iloc[max(pos + 1 - a02.JANELA_AQUECIMENTO, 0):].copy()
+    calculado = a02.calcular_indicadores(janela, semente=semente)
+    _gravar(banco, calculado[calculado.index > semente])
+
+
+@pytest.mark.parametrize("dias", [1, 250])
+def test_incremental_acompanha_o_recalculo_completo(dias):
+    n_inicial = 800
+    completo = _historico(n_inicial + dias)
+
+    banco = completo.iloc[:n_inicial].copy()
+    _gravar(banco, a02.calcular_indicadores(banco.copy()))
+    for i in range(n_inicial, n_inicial + dias):
+        banco = pd.concat([banco, completo.iloc[[i]]])
+        _execucao_incremental(banco)
+
+    referencia = a02.calcular_indicadores(completo.copy())
+
+    # médias de Wilder: além do arredondamento do próprio valor, só o erro da
+    # semente no início da janela, amortecido por p = (1 - 1/período)^(janela-1)
+    # e realimentado geometricamente: limite = meia casa / (1 - p)
+    for coluna in a02.COLUNAS_WILDER:
+        periodo = 14 if coluna == "atr" else int(coluna[3:])
+        p = (1 - 1 / periodo) ** (a02.JANELA_AQUECIMENTO - 1)
+        limite = 0.5 * 10 ** -CASAS[coluna] / (1 - p) + 1e-9
+        np.testing.assert_allclose(banco[coluna], referencia[coluna].astype(float), rtol=0, atol=limite, err_msg=coluna)
+    for coluna in ["obv", "rsi_14", "media_volume_20d", "volume_m3", "max_5dias"]:
+        np.testing.assert_allclose(banco[coluna], referencia[coluna].astype(float), rtol=0, atol=0.005 + 1e-9, err_msg=coluna)
+
+    # o cruzamento wma17/wma34 dos pregões incrementais é o mesmo do recálculo completo
+    novos = banco.index[n_inicial - 5:]
+    assert list(banco.loc[novos, "target_compra"].astype(bool)) == list(referencia.loc[novos, "target_compra"])
@@ -0,0 +1,96 @@
+"""
+retornos_medios_janela_corridos (searchsorted único sobre horizontes × datas)
+contra o laço original por data.
+
+Casos montados à mão para lacunas e fim da série, e uma série sintética
+fixa com feriados/lacunas comparada em vários horizontes numa só chamada.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.ml.features_direcionais import retornos_medios_janela_corridos
+
+
+def _retorno_medio_referencia(df, dias_corridos):
+    """Laço original (um searchsorted por data)."""
+    if df is None or df.empty or dias_corridos <= 0:
+        return None
+    datas = pd.to_datetime(df["data"]).values
+    close = df["fechamento"].astype(float).values
+    if len(datas) < 2:
+        return None
+    retornos = []
+    for i in range(len(datas)):
+        target = datas[i] + np.timedelta64(dias_corridos, "D")
+        j = datas.searchsorted(target, side="left")
+        if j < len(datas):
+            p0 = close[i]
+            p1 = close[j]
+            if p0 and p0 != 0:
+                retornos.append((p1 / p0) - 1.0)
+    if not retornos:
+        return None
+    return float(np.mean(retornos))
+
+
+def _serie(datas, fechamento):
+    return pd.DataFrame({"data": pd.to_datetime(datas), "fechamento": fechamento})
+
+
+# -------------------
+# Casos conferidos à mão
+# -------------------
+
+def test_lacuna_usa_a_primeira_cotacao_depois_do_alvo():
+    # 02/01 + 3 dias = 05/01 (sem pregão) → usa 08/01
+    df = _serie(["2024-01-02", "2024-01-03", "2024-01-08"], [100.0, 110.0, 120.0])
+    out = retornos_medios_janela_corridos(df, [3])
+    # t=02/01: 120/100-1; t=03/01 (+3 = 06/01): 120/110-1; t=08/01: sem futuro
+    assert out[3] == pytest.approx(np.mean([0.2, 120.0 / 110.0 - 1.0]))
+
+
+def test_fim_da_serie_fica_fora():
+    df = _serie(["2024-01-01", "2024-01-02", "2024-01-03"], [100.0, 105.0, 110.0])
+    out = retornos_medios_janela_corridos(df, [2, 3])
+    assert out[2] == pytest.approx(0.10)  # só t=01/01 tem cotação em t+2
+    assert out[3] is None  # nenhuma janela completa
+
+
+def test_preco_base_zero_e_ignorado():
+    df = _serie(["2024-01-01", "2024-01-02", "2024-01-03"], [0.0, 100.0, 110.0])
+    assert retornos_medios_janela_corridos(df, [1])[1] == pytest.approx(0.10)
+
+
+def test_horizontes_invalidos_e_entradas_curtas():
+    df = _serie(["2024-01-01", "2024-01-02"], [100.0, 101.0])
+    assert retornos_medios_janela_corridos(df, [0, -5, 1]) == {0: None, -5: None, 1: pytest.approx(0.01)}
+    assert retornos_medios_janela_corridos(df.iloc[:1], [1]) == {1: None}
+    assert retornos_medios_janela_corridos(pd.DataFrame(), [1]) == {1: None}
+    assert retornos_medios_janela_corridos(df, []) == {}
+
+
+# -------------------
+# Série sintética: vários horizontes numa chamada x laço original
+# -------------------
+
+def test_serie_sintetica_confere_com_laco_original():
+    rng = np.random.default_rng(17)
+    datas = pd.bdate_range("2021-01-04", periods=700)
+    datas = datas[rng.random(len(datas)) > 0.08]  # feriados e pregões faltando
+    fechamento = 40 * np.exp(np.cumsum(rng.normal(0, 0.02, len(datas))))
+    fechamento[rng.integers(0, len(datas), 3)] = 0.0
+    df = _serie(datas, fechamento)
+
+    horizontes = [1, 3, 7, 14, 21, 30, 45, 90, 400, 2000]
+    out = retornos_medios_janela_corridos(df, horizontes)
+
+    assert list(out) == horizontes
+    for h in horizontes:
+        esperado = _retorno_medio_referencia(df, h)
+        if esperado is None:
+            assert out[h] is None, h
+        else:
+            assert out[h] == pytest.approx(esperado, rel=1e-12, abs=1e-15), h
+    assert out[2000] is None
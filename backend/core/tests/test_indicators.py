@@ -0,0 +1,147 @@
+"""
+Valores de referência dos kernels de core.indicators.
+
+Séries pequenas com o resultado conferido à mão, e um painel sintético
+fixo comparado com as fórmulas originais das rotinas (laço por ticker).
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import indicators
+
+
+def _painel(n_tickers=4, n_pregoes=120, seed=7):
+    rng = np.random.default_rng(seed)
+    partes = []
+    for acao_id in range(1, n_tickers + 1):
+        fech = 20 + np.cumsum(rng.normal(0, 0.5, n_pregoes))
+        fech[rng.integers(1, n_pregoes, 5)] = np.nan  # pregões sem fechamento
+        amplitude = np.abs(rng.normal(0, 0.4, n_pregoes))
+        partes.append(
+            pd.DataFrame(
+                {
+                    "acao_id": acao_id,
+                    "fechamento": fech,
+                    "maxima": fech + amplitude,
+                    "minima": fech - amplitude,
+                    "volume": rng.integers(1_000, 100_000, n_pregoes).astype(float),
+                }
+            )
+        )
+    return pd.concat(partes, ignore_index=True)
+
+
+def _obv_referencia(fechamento, volume):
+    obv = [0]
+    for i in range(1, len(fechamento)):
+        if fechamento.iloc[i] > fechamento.iloc[i - 1]:
+            obv.append(obv[-1] + volume.iloc[i])
+        elif fechamento.iloc[i] < fechamento.iloc[i - 1]:
+            obv.append(obv[-1] - volume.iloc[i])
+        else:
+            obv.append(obv[-1])
+    return pd.Series(obv, index=fechamento.index, dtype=float)
+
+
+# -------------------
+# Valores conferidos à mão
+# -------------------
+
+def test_wilder_moving_average():
+    serie = pd.Series([1.0, 2.0, 3.0, 4.0])
+    np.testing.assert_allclose(indicators.wilder_moving_average(serie, 2), [1.0, 1.5, 2.25, 3.125])
+
+
+def test_wilder_moving_average_com_semente():
+    serie = pd.Series([1.0, 2.0, 3.0, 4.0], index=[10, 11, 12, 13])
+    out = indicators.wilder_moving_average(serie, 2, semente=0.0)
+    np.testing.assert_allclose(out, [0.5, 1.25, 2.125, 3.0625])
+    assert list(out.index) == [10, 11, 12, 13]
+
+
+def test_calcular_rsi():
+    out = indicators.calcular_rsi(pd.Series([1.0, 2.0, 1.0]), period=2)
+    assert np.isnan(out.iloc[0])
+    np.testing.assert_allclose(out.iloc[1:], [100.0, 100.0 / 3.0])
+
+
+def test_true_range_e_atr():
+    maxima = pd.Series([11.0, 12.0, 10.5])
+    minima = pd.Series([9.0, 10.5, 8.0])
+    fechamento = pd.Series([10.0, 11.5, 9.0])
+    np.testing.assert_allclose(indicators.true_range(maxima, minima, fechamento), [2.0, 2.0, 3.5])
+    np.testing.assert_allclose(indicators.calcular_atr(maxima, minima, fechamento, 2), [2.0, 2.0, 2.75])
+
+
+def test_calcular_obv():
+    fechamento = pd.Series([10.0, 11.0, 11.0, 10.0, 12.0, np.nan, 13.0])
+    volume = pd.Series([100.0, 200.0, 300.0, 400.0, 500.0, 600.0, 700.0])
+    out = indicators.calcular_obv(fechamento, volume)
+    np.testing.assert_allclose(out, [0.0, 200.0, 200.0, -200.0, 300.0, 300.0, 300.0])
+    np.testing.assert_allclose(indicators.calcular_obv(fechamento, volume, inicial=1000), out + 1000)
+
+
+def test_max_proximos():
+    out = indicators.max_proximos(pd.Series([1.0, 5.0, 2.0, 3.0, 4.0]), 2)
+    np.testing.assert_allclose(out, [np.nan, 5.0, 3.0, 4.0, np.nan])
+
+
+# -------------------
+# Painel sintético: versão agrupada x laço por ticker
+# -------------------
+
+@pytest.fixture(scope="module")
+def painel():
+    return _painel()
+
+
+@pytest.mark.parametrize("periodo", [17, 34, 72, 144, 602])
+def test_wma_painel(painel, periodo):
+    out = indicators.wilder_moving_average(painel["fechamento"], periodo, por=painel["acao_id"])
+    esperado = painel.groupby("acao_id")["fechamento"].transform(
+        lambda s: s.ewm(alpha=1 / periodo, adjust=False).mean()
+    )
+    pd.testing.assert_series_equal(out, esperado, check_names=False, rtol=1e-12)
+
+
+def test_rsi_painel(painel):
+    out = indicators.calcular_rsi(painel["fechamento"], 14, por=painel["acao_id"])
+    for _, df in painel.groupby("acao_id"):
+        pd.testing.assert_series_equal(
+            out.loc[df.index], indicators.calcular_rsi(df["fechamento"], 14), check_names=False, rtol=1e-12
+        )
+
+
+def test_atr_painel(painel):
+    out = indicators.calcular_atr(painel["maxima"], painel["minima"], painel["fechamento"], 14, por=painel["acao_id"])
+    for _, df in painel.groupby("acao_id"):
+        anterior = df["fechamento"].shift(1)
+        tr = pd.concat(
+            [df["maxima"] - df["minima"], (df["maxima"] - anterior).abs(), (df["minima"] - anterior).abs()],
+            axis=1,
+        ).max(axis=1)
+        esperado = tr.ewm(alpha=1 / 14, adjust=False).mean()
+        pd.testing.assert_series_equal(out.loc[df.index], esperado, check_names=False, rtol=1e-12)
+
+
+def test_obv_painel(painel):
+    out = indicators.calcular_obv(painel["fechamento"], painel["volume"], por=painel["acao_id"])
+    for _, df in painel.groupby("acao_id"):
+        esperado = _obv_referencia(df["fechamento"], df["volume"])
+        pd.testing.assert_series_equal(out.loc[df.index], esperado, check_names=False)
+
+
+def test_janelas_moveis_painel(painel):
+    por = painel["acao_id"]
+    media_20d = indicators.rolling_mean(painel["volume"], 20, por=por)
+    volume_m3 = indicators.rolling_mean(indicators.defasar(painel["volume"], por=por), 3, por=por)
+    max_5dias = indicators.max_proximos(painel["fechamento"], 5, por=por)
+    for _, df in painel.groupby("acao_id"):
+        idx = df.index
+        pd.testing.assert_series_equal(media_20d.loc[idx], df["volume"].rolling(20).mean(), check_names=False)
+        pd.testing.assert_series_equal(volume_m3.loc[idx], df["volume"].shift(1).rolling(3).mean(), check_names=False)
+        pd.testing.assert_series_equal(
+            max_5dias.loc[idx], df["fechamento"].shift(-1).rolling(5).max(), check_names=False
+        )
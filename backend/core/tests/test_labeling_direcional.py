@@ -0,0 +1,103 @@
+"""
+Valores de referência de gerar_labels_direcionais.
+
+Casos montados à mão para cada regra do label e uma série sintética fixa
+comparada com o laço duplo original.
+"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from core.ml.labeling_direcional import gerar_labels_direcionais
+
+
+def _serie(fechamento, maxima=None, minima=None, inicio="2024-01-01"):
+    return pd.DataFrame(
+        {
+            "data": pd.bdate_range(inicio, periods=len(fechamento)),
+            "fechamento": fechamento,
+            "maxima": maxima if maxima is not None else fechamento,
+            "minima": minima if minima is not None else fechamento,
+        }
+    )
+
+
+def _labels_referencia(df, janela_pregoes=10, alvo_percentual=0.05):
+    """Laço duplo original (sem data_inicio)."""
+    df = df.sort_values("data").reset_index(drop=True)
+    labels = []
+    n = len(df)
+    for i in range(n):
+        start, end = i + 1, min(i + 1 + janela_pregoes, n)
+        if start >= end:
+            continue
+        p0 = float(df["fechamento"].iloc[i])
+        label = "NONE"
+        for j in range(start, end):
+            up_hit = float(df["maxima"].iloc[j]) >= p0 * (1.0 + alvo_percentual)
+            down_hit = float(df["minima"].iloc[j]) <= p0 * (1.0 - alvo_percentual)
+            if up_hit and not down_hit:
+                label = "UP_FIRST"
+                break
+            if down_hit and not up_hit:
+                label = "DOWN_FIRST"
+                break
+        labels.append(label)
+    return labels
+
+
+def test_regras_do_label():
+    # pregão 0 (p0=100): pregão 1 atinge os dois lados (ignorado), pregão 2 só a alta
+    # pregão 1 (p0=100): pregão 2 só a alta
+    # pregão 2 (p0=100): pregão 3 só a baixa
+    # pregão 3 (p0=100): nada se move até o fim → NONE
+    # pregão 4: último, sem futuro → fora da saída
+    df = _serie(
+        fechamento=[100.0, 100.0, 100.0, 100.0, 100.0],
+        maxima=[100.0, 106.0, 105.0, 100.0, 100.0],
+        minima=[100.0, 94.0, 100.0, 95.0, 100.0],
+    )
+    out = gerar_labels_direcionais(df, janela_pregoes=10, alvo_percentual=0.05)
+    assert list(out["label_direcional"]) == ["UP_FIRST", "UP_FIRST", "DOWN_FIRST", "NONE"]
+    assert list(out["data"]) == list(df["data"].iloc[:4])
+
+
+def test_janela_limita_o_lookahead():
+    df = _serie(fechamento=[100.0, 100.0, 100.0, 110.0])
+    assert list(gerar_labels_direcionais(df, janela_pregoes=2)["label_direcional"]) == [
+        "NONE", "UP_FIRST", "UP_FIRST",
+    ]
+
+
+def test_sem_maxima_minima_usa_fechamento():
+    df = _serie(fechamento=[100.0, 96.0, 94.0]).drop(columns=["maxima", "minima"])
+    assert list(gerar_labels_direcionais(df)["label_direcional"]) == ["DOWN_FIRST", "NONE"]
+
+
+def test_data_inicio_filtra_a_saida_mas_nao_o_futuro():
+    df = _serie(fechamento=[100.0, 100.0, 100.0, 106.0], inicio="2024-01-01")
+    out = gerar_labels_direcionais(df, data_inicio=date(2024, 1, 2))
+    assert list(out["data"].dt.date) == [date(2024, 1, 2), date(2024, 1, 3)]
+    assert list(out["label_direcional"]) == ["UP_FIRST", "UP_FIRST"]
+
+
+def test_entradas_vazias():
+    assert gerar_labels_direcionais(pd.DataFrame()).empty
+    assert gerar_labels_direcionais(_serie(fechamento=[100.0])).empty
+
+
+def test_serie_sintetica_confere_com_laco_original():
+    rng = np.random.default_rng(11)
+    n = 400
+    fech = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    amplitude = np.abs(rng.normal(0, 0.02, n)) * fech
+    # ordem embaralhada: a função ordena por data
+    df = _serie(fech, fech + amplitude, fech - amplitude).sample(frac=1.0, random_state=3)
+
+    out = gerar_labels_direcionais(df, janela_pregoes=10, alvo_percentual=0.05)
+    esperado = _labels_referencia(df, janela_pregoes=10, alvo_percentual=0.05)
+    assert len(out) == n - 1
+    assert list(out["label_direcional"]) == esperado
+    assert set(esperado) == {"UP_FIRST", "DOWN_FIRST", "NONE"}
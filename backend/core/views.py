@@ -9,8 +9,6 @@ import math
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField, Q
 from django.http import JsonResponse
 
-import yfinance as yf
-import pandas as pd
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.core.management import call_command
@@ -56,6 +54,8 @@ from .serializers import (
     RecomendacaoIASerializer,
 )
 from .mt5_client import MT5Client, MT5Response
+from .services.market_cache import get_day_quotes, get_last_prices
+from .services.market_data import get_provider, get_provider_cliente
 from uuid import uuid4
 from datetime import datetime, timedelta
 from django.utils.dateparse import parse_datetime
@@ -550,41 +550,21 @@ class RecomendacaoIAViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 # -------------------
-# Cotações helpers (MT5 first, yfinance fallback)
+# Cotações helpers (MT5 first, provider de dados de mercado como fallback)
 # -------------------
 
 def _mt5_cotacao_info(ip: str | None, base_ticker: str) -> dict[str, float]:
     """Retorna informações de cotação via MT5: preço, máxima e mínima."""
     info: dict[str, float] = {}
-    if not ip or not base_ticker:
+    provider = get_provider_cliente(ip)
+    base = (base_ticker or "").strip().upper()
+    if provider is None or not base:
         return info
     try:
-        mt5 = MT5Client(ip)
-        q = mt5.cotacao(base_ticker)
-        if q.ok and isinstance(q.data, dict):
-            data = q.data
-
-            def _first_float(*keys):
-                for key in keys:
-                    val = _finite_float(data.get(key))
-                    if val is not None:
-                        return val
-                return None
-
-            preco = _first_float("last", "ask", "bid", "price")
-            maxima = _first_float(
-                "high", "max", "maximum", "high_price", "highPrice", "max_price"
-            )
-            minima = _first_float(
-                "low", "min", "minimum", "low_price", "lowPrice", "min_price"
-            )
-
-            if preco is not None:
-                info["preco"] = preco
-            if maxima is not None:
-                info["max"] = maxima
-            if minima is not None:
-                info["min"] = minima
+        q = provider.day_quotes([base]).get(base, {})
+        for chave, campo in (("preco", "preco"), ("max", "maxima"), ("min", "minima")):
+            if q.get(campo) is not None:
+                info[chave] = q[campo]
     except Exception:
         info = {}
     return info
@@ -601,8 +581,8 @@ def _variacao_dia_por_ticker(bases: list[str]) -> dict[str, float]:
 
     Estratégia:
       - tenta obter o preço atual via MT5 usando um IP padrão (quando configurado);
-      - sempre busca dados do dia via yfinance para obter a abertura e,
-        quando necessário, também o preço atual;
+      - sempre busca a barra do dia (cache compartilhado de dados de mercado)
+        para obter a abertura e, quando necessário, também o preço atual;
       - retorna apenas entradas válidas (com abertura > 0).
     """
     # normaliza tickers base (ex.: "PETR4")
@@ -625,23 +605,21 @@ def _variacao_dia_por_ticker(bases: list[str]) -> dict[str, float]:
                 if preco is not None:
                     preços_atuais[base] = preco
             except Exception:
-                # silencioso: fallback total em yfinance
+                # silencioso: fallback total no provider
                 continue
 
-    # 2) yfinance para abertura (e preço atual quando MT5 não trouxe)
+    # 2) barra do dia para abertura (e preço atual quando MT5 não trouxe)
+    try:
+        barras_dia = get_day_quotes(bases_norm)
+    except Exception:
+        barras_dia = {}
+
     for base in bases_norm:
-        ticker_yf = f"{base}.SA"
+        info = barras_dia.get(base, {})
         preco_atual = preços_atuais.get(base)
-        preco_abertura = None
-
-        try:
-            acao = yf.Ticker(ticker_yf)
-            info = acao.info or {}
-            if preco_atual is None:
-                preco_atual = _finite_float(info.get("regularMarketPrice"))
-            preco_abertura = _finite_float(info.get("regularMarketOpen"))
-        except Exception:
-            preco_abertura = None
+        if preco_atual is None:
+            preco_atual = _finite_float(info.get("preco"))
+        preco_abertura = _finite_float(info.get("abertura"))
 
         if preco_atual is None or not preco_abertura or preco_abertura == 0:
             continue
@@ -657,7 +635,7 @@ def _variacao_dia_por_ticker(bases: list[str]) -> dict[str, float]:
 
 
 # -------------------
-# Cotações (yfinance)
+# Cotações (provider de dados de mercado)
 # -------------------
 
 @api_view(["POST"])
@@ -671,31 +649,33 @@ def cotacoes_atuais(request):
     if not tickers:
         return Response({"error": "Nenhum ticker enviado"}, status=400)
 
+    def _base(ticker):
+        return (ticker or "").strip().upper().removesuffix(".SA")
+
+    try:
+        barras_dia = get_day_quotes([_base(t) for t in tickers])
+    except Exception as e:
+        return Response({t: {"erro": str(e)} for t in tickers})
+
     resultado = {}
     for ticker in tickers:
-        try:
-            acao = yf.Ticker(ticker)
-            info = acao.info
-            preco_atual = info.get("regularMarketPrice")
-            preco_abertura = info.get("regularMarketOpen")
-            variacao_pct = None
-            try:
-                if preco_atual is not None and preco_abertura not in (None, 0):
-                    variacao_pct = (
-                        (float(preco_atual) - float(preco_abertura))
-                        / float(preco_abertura)
-                    ) * 100.0
-            except Exception:
-                variacao_pct = None
+        info = barras_dia.get(_base(ticker))
+        if not info:
+            resultado[ticker] = {"erro": "Cotação indisponível"}
+            continue
 
-            resultado[ticker] = {
-                "preco_atual": preco_atual,
-                "preco_abertura": preco_abertura,
-                "variacao_pct": variacao_pct,
-                "moeda": info.get("currency"),
-            }
-        except Exception as e:
-            resultado[ticker] = {"erro": str(e)}
+        preco_atual = info.get("preco")
+        preco_abertura = info.get("abertura")
+        variacao_pct = None
+        if preco_atual is not None and preco_abertura not in (None, 0):
+            variacao_pct = ((preco_atual - preco_abertura) / preco_abertura) * 100.0
+
+        resultado[ticker] = {
+            "preco_atual": preco_atual,
+            "preco_abertura": preco_abertura,
+            "variacao_pct": variacao_pct,
+            "moeda": info.get("moeda"),
+        }
 
     return Response(resultado)
 
@@ -798,7 +778,7 @@ def dashboard_rv(request):
         if info:
             cotacoes[f"{base}.SA"] = info
 
-    # 2) fallback yfinance para preencher ausências ou máximas/mínimas
+    # 2) fallback no provider para preencher ausências ou máximas/mínimas
     tickers_all = list({(op.acao.ticker or '').strip().upper() + ".SA" for op in posicoes if op.acao and op.acao.ticker})
     faltando = [
         t
@@ -808,41 +788,14 @@ def dashboard_rv(request):
     ]
     if faltando:
         try:
-            data = yf.download(
-                tickers=faltando,
-                period="1d",
-                interval="1d",
-                progress=False,
-                auto_adjust=False,
-            )
-            if not isinstance(data, pd.DataFrame) or data.empty:
-                raise ValueError("Sem dados do yfinance")
-
-            # Seleciona a última linha disponível
-            last_row = data.iloc[-1]
-
-            def _get_value(row, column, ticker):
-                try:
-                    if isinstance(row.index, pd.MultiIndex):
-                        raw = row[(column, ticker)]
-                    else:
-                        raw = row[column]
-                except Exception:
-                    return None
-                return _finite_float(raw)
-
+            barras_dia = get_day_quotes([t.removesuffix(".SA") for t in faltando])
             for ticker in faltando:
                 entry = cotacoes.setdefault(ticker, {})
-                close_val = _get_value(last_row, "Close", ticker)
-                high_val = _get_value(last_row, "High", ticker)
-                low_val = _get_value(last_row, "Low", ticker)
-
-                if entry.get("preco") is None and close_val is not None:
-                    entry["preco"] = close_val
-                if entry.get("max") is None and high_val is not None:
-                    entry["max"] = high_val
-                if entry.get("min") is None and low_val is not None:
-                    entry["min"] = low_val
+                info = barras_dia.get(ticker.removesuffix(".SA"), {})
+                for chave, campo in (("preco", "preco"), ("max", "maxima"), ("min", "minima")):
+                    valor = _finite_float(info.get(campo))
+                    if entry.get(chave) is None and valor is not None:
+                        entry[chave] = valor
         except Exception:
             pass
 
@@ -1266,7 +1219,6 @@ from datetime import date
 from decimal import Decimal
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-import yfinance as yf
 
 from .models import Cliente, OperacaoCarteira, Patrimonio
 
@@ -1314,7 +1266,7 @@ def carteira_resumo(request, cliente_id):
 
     percentual = _to_decimal(getattr(cliente, "percentual_patrimonio", 0))
 
-    # -------- Posicionadas (MT5 com fallback yfinance) + POSICIONADO (CUSTO - VALOR_ATUAL) ----------
+    # -------- Posicionadas (MT5 com fallback no provider) + POSICIONADO (CUSTO - VALOR_ATUAL) ----------
     posicionadas_valor_atual = Decimal("0")
     posicionadas_custo = Decimal("0")
     abertos = operacoes.filter(data_venda__isnull=True)
@@ -1329,19 +1281,12 @@ def carteira_resumo(request, cliente_id):
             if preco is not None:
                 cotacoes[f"{base}.SA"] = float(preco)
 
-    # fallback yfinance
-    tickers = [f"{b}.SA" for b in bases]
-    faltando = [t for t in tickers if t not in cotacoes]
+    # fallback no provider (via cache compartilhado de dados de mercado)
+    faltando = [b for b in bases if f"{b}.SA" not in cotacoes]
     if faltando:
         try:
-            data = yf.download(tickers=faltando, period="1d", interval="1m", progress=False)
-            if len(faltando) == 1:
-                ultimo_close = data["Close"].dropna().iloc[-1]
-                cotacoes[faltando[0]] = float(ultimo_close)
-            else:
-                for t in faltando:
-                    ultimo_close = (data["Close"][t] if hasattr(data["Close"], "__getitem__") else data["Close"]).dropna().iloc[-1]
-                    cotacoes[t] = float(ultimo_close)
+            for base, preco in get_last_prices(faltando).items():
+                cotacoes[f"{base}.SA"] = float(preco)
         except Exception:
             pass
 
@@ -1423,7 +1368,7 @@ def carteira_detalhe(request, cliente_id):
     operacoes = OperacaoCarteira.objects.filter(cliente=cliente)
 
     # ======================
-    # 1. Buscar últimas cotações via MT5 (fallback yfinance)
+    # 1. Buscar últimas cotações via MT5 (fallback no provider)
     # ======================
     abertos = operacoes.filter(data_venda__isnull=True)
     bases = list({(op.acao.ticker or '').strip().upper() for op in abertos if op.acao and op.acao.ticker})
@@ -1434,19 +1379,12 @@ def carteira_detalhe(request, cliente_id):
             preco = _mt5_preco_atual(ip_cli, base)
             if preco is not None:
                 cotacoes[f"{base}.SA"] = float(preco)
-    # fallback yfinance
-    tickers = [f"{b}.SA" for b in bases]
-    faltando = [t for t in tickers if t not in cotacoes]
+    # fallback no provider (via cache compartilhado de dados de mercado)
+    faltando = [b for b in bases if f"{b}.SA" not in cotacoes]
     if faltando:
         try:
-            data = yf.download(tickers=faltando, period="1d", interval="1m", progress=False)
-            if len(faltando) == 1:
-                ultimo = data["Close"].dropna().iloc[-1]
-                cotacoes[faltando[0]] = float(ultimo)
-            else:
-                for t in faltando:
-                    ultimo = (data["Close"][t] if hasattr(data["Close"], "__getitem__") else data["Close"]).dropna().iloc[-1]
-                    cotacoes[t] = float(ultimo)
+            for base, preco in get_last_prices(faltando).items():
+                cotacoes[f"{base}.SA"] = float(preco)
         except Exception:
             pass
 
@@ -1529,7 +1467,7 @@ def patrimonio_disponivel(request):
     """
     Consolida por cliente os mesmos cálculos do `carteira_resumo`:
       - patrimonio_total  (tabela Patrimonio, último registro do cliente)
-      - posicionadas_valor_atual (a mercado, via yfinance)
+      - posicionadas_valor_atual (a mercado, via provider de dados de mercado)
       - valor_disponivel = (patrimonio_total * percentual/100) - posicionadas_valor_atual
       - total_consolidado = posicionadas_valor_atual + valor_disponivel
     Retorna: codigo, nome, patrimonio, total_consolidado, valor_disponivel
@@ -1561,33 +1499,24 @@ def patrimonio_disponivel(request):
 
         percentual = _to_decimal(getattr(cliente, "percentual_patrimonio", 0))
 
-        # -------- Posicionadas (a mercado via yfinance) ----------
+        # -------- Posicionadas (a mercado via provider) ----------
         posicionadas_valor_atual = Decimal("0")
         posicionadas_custo = Decimal("0")
 
         abertos = OperacaoCarteira.objects.filter(cliente=cliente, data_venda__isnull=True)
 
         # tickers únicos
-        tickers = list({f"{op.acao.ticker}.SA" for op in abertos if getattr(op.acao, "ticker", None)})
+        bases = list({(op.acao.ticker or "").strip().upper() for op in abertos if getattr(op.acao, "ticker", None)})
 
         cotacoes = {}
-        if tickers:
+        if bases:
             try:
-                # usar 1m pra aproximar “a mercado” (igual ao carteira_resumo)
-                data = yf.download(tickers=tickers, period="1d", interval="1m", progress=False)
-
-                if len(tickers) == 1:
-                    # quando é 1 ticker, yfinance devolve Series
-                    ultimo_close = data["Close"].dropna().iloc[-1]
-                    cotacoes[tickers[0]] = float(ultimo_close)
-                else:
-                    # quando são vários, vem DataFrame multi-coluna
-                    for t in tickers:
-                        serie = data["Close"][t] if isinstance(data["Close"], pd.DataFrame) else data["Close"]
-                        ultimo_close = serie.dropna().iloc[-1]
-                        cotacoes[t] = float(ultimo_close)
+                # último preço 1m pra aproximar “a mercado” (igual ao carteira_resumo);
+                # o cache evita baixar de novo os tickers repetidos entre clientes
+                for base, preco in get_last_prices(bases).items():
+                    cotacoes[f"{base}.SA"] = float(preco)
             except Exception as e:
-                print("Erro yfinance:", e)
+                print("Erro ao buscar cotações:", e)
 
         # acumula valores a mercado e custo
         for op in abertos:
@@ -1804,7 +1733,7 @@ def _get_cliente_ip(cliente: Cliente) -> str | None:
 
 
 def _cotacoes_cliente(cliente: Cliente, tickers_base: list[str]) -> tuple[dict[str, float], dict[str, str]]:
-    """Retorna cotação atual por ticker base usando MT5 com fallback em yfinance."""
+    """Retorna cotação atual por ticker base usando MT5 com fallback no provider configurado."""
     cotacoes: dict[str, float] = {}
     origens: dict[str, str] = {}
 
@@ -1826,29 +1755,16 @@ def _cotacoes_cliente(cliente: Cliente, tickers_base: list[str]) -> tuple[dict[s
     if not faltando:
         return cotacoes, origens
 
-    tickers_sa = [f"{base}.SA" for base in faltando]
     try:
-        data = yf.download(tickers=tickers_sa, period="1d", interval="1m", progress=False)
-        if isinstance(data, pd.DataFrame) and not data.empty:
-            close = data["Close"]
-            if isinstance(close, pd.Series):
-                serie = close.dropna()
-                if not serie.empty:
-                    base = faltando[0]
-                    cotacoes[base] = float(serie.iloc[-1])
-                    origens[base] = "yfinance"
-            elif isinstance(close, pd.DataFrame):
-                for base in faltando:
-                    try:
-                        serie = close[f"{base}.SA"].dropna()
-                    except Exception:
-                        continue
-                    if serie.empty:
-                        continue
-                    cotacoes[base] = float(serie.iloc[-1])
-                    origens[base] = "yfinance"
+        precos = get_last_prices(faltando)
     except Exception:
-        pass
+        precos = {}
+    for base in faltando:
+        preco = _finite_float(precos.get(base.strip().upper()))
+        if preco is None:
+            continue
+        cotacoes[base] = preco
+        origens[base] = get_provider().nome
 
     return cotacoes, origens
 
@@ -0,0 +1,47 @@
+-- EstadoJanelaAcao: snapshot por ação da janela móvel usada no scoring
+-- (gravado pelo A02CalculaMedias, lido pelo A03 intraday e pelo
+-- gerar_sinais_direcionais).
+--
+-- A tabela não é gerenciada pelo Django (managed = False), como as demais
+-- cotacoes_*: rode este script no MySQL ANTES de publicar o código que usa o
+-- modelo. O A02 grava o snapshot fora da transação dos indicadores, então sem
+-- a tabela os indicadores continuam sendo atualizados (só o snapshot falha).
+--
+-- Idempotente: cria a tabela se ela não existir e adiciona retorno_medio_ate
+-- em tabelas criadas antes dessa coluna.
+--
+--   mysql -h <host> -u <usuario> -p <banco> < sql/2026-10-18_cotacoes_estado_janela.sql
+
+CREATE TABLE IF NOT EXISTS cotacoes_estado_janela (
+    acao_id BIGINT NOT NULL,
+    data DATE NOT NULL,
+    rsi_4m DECIMAL(6, 2) NULL,
+    max_4m DECIMAL(10, 2) NULL,
+    min_4m DECIMAL(10, 2) NULL,
+    obv_5d DECIMAL(20, 2) NULL,
+    dias_equivalentes_selic INT NULL,
+    retorno_medio_selic_ativo DECIMAL(10, 6) NULL,
+    retorno_medio_ate DATE NULL,
+    janela_json LONGTEXT NOT NULL,
+    atualizado_em DATETIME(6) NOT NULL,
+    PRIMARY KEY (acao_id),
+    KEY cotacoes_estado_janela_data_idx (data)
+);
+
+SET @existe := (
+    SELECT COUNT(*)
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = 'cotacoes_estado_janela'
+      AND COLUMN_NAME = 'retorno_medio_ate'
+);
+
+SET @ddl := IF(
+    @existe = 0,
+    'ALTER TABLE cotacoes_estado_janela ADD COLUMN retorno_medio_ate DATE NULL AFTER retorno_medio_selic_ativo',
+    'SELECT ''retorno_medio_ate já existe'''
+);
+
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,29 @@
+-- RecomendacaoDiaria.verificado_ate: último pregão já conferido pelo
+-- A03VerificaAlvos (marca d'água da verificação).
+--
+-- A tabela cotacoes_recomendacaodiaria não é gerenciada pelo Django
+-- (managed = False), então a coluna não vem por migração: rode este script
+-- no MySQL ANTES de publicar o código que traz o campo. Sem a coluna, toda
+-- consulta ORM em RecomendacaoDiaria falha (SELECT e INSERT listam o campo).
+--
+-- Idempotente: só adiciona a coluna se ela ainda não existir.
+--
+--   mysql -h <host> -u <usuario> -p <banco> < sql/2026-10-18_recomendacaodiaria_verificado_ate.sql
+
+SET @existe := (
+    SELECT COUNT(*)
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = 'cotacoes_recomendacaodiaria'
+      AND COLUMN_NAME = 'verificado_ate'
+);
+
+SET @ddl := IF(
+    @existe = 0,
+    'ALTER TABLE cotacoes_recomendacaodiaria ADD COLUMN verificado_ate DATE NULL',
+    'SELECT ''verificado_ate já existe'''
+);
+
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;